@@ -0,0 +1,259 @@
+"""Stamps, wall time and state bytes written per call of the contracts' exports, at growing
+state sizes.
+
+Run from the repository root:
+
+    python3 -m benchmarks.exports
+    python3 -m benchmarks.exports --output results.json
+    python3 -m benchmarks.exports --baseline benchmarks/baseline.json
+
+For every size, the contracts are deployed into a fresh in-memory client that already holds
+that many token and currency holders (with approvals) and Ethereum addresses with nonces.
+Each export is then called --calls times, every call for a different holder, and committed
+like a transaction in a block. Bytes written are the sizes of the keys and encoded values a
+call writes, the same measure contracting charges stamps for.
+
+With --baseline, the results are compared to an earlier --output. It fails if stamps or
+bytes written per call grew, the two numbers that do not depend on the machine.
+
+Stamps depend on the contracting version and its tracer, so --output records both and
+--baseline refuses to compare against results of another. contracting's compiled tracer
+charges for every instruction a call executes. Where the C extension is replaced by a Python
+tracer, only reads and writes are charged, and stamps leave out the computation.
+"""
+import argparse
+import gc
+import importlib.metadata
+import json
+import sys
+import time
+
+from contracting.client import ContractingClient
+from contracting.db.encoder import encode
+
+from old.wrapped_tokens.drivers import MemoryContractDriver
+from tests.util import submit_cached, submit_compiled
+
+ROUTER_NAME = "con_clearing_house_62"
+TOKEN_NAME = "token1"
+BRIDGE_NAME = "lamden_bridge"
+OPERATOR = "sys"
+
+ETH_TOKEN = "0x1111111111111111111111111111111111111111"
+
+# Plenty for any number of calls, also as currency to pay the stamps with
+BALANCE = 10 ** 9
+
+SIZES = [1, 1000, 100000]
+
+
+def holder(i):
+    return f"{i:064x}"
+
+
+def ethAddress(i):
+    return f"0x{i:040x}"
+
+
+def newKey(n, length):
+    # Hex of length digits that is never a holder or Ethereum address of the state
+    return "f" + f"{n:x}".zfill(length - 1)
+
+
+def deploy(size):
+    """Returns a client with the contracts deployed and size holders and nonces in its state.
+    """
+    client = ContractingClient(driver=MemoryContractDriver())
+
+    with open("tests/contracts/currency.py") as f:
+        submit_compiled(client, "currency", f.read(), args={"vk": OPERATOR})
+
+    with open("lamden/router.py") as f:
+        submit_cached(client, f.read(), name=ROUTER_NAME, signer=OPERATOR)
+
+    with open("lamden/token.py") as f:
+        submit_cached(client, f.read(), name=TOKEN_NAME)
+
+    with open("lamden/lamden_bridge.py") as f:
+        submit_cached(client, f.read(), name=BRIDGE_NAME, signer=OPERATOR,
+            constructor_args={"contract_address": ETH_TOKEN, "decimals": 18})
+
+    client.raw_driver.commit()
+    execute(client, OPERATOR, ROUTER_NAME, "add_token", ethereum_contract=ETH_TOKEN,
+        lamden_contract=TOKEN_NAME, decimals=18)
+
+    def state():
+        yield f"currency.balances:{OPERATOR}", BALANCE
+        yield f"currency.balances:{ROUTER_NAME}", BALANCE
+        for i in range(size):
+            yield f"{TOKEN_NAME}.balances:{holder(i)}", BALANCE
+            yield f"{TOKEN_NAME}.balances:{holder(i)}:{ROUTER_NAME}", BALANCE
+            yield f"currency.balances:{holder(i)}", BALANCE
+            yield f"currency.balances:{holder(i)}:{BRIDGE_NAME}", BALANCE
+            yield f"{ROUTER_NAME}.nonces:{ethAddress(i)}", i
+            yield f"{BRIDGE_NAME}.nonces:{ethAddress(i)}", i
+
+    # Written to the storage directly, the contracts only ever read them
+    client.raw_driver.driver.load(state())
+    client.raw_driver.clear_pending_state()
+
+    return client
+
+
+def execute(client, sender, contract, function, **kwargs):
+    """Calls a function like a transaction in a block and returns (stamps, seconds, bytes
+    written).
+    """
+    start = time.perf_counter()
+    output = client.executor.execute(sender=sender, contract_name=contract,
+        function_name=function, kwargs=kwargs, metering=True, auto_commit=False)
+    seconds = time.perf_counter() - start
+
+    if output["status_code"] != 0:
+        client.raw_driver.clear_pending_state()
+        raise output["result"]
+
+    # Only the writes of this call are pending, the ones before it are committed
+    written = sum(len(k) + len(encode(v)) for k, v in output["writes"].items())
+    client.raw_driver.commit()
+
+    return output["stamps_used"], seconds, written
+
+
+# (sender, contract, function, kwargs) of call number n, which is for holder i. Keys a call
+# adds are derived from n, so every call adds a new one.
+EXPORTS = {
+    "router.mint": lambda i, n: (OPERATOR, ROUTER_NAME, "mint", {
+        "ethereum_contract": ETH_TOKEN, "amount": hex(10 ** 18), "lamden_wallet": holder(i),
+        "event_id": f"0x{newKey(n, 64)}:0"}),
+    "router.burn": lambda i, n: (OPERATOR, ROUTER_NAME, "burn", {
+        "ethereum_contract": ETH_TOKEN, "ethereum_address": ethAddress(i),
+        "lamden_address": holder(i), "amount": 1}),
+    "router.add_token": lambda i, n: (OPERATOR, ROUTER_NAME, "add_token", {
+        "ethereum_contract": "0x" + newKey(n, 40), "lamden_contract": TOKEN_NAME, "decimals": 18}),
+    "lamden_bridge.deposit": lambda i, n: (holder(i), BRIDGE_NAME, "deposit", {
+        "amount": 1, "ethereum_address": ethAddress(i)}),
+    "lamden_bridge.post_proof": lambda i, n: (OPERATOR, BRIDGE_NAME, "post_proof", {
+        "hashed_abi": newKey(n, 64), "signed_abi": "0x" + "1" * 130}),
+    "token.transfer_from": lambda i, n: (ROUTER_NAME, TOKEN_NAME, "transfer_from", {
+        "amount": 1, "to": ROUTER_NAME, "main_account": holder(i)}),
+}
+
+
+def environment():
+    """Returns the contracting version and the kind of tracer the calls are metered with.
+    """
+    from contracting.execution.metering import tracer
+
+    try:
+        version = importlib.metadata.version("contracting")
+    except importlib.metadata.PackageNotFoundError:
+        version = None
+
+    return {"contracting": version, "tracer": "python" if tracer.__file__.endswith(".py") else "compiled"}
+
+
+def measure(size, calls):
+    """Returns {export: {stamps, seconds, bytes_written}}, each averaged over calls.
+    """
+    client = deploy(size)
+
+    # Otherwise garbage collections going through the whole state land in random calls
+    gc.collect()
+    gc.freeze()
+
+    # Calls are spread over the holders, so at larger sizes they read keys all over the state
+    step = max(size // calls, 1)
+
+    results = {}
+    for name, call in EXPORTS.items():
+        totals = [0, 0, 0]
+        for n in range(calls):
+            sender, contract, function, kwargs = call((n * step) % size, n)
+            for t, value in enumerate(execute(client, sender, contract, function, **kwargs)):
+                totals[t] += value
+
+        results[name] = {"stamps": totals[0] / calls, "seconds": totals[1] / calls,
+            "bytes_written": totals[2] / calls}
+
+    gc.unfreeze()
+    return results
+
+
+def compare(results, baseline):
+    """Prints the change of each number against the baseline and returns whether stamps and
+    bytes written stayed the same or dropped.
+    """
+    ok = True
+
+    print(f"\n{'against baseline':<28}{'size':>8}{'stamps':>12}{'seconds':>12}{'bytes':>12}")
+    for name, sizes in results.items():
+        for size, current in sizes.items():
+            before = baseline.get(name, {}).get(size)
+            if before is None:
+                continue
+
+            deltas = []
+            for key in ("stamps", "seconds", "bytes_written"):
+                change = current[key] - before[key]
+                deltas.append(f"{change / before[key]:+.1%}" if before[key] else f"{change:+}")
+
+            if current["stamps"] > before["stamps"] or current["bytes_written"] > before["bytes_written"]:
+                ok = False
+
+            print(f"{name:<28}{size:>8}{deltas[0]:>12}{deltas[1]:>12}{deltas[2]:>12}")
+
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES,
+        help="numbers of holders and nonces in the state (default: 1 1000 100000)")
+    parser.add_argument("--calls", type=int, default=10,
+        help="number of calls to average over (default: 10)")
+    parser.add_argument("--output", metavar="FILE", help="write the results as JSON to FILE")
+    parser.add_argument("--baseline", metavar="FILE",
+        help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    env = environment()
+    print(f"contracting {env['contracting']}, {env['tracer']} tracer")
+    if env["tracer"] != "compiled":
+        print("The Python tracer only charges reads and writes, stamps leave out the computation")
+
+    # {export: {size: numbers}}, sizes as strings like they are in JSON
+    results = {name: {} for name in EXPORTS}
+    for size in args.sizes:
+        for name, numbers in measure(size, args.calls).items():
+            results[name][str(size)] = numbers
+
+    print(f"{'':<28}{'size':>8}{'stamps':>12}{'ms':>12}{'bytes':>12}")
+    for name, sizes in results.items():
+        for size, numbers in sizes.items():
+            print(f"{name:<28}{size:>8}{numbers['stamps']:>12.1f}"
+                f"{numbers['seconds'] * 1000:>12.3f}{numbers['bytes_written']:>12.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"calls": args.calls, "environment": env, "results": results}, f,
+                indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("environment") != env:
+            print(f"The baseline was measured with {baseline.get('environment')}, not {env}, so its "
+                "stamps cannot be compared. Store new results with --output first.")
+            sys.exit(1)
+        if baseline["calls"] != args.calls:
+            print(f"The baseline averages over {baseline['calls']} calls, not {args.calls}")
+            sys.exit(1)
+        if not compare(results, baseline["results"]):
+            print("Stamps or bytes written grew against the baseline")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Stamps used by the router's mint and burn.
+
+Run from the repository root:
+
+    python3 -m benchmarks.stamps
+    python3 -m benchmarks.stamps --against HEAD~1
+
+With --against, the router of the given git revision is measured as well and the
+saving per call is printed next to it.
+
+Every revision is measured in a new process: contracting keeps an imported contract
+module under its name for as long as the process runs, and client.flush() does not
+drop it, so a second router deployed under ROUTER_NAME would run the first one's code.
+
+Only contracting's compiled tracer charges for the instructions a call executes. With a
+Python tracer in its place only reads and writes are charged, so savings in computation,
+such as a skipped interface check, do not show and no saving of that kind can be read
+from the numbers.
+"""
+import argparse
+import ast
+import multiprocessing
+import subprocess
+
+from contracting.client import ContractingClient
+from contracting.stdlib.bridge import decimal
+
+from benchmarks.exports import environment
+
+client = ContractingClient()
+
+ROUTER_NAME = "con_clearing_house_62"
+ETH_TOKEN = "0x1111111111111111111111111111111111111111"
+ETH_ADDRESS = "0x2222222222222222222222222222222222222222"
+
+
+def load_router(revision=None):
+    if revision is None:
+        with open("lamden/router.py") as f:
+            return f.read()
+
+    result = subprocess.run(["git", "show", f"{revision}:lamden/router.py"],
+        check=True, capture_output=True, text=True)
+    return result.stdout
+
+
+def deploy(router_code):
+    client.flush()
+
+    client.submit(router_code, name=ROUTER_NAME)
+    router = client.get_contract(ROUTER_NAME)
+
+    with open("lamden/token.py") as f:
+        client.submit(f.read(), name="token1")
+        token = client.get_contract("token1")
+
+    router.add_token(ethereum_contract=ETH_TOKEN, lamden_contract="token1", decimals=18)
+
+    token.quick_write(variable="balances", key="user", value=decimal.ContractingDecimal(1000000))
+    token.approve(signer="user", amount=1000000, to=ROUTER_NAME)
+
+    # Metered calls are paid for from the signer's currency balance
+    client.set_var(contract="currency", variable="balances", arguments=[client.signer],
+        value=1000000)
+
+
+def stamps_used(function, **kwargs):
+    output = client.executor.execute(sender=client.signer, contract_name=ROUTER_NAME,
+        function_name=function, kwargs=kwargs, metering=True)
+    if output["status_code"] != 0:
+        raise output["result"]
+    return output["stamps_used"]
+
+
+def mint_kwargs(router_code, i):
+    """Arguments of mint number i. Routers before the deduplication of deposits take no
+    event_id, every other mint needs a new one.
+    """
+    kwargs = {"ethereum_contract": ETH_TOKEN, "amount": "0x10", "lamden_wallet": "user"}
+
+    for node in ast.parse(router_code).body:
+        if isinstance(node, ast.FunctionDef) and node.name == "mint":
+            if "event_id" in [arg.arg for arg in node.args.args]:
+                kwargs["event_id"] = f"0x{i:064x}:0"
+
+    return kwargs
+
+
+def measure(router_code, calls):
+    """Returns the average stamps used per mint and per burn over a number of calls.
+    """
+    deploy(router_code)
+
+    mint = sum(stamps_used("mint", **mint_kwargs(router_code, i)) for i in range(calls))
+    burn = sum(stamps_used("burn", ethereum_contract=ETH_TOKEN, ethereum_address=ETH_ADDRESS,
+        lamden_address="user", amount=1) for _ in range(calls))
+
+    client.flush()
+    return {"mint": mint / calls, "burn": burn / calls}
+
+
+def measure_in_new_process(router_code, calls):
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(measure, (router_code, calls))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--against", metavar="REVISION",
+        help="git revision of lamden/router.py to compare against")
+    parser.add_argument("--calls", type=int, default=10,
+        help="number of calls to average over (default: 10)")
+    args = parser.parse_args()
+
+    env = environment()
+    print(f"contracting {env['contracting']}, {env['tracer']} tracer")
+    if env["tracer"] != "compiled":
+        print("The Python tracer only charges reads and writes, stamps leave out the computation")
+
+    current = measure_in_new_process(load_router(), args.calls)
+    print(f"{'':<24}{'mint':>10}{'burn':>10}")
+    print(f"{'working tree':<24}{current['mint']:>10.1f}{current['burn']:>10.1f}")
+
+    if args.against:
+        baseline = measure_in_new_process(load_router(args.against), args.calls)
+        print(f"{args.against:<24}{baseline['mint']:>10.1f}{baseline['burn']:>10.1f}")
+        print(f"{'saving per call':<24}{baseline['mint'] - current['mint']:>10.1f}"
+            f"{baseline['burn'] - current['burn']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
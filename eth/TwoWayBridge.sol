@@ -208,6 +208,10 @@ contract ClearingHouse is Ownable {
     mapping(address => bool) supportedTokens;
     mapping(address => uint256) nonces;
 
+    // Burn hashes that have already been withdrawn. One signed root covers a whole epoch
+    // of burns, so the signature alone no longer prevents a burn from being claimed twice.
+    mapping(bytes32 => bool) withdrawn;
+
     ControlledToken controlledToken = ControlledToken(0x0);
 
     // Double mapping as token address -> owner -> balance
@@ -240,13 +244,36 @@ contract ClearingHouse is Ownable {
                 );
     }
 
-    function withdraw(address token, uint256 amount, uint256 nonce, uint8 v, bytes32 r, bytes32 s) public {
+    // Folds a Merkle inclusion path into the root of the epoch the burn belongs to.
+    // Pairs are hashed in sorted order, so the path does not need left/right flags.
+    // An empty path proves a burn that was signed on its own: the root is the leaf.
+    function computeRoot(bytes32 leaf, bytes32[] memory proof) public pure returns (bytes32) {
+        bytes32 computed = leaf;
+
+        for (uint256 i = 0; i < proof.length; i++) {
+            bytes32 sibling = proof[i];
+
+            if (computed <= sibling) {
+                computed = keccak256(abi.encodePacked(computed, sibling));
+            } else {
+                computed = keccak256(abi.encodePacked(sibling, computed));
+            }
+        }
+
+        return computed;
+    }
+
+    function withdraw(address token, uint256 amount, uint256 nonce, bytes32[] memory proof, uint8 v, bytes32 r, bytes32 s) public {
             bytes memory encoded = encode(token, amount, nonce, msg.sender);
-            bytes32 hashed = hash(encoded);
-            hashed = hashEthMsg(hashed);
+            bytes32 leaf = hash(encoded);
+            require(!withdrawn[leaf], 'Already withdrawn!');
+
+            bytes32 hashed = hashEthMsg(computeRoot(leaf, proof));
             address recoveredAddress = ecrecover(hashed, v, r, s);
             require(recoveredAddress != address(0) && recoveredAddress == owner(), 'Invalid Signature!');
             require(token == address(token));
+
+            withdrawn[leaf] = true;
             token.mint(msg.sender, amount);
     }
 }
@@ -3,6 +3,11 @@ import currency
 nonces = Hash(default_value=0)
 proofs = Hash()
 
+# Every deposit ABI is appended to queue under the next sequence number, so the operator can
+# fetch all deposits after the last sequence number it processed.
+queue = Hash()
+sequence = Variable()
+
 owner = Variable()
 token_address = Variable()
 token_decimals = Variable()
@@ -48,6 +53,7 @@ def seed(contract_address='0x0', decimals=18):
     owner.set(ctx.caller)
     token_address.set(contract_address)
     token_decimals.set(decimals)
+    sequence.set(0)
 
 
 @export
@@ -63,6 +69,10 @@ def deposit(amount: float, ethereum_address: str):
 
     abi = packed_token + packed_amount + packed_nonce + packed_address
 
+    deposit_sequence = sequence.get() + 1
+    queue[deposit_sequence] = abi
+    sequence.set(deposit_sequence)
+
     abi_hash = hashlib.sha3(abi)
     return abi_hash
 
@@ -79,3 +89,13 @@ def withdraw(amount: float, to: str):
 def post_proof(hashed_abi: str, signed_abi: str):
     assert ctx.caller == owner.get(), 'Only owner can call!'
     proofs[hashed_abi] = signed_abi
+
+
+# Stores a list of (hashed_abi, signed_abi) pairs in one transaction.
+@export
+def post_proofs(pairs: list):
+    assert ctx.caller == owner.get(), 'Only owner can call!'
+
+    for pair in pairs:
+        hashed_abi, signed_abi = pair
+        proofs[hashed_abi] = signed_abi
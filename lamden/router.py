@@ -18,12 +18,32 @@ nonces = Hash(default_value=0)
 owner = Variable()
 proofs = Hash()
 
+# Ethereum deposits that were minted, by transaction hash and log index of their
+# TokensWrapped event. A deposit is never minted twice, even if the operator sends its
+# mint again because the result of the first transaction got lost.
+minted = Hash(default_value=False)
+
+# Every burn ABI is appended to queue under the next sequence number, so the operator can
+# fetch all burns after the last sequence number it processed.
+queue = Hash()
+sequence = Variable()
+
+# Burns are grouped into epochs of consecutive sequence numbers, starting at epoch_starts.
+# The operator seals the open epoch, signs the Merkle root over its burns once and posts it
+# with post_root.
+epoch = Variable()
+epoch_starts = Hash()
+epoch_roots = Hash()
+
 log = Variable()
 
 
 @construct
 def seed():
     owner.set(ctx.caller)
+    sequence.set(0)
+    epoch.set(0)
+    epoch_starts[0] = 1
 
 
 def left_pad(s: str):
@@ -37,13 +57,22 @@ def left_pad(s: str):
 
 
 def unpack_uint256(uint: str, decimals: int):
+    return unpack_scaled(uint, 10 ** decimals)
+
+
+# scale is the precomputed 10 ** decimals of a token record
+def unpack_scaled(uint: str, scale: int):
     i = int(uint, 16)
-    reduced_i = i / (10 ** decimals)
+    reduced_i = i / scale
     return reduced_i
 
 
 def pack_amount(amount: float, decimals: int):
-    i = int(amount * (10 ** decimals))
+    return pack_scaled(amount, 10 ** decimals)
+
+
+def pack_scaled(amount: float, scale: int):
+    i = int(amount * scale)
     h = hex(i)[2:]
     return left_pad(h)
 
@@ -65,41 +94,76 @@ def pack_int(i: int):
     return left_pad(h)
 
 
+# event_id is "transaction hash:log index", hash keys cannot hold the colon
+def claim_deposit(event_id: str):
+    deposit = event_id.split(':')
+    assert len(deposit) == 2, 'Invalid event id!'
+
+    tx_hash, log_index = deposit
+    assert not minted[tx_hash, log_index], f'Deposit {event_id} already minted!'
+    minted[tx_hash, log_index] = True
+
+
 @export
-def mint(ethereum_contract: str, amount: str, lamden_wallet: str):
+def mint(ethereum_contract: str, amount: str, lamden_wallet: str, event_id: str):
     assert ctx.caller == owner.get(), f'Only owner can call! Current caller is {ctx.caller}, owner should be {owner.get()}'
-    assert supported_tokens[ethereum_contract] is not None, 'Invalid Ethereum Token!'
 
-    decimals = supported_tokens[ethereum_contract, 'decimals']
+    claim_deposit(event_id)
 
-    # should be moved into add_token (see comment at add_token 2.)
-    assert decimals is not None, 'Unexpected decimal error'
+    token_record = supported_tokens[ethereum_contract]
+    assert token_record is not None, 'Invalid Ethereum Token!'
 
-    unpacked_amount = unpack_uint256(amount, decimals)
+    unpacked_amount = unpack_scaled(amount, token_record['scale'])
 
-    token = I.import_module(supported_tokens[ethereum_contract])
-
-    # Unnecessary assertion, can never throw because add_token already checks this
-    assert I.enforce_interface(token, token_interface), 'Invalid token interface!'
+    # The interface was enforced when the token was added
+    token = I.import_module(token_record['lamden_contract'])
 
     token.mint(amount=unpacked_amount, to=lamden_wallet)
 
 
+# Mints a list of (ethereum_contract, amount, lamden_wallet, event_id) records in one
+# transaction. Token module and scale are resolved once per distinct ethereum_contract.
+@export
+def mint_batch(records: list):
+    assert ctx.caller == owner.get(), f'Only owner can call! Current caller is {ctx.caller}, owner should be {owner.get()}'
+
+    tokens = {}
+
+    for record in records:
+        ethereum_contract, amount, lamden_wallet, event_id = record
+
+        # Also fails for an event id that is in the batch twice
+        claim_deposit(event_id)
+
+        if ethereum_contract not in tokens:
+            token_record = supported_tokens[ethereum_contract]
+            assert token_record is not None, 'Invalid Ethereum Token!'
+
+            token = I.import_module(token_record['lamden_contract'])
+
+            tokens[ethereum_contract] = [token, token_record['scale']]
+
+        token, scale = tokens[ethereum_contract]
+
+        unpacked_amount = unpack_scaled(amount, scale)
+
+        token.mint(amount=unpacked_amount, to=lamden_wallet)
+
 
 # If ethereum_address is invalid, exception gets thrown, but balances are still changed
 @export
 def burn(ethereum_contract: str, ethereum_address: str, lamden_address: str, amount: float):
     assert ctx.caller == owner.get(), 'Only owner can call!'
-    assert supported_tokens[ethereum_contract] is not None, 'Invalid Ethereum Token!'
 
-    token = I.import_module(supported_tokens[ethereum_contract])
+    token_record = supported_tokens[ethereum_contract]
+    assert token_record is not None, 'Invalid Ethereum Token!'
+
+    token = I.import_module(token_record['lamden_contract'])
 
-    assert I.enforce_interface(token, token_interface), 'Invalid token interface!'
-    
     token.transfer_from(amount=amount, to=ctx.this, main_account=lamden_address)
 
     packed_token = pack_eth_address(ethereum_contract)
-    packed_amount = pack_amount(amount, supported_tokens[ethereum_contract, 'decimals'])
+    packed_amount = pack_scaled(amount, token_record['scale'])
     packed_nonce = pack_int(nonces[ethereum_address] + 1)
     packed_address = pack_eth_address(ethereum_address)
 
@@ -110,17 +174,22 @@ def burn(ethereum_contract: str, ethereum_address: str, lamden_address: str, amo
     # abi = ethereum_contract + str(packed_amount) + str(nonces[ethereum_address]) + ethereum_address
     # hash1 = hashlib.sha3(abi)
 
+    burn_sequence = sequence.get() + 1
+    queue[burn_sequence] = abi
+    sequence.set(burn_sequence)
+
     return abi
 
 # 1. It is possible to add multiple ethereum_contracts to the same lamden_contract
-# 2. It is possible to leave decimals as None, which does not throw Exceptions at first. But when
-#    trying to mint (or burn), an Exception will be thrown. Then it will not be possible anymore 
-#    to overwrite decimals or to call add_token with the same ethereum address anymore.
-# 3. It is possible to add impossible ethereum_contract address (unlike pack_eth_address)
+# 2. It is possible to add impossible ethereum_contract address (unlike pack_eth_address)
+#
+# The token record is validated here once, so mint and burn only need a single read of it.
 @export
 def add_token(ethereum_contract: str, lamden_contract: str, decimals: int):
     assert supported_tokens[ethereum_contract] is None, 'Token already supported'
     assert ctx.caller == owner.get(), 'Only owner can call!'
+    # bool is a subclass of int, and a negative value would make scale a float
+    assert isinstance(decimals, int) and not isinstance(decimals, bool) and decimals >= 0, 'Invalid decimals!'
 
     token = I.import_module(lamden_contract)
 
@@ -130,10 +199,50 @@ def add_token(ethereum_contract: str, lamden_contract: str, decimals: int):
 
     # assert sniffer.get() == owner.get(), 'Token owner must be the clearinghouse owner.'
 
-    supported_tokens[ethereum_contract] = lamden_contract
-    supported_tokens[ethereum_contract, 'decimals'] = decimals
+    supported_tokens[ethereum_contract] = {
+        'lamden_contract': lamden_contract,
+        'decimals': decimals,
+        'scale': 10 ** decimals
+    }
 
 @export
 def post_proof(hashed_abi: str, signed_abi: str):
     assert ctx.caller == owner.get(), 'Only owner can call!'
     proofs[hashed_abi] = signed_abi
+
+
+# Stores a list of (hashed_abi, signed_abi) pairs in one transaction.
+@export
+def post_proofs(pairs: list):
+    assert ctx.caller == owner.get(), 'Only owner can call!'
+
+    for pair in pairs:
+        hashed_abi, signed_abi = pair
+        proofs[hashed_abi] = signed_abi
+
+
+# Closes the open epoch so its set of burns can no longer change, and returns its number.
+@export
+def seal_epoch():
+    assert ctx.caller == owner.get(), 'Only owner can call!'
+
+    sealed = epoch.get()
+    last_sequence = sequence.get()
+    assert last_sequence >= epoch_starts[sealed], 'Epoch has no burns!'
+
+    epoch_starts[sealed + 1] = last_sequence + 1
+    epoch.set(sealed + 1)
+    return sealed
+
+
+# root is the Merkle root over the keccak256 hashes of the epoch's burns, signed_root the
+# operator's signature of it. Each burn is withdrawn with its inclusion path to the root.
+@export
+def post_root(epoch_number: int, root: str, signed_root: str):
+    assert ctx.caller == owner.get(), 'Only owner can call!'
+    assert epoch_number < epoch.get(), 'Epoch is not sealed!'
+    assert epoch_starts[epoch_number] is not None, 'Unknown epoch!'
+    assert epoch_roots[epoch_number] is None, 'Root already posted!'
+
+    epoch_roots[epoch_number] = root
+    proofs[root] = signed_root
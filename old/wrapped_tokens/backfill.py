@@ -0,0 +1,128 @@
+import asyncio
+
+from hexbytes import HexBytes
+from web3 import Web3
+
+# Catches up on TokensWrapped events that were emitted while the operator was down.
+#
+# The block range since the last checkpoint is split into chunks that are fetched with
+# eth_getLogs, a few at a time. A chunk that fails (usually because the node refuses to
+# return that many logs) is split in half and fetched again, and chunks that succeed let
+# the next ones grow. Events are handed over strictly in block order, and the checkpoint
+# is only moved past a chunk once all chunks before it have been handled.
+#
+# checkpoint is a state.ChainCheckpoint. The events of a chunk and the checkpoint after it
+# are committed in one batch, so handlers should only record work in the state store.
+
+
+def normalize_log(log):
+    """Converts a log as JSON-RPC sends it (hex strings only), from eth_getLogs or
+    eth_subscribe, into the types web3 returns itself, so it can be decoded with processLog.
+    """
+    return {
+        'address': Web3.toChecksumAddress(log['address']),
+        'topics': [HexBytes(topic) for topic in log['topics']],
+        'data': log['data'],
+        'blockHash': HexBytes(log['blockHash']),
+        'blockNumber': int(log['blockNumber'], 16),
+        'transactionHash': HexBytes(log['transactionHash']),
+        'transactionIndex': int(log['transactionIndex'], 16),
+        'logIndex': int(log['logIndex'], 16),
+    }
+
+
+class Backfill:
+    def __init__(self, upstream, event, log_filter, checkpoint, handler,
+                 chunk_size=2000, min_chunk_size=1, max_chunk_size=10000,
+                 concurrency=4, max_retries=5, retry_delay=1):
+        # sessions.Upstream of the Ethereum RPC
+        self.upstream = upstream
+        self.event = event
+        self.log_filter = log_filter
+        self.checkpoint = checkpoint
+        self.handler = handler
+
+        self.chunk_size = chunk_size
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+    async def fetch(self, from_block, to_block, attempt):
+        if attempt > 0:
+            await asyncio.sleep(self.retry_delay * attempt)
+
+        logs = await self.upstream.rpc('eth_getLogs', [
+            dict(self.log_filter, fromBlock=hex(from_block), toBlock=hex(to_block))])
+        return [self.event.processLog(normalize_log(log)) for log in logs]
+
+    async def latest_block(self):
+        return int(await self.upstream.rpc('eth_blockNumber'), 16)
+
+    def commit(self, events, to_block):
+        with self.checkpoint.batch():
+            for event in sorted(events, key=lambda e: (e['blockNumber'], e['logIndex'])):
+                self.handler(event)
+
+            self.checkpoint.save(to_block)
+
+    async def run(self, to_block=None):
+        """Handles all events after the checkpoint up to to_block (the latest block if not
+        given) and returns the last block that was processed.
+        """
+        if to_block is None:
+            to_block = await self.latest_block()
+
+        next_commit = self.checkpoint.load() + 1
+        next_start = next_commit
+
+        retries = []  # (from_block, to_block, attempt) of chunks that have to be fetched again
+        pending = {}  # task -> (from_block, to_block, attempt)
+        ready = {}  # from_block -> (to_block, events) of chunks waiting for earlier ones
+
+        try:
+            while next_commit <= to_block:
+                while len(pending) < self.concurrency and (retries or next_start <= to_block):
+                    if retries:
+                        chunk = retries.pop(0)
+                    else:
+                        chunk = (next_start, min(next_start + self.chunk_size - 1, to_block), 0)
+                        next_start = chunk[1] + 1
+
+                    pending[asyncio.ensure_future(self.fetch(*chunk))] = chunk
+
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    from_block, chunk_end, attempt = pending.pop(task)
+
+                    try:
+                        events = task.result()
+                    except Exception:
+                        if chunk_end > from_block:
+                            middle = (from_block + chunk_end) // 2
+                            retries += [(from_block, middle, attempt), (middle + 1, chunk_end, attempt)]
+                            self.chunk_size = max(self.min_chunk_size, (chunk_end - from_block + 1) // 2)
+                        elif attempt < self.max_retries:
+                            retries.append((from_block, chunk_end, attempt + 1))
+                        else:
+                            raise
+                        continue
+
+                    ready[from_block] = (chunk_end, events)
+                    self.chunk_size = min(self.max_chunk_size, self.chunk_size * 2)
+
+                # Retried chunks always start before anything that is not fetched yet
+                retries.sort()
+
+                while next_commit in ready:
+                    chunk_end, events = ready.pop(next_commit)
+                    self.commit(events, chunk_end)
+                    next_commit = chunk_end + 1
+        finally:
+            for task in pending:
+                task.cancel()
+
+        return next_commit - 1
@@ -0,0 +1,267 @@
+import asyncio
+import time
+
+from submitter import TransactionReverted
+from tracing import record_stage
+
+# Turns work recorded in the state store into Lamden transactions.
+#
+# A batch is sent once max_batch_size items are pending, or max_latency seconds after
+# the first of them was noticed, whichever comes first. Larger values mean fewer
+# transactions under load, smaller ones mean results arrive on Lamden sooner.
+#
+# Batches are sent without waiting for the previous ones to be confirmed, the submitter
+# decides how many transactions are in flight. Items of a batch that is being sent are
+# left out of the next batches until it succeeded or failed.
+#
+# The stamp limit of a transaction comes from a stamps.StampEstimator if one is given,
+# otherwise every item gets stamps_per_item.
+
+
+class Dispatcher:
+    # Name of the pending items in log messages
+    items = 'items'
+
+    def __init__(self, store, submitter, max_batch_size=20, max_latency=5,
+                 stamps_per_item=65, retry_delay=5, estimator=None):
+        self.store = store
+        self.submitter = submitter
+        self.estimator = estimator
+
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.stamps_per_item = stamps_per_item
+        self.retry_delay = retry_delay
+
+        self.sending = set()
+        self.wakeup = asyncio.Event()
+        self.is_running = False
+
+    def count_pending(self):
+        raise NotImplementedError
+
+    def pending(self, limit):
+        raise NotImplementedError
+
+    def key(self, item):
+        raise NotImplementedError
+
+    async def dispatch(self, items):
+        """Sends one batch and removes it from the pending items once it succeeded.
+        """
+        raise NotImplementedError
+
+    def stamps(self, function, count):
+        if self.estimator is None:
+            return self.stamps_per_item * count
+
+        try:
+            return self.estimator.estimate(function, count)
+        except Exception as e:
+            print(f'Could not estimate stamps for {function} of {count} {self.items}: {e}')
+            return self.stamps_per_item * count
+
+    def notify(self):
+        """Tells the dispatcher that new items were added to the store.
+        """
+        self.wakeup.set()
+
+    async def wait_for_batch(self):
+        await self.wakeup.wait()
+
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self.max_latency
+
+        while self.count_pending() - len(self.sending) < self.max_batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+
+    def next_batch(self):
+        items = self.pending(self.max_batch_size + len(self.sending))
+        return [item for item in items if self.key(item) not in self.sending][:self.max_batch_size]
+
+    async def send_batch(self, items, keys):
+        try:
+            await self.dispatch(items)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f'Could not send {len(items)} {self.items}: {e}')
+            await asyncio.sleep(self.retry_delay)
+        finally:
+            self.sending -= keys
+
+        # Items that failed start the next batch
+        if self.count_pending() > len(self.sending):
+            self.notify()
+
+    async def serve(self):
+        self.is_running = True
+
+        # Items left over from before a restart
+        if self.count_pending() > 0:
+            self.notify()
+
+        while self.is_running:
+            await self.wait_for_batch()
+            self.wakeup.clear()
+
+            items = self.next_batch()
+            if not items:
+                continue
+
+            # Marked before the batch is sent, so the next batch leaves these items out
+            keys = {self.key(item) for item in items}
+            self.sending |= keys
+            asyncio.ensure_future(self.send_batch(items, keys))
+
+            # Anything beyond this batch starts the next one
+            if self.count_pending() > len(self.sending):
+                self.notify()
+
+    def stop(self):
+        self.is_running = False
+        self.notify()
+
+
+class MintDispatcher(Dispatcher):
+    """Mints deposits with router.mint, or router.mint_batch for more than one. The router
+    records the event id of every deposit it minted and refuses to mint it again. A deposit
+    the router refuses even on its own is moved to the store's failed mints.
+    """
+    items = 'mints'
+
+    def count_pending(self):
+        return self.store.count_pending_mints()
+
+    def pending(self, limit):
+        return self.store.pending_mints(limit)
+
+    def key(self, mint):
+        return mint[0]
+
+    async def minted(self, event_id):
+        return bool(await self.submitter.get_variable('minted', tuple(event_id.split(':'))))
+
+    async def mint(self, mints):
+        records = [[ethereum_contract, amount, lamden_wallet, event_id]
+            for event_id, ethereum_contract, amount, lamden_wallet, _ in mints]
+
+        function = 'mint' if len(records) == 1 else 'mint_batch'
+        posted = []
+
+        def on_posted(tx_hash):
+            now = time.time()
+            posted.append((now, tx_hash))
+            for mint in mints:
+                record_stage('mint_submitted', mint[0], mint[4], now,
+                    function=function, batch_size=len(mints), tx_hash=tx_hash)
+
+        if len(records) == 1:
+            ethereum_contract, amount, lamden_wallet, event_id = records[0]
+            await self.submitter.send('mint', {'ethereum_contract': ethereum_contract,
+                'amount': amount, 'lamden_wallet': lamden_wallet, 'event_id': event_id},
+                self.stamps(function, 1), on_posted)
+        else:
+            await self.submitter.send('mint_batch', {'records': records},
+                self.stamps(function, len(records)), on_posted)
+
+        self.store.remove_pending_mints([mint[0] for mint in mints])
+
+        now = time.time()
+        posted_at, tx_hash = posted[-1]
+        for mint in mints:
+            record_stage('mint_confirmed', mint[0], posted_at, now, tx_hash=tx_hash)
+
+    async def dispatch(self, mints):
+        try:
+            await self.mint(mints)
+            return
+        except Exception as e:
+            error = e
+
+        # The result of this or an earlier transaction may have been lost after the
+        # deposits were minted, in which case the router now refuses them. Those that are
+        # minted are done.
+        minted = {mint[0] for mint in mints if await self.minted(mint[0])}
+        self.store.remove_pending_mints(list(minted))
+        mints = [mint for mint in mints if mint[0] not in minted]
+
+        if not mints:
+            return
+        if not isinstance(error, TransactionReverted):
+            raise error
+
+        # The router refused the whole batch because of at least one of its deposits, e.g. of
+        # a token it does not support. The halves are sent on their own until the deposit
+        # that fails alone is found, which is put aside instead of blocking the queue.
+        if len(mints) == 1 and not minted:
+            print(f'Could not mint {mints[0][0]}, moved to failed mints: {error}')
+            self.store.fail_pending_mint(mints[0][0], str(error))
+            return
+
+        errors = []
+        for half in (mints[:len(mints) // 2], mints[len(mints) // 2:]):
+            if not half:
+                continue
+            try:
+                await self.dispatch(half)
+            except Exception as e:
+                errors.append(e)
+
+        if errors:
+            raise errors[0]
+
+
+class ProofDispatcher(Dispatcher):
+    """Posts the signed Merkle roots of epochs with router.post_root, one transaction per
+    epoch. The transactions of a batch are sent at the same time.
+    """
+    items = 'roots'
+
+    def count_pending(self):
+        return self.store.count_unposted_epochs()
+
+    def pending(self, limit):
+        return self.store.unposted_epochs(limit)
+
+    def key(self, epoch):
+        return epoch[0]
+
+    async def post(self, epoch, root, signed_root):
+        try:
+            return await self.submitter.send('post_root', {'epoch_number': epoch, 'root': root,
+                'signed_root': signed_root}, self.stamps('post_root', 1))
+        except Exception:
+            # An earlier attempt may have posted the root without its result arriving, in
+            # which case post_root now fails with 'Root already posted!'
+            if await self.submitter.get_variable('epoch_roots', epoch) == root:
+                return {}
+            raise
+
+    async def dispatch(self, epochs):
+        results = await asyncio.gather(*(self.post(epoch, root, signed_root)
+            for epoch, _, _, root, signed_root, _ in epochs), return_exceptions=True)
+
+        posted = [(epoch, result) for epoch, result in zip(epochs, results)
+            if not isinstance(result, BaseException)]
+        self.store.mark_epochs_posted([epoch[0] for epoch, _ in posted])
+
+        now = time.time()
+        for (epoch, first_sequence, last_sequence, _, _, signed_at), result in posted:
+            burns = self.store.epoch_burns(first_sequence, last_sequence)
+            for abi, _, tx_hash, _ in burns:
+                record_stage('proof_posted', tx_hash or abi, signed_at, now, epoch=epoch,
+                    batch_size=len(burns), tx_hash=result.get('hash'))
+
+        # The epochs that failed are sent again with a later batch
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
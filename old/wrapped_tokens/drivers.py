@@ -0,0 +1,94 @@
+import bisect
+
+from contracting.db.driver import ContractDriver
+from contracting.db.encoder import decode, encode
+
+# Contract storage in memory, for the operator's dry runs, the tests and the benchmarks.
+#
+# Only contracting is imported here, so the module can be imported as a sibling by the
+# operator (from drivers import MemoryContractDriver) and as old.wrapped_tokens.drivers
+# from the repository root.
+
+
+class MemoryDriver:
+    """Storage driver for ContractDriver that keeps the state in a dict, for tests and
+    simulations that should not wait for a database. Keys are the same strings and values
+    the same encoding as in contracting's drivers, so a read never hands out an object that
+    is also stored. Next to the dict, the keys are kept in a sorted list, so iterating
+    a prefix only visits the keys with that prefix instead of sorting all of them like
+    InMemDriver does.
+    """
+    def __init__(self):
+        self.db = {}
+        self.sorted_keys = []
+
+    def get(self, item):
+        return decode(self.db.get(item))
+
+    def set(self, key, value):
+        if value is None:
+            self.delete(key)
+            return
+
+        if key not in self.db:
+            bisect.insort(self.sorted_keys, key)
+        self.db[key] = encode(value)
+
+    def delete(self, key):
+        if self.db.pop(key, None) is not None:
+            del self.sorted_keys[bisect.bisect_left(self.sorted_keys, key)]
+
+    def load(self, items):
+        """Stores many (key, value) pairs at once and sorts the keys only once, to fill in
+        large states for simulations.
+        """
+        for key, value in items:
+            self.db[key] = encode(value)
+        self.sorted_keys = sorted(self.db)
+
+    def iter(self, prefix, length=0):
+        keys = []
+        for i in range(bisect.bisect_left(self.sorted_keys, prefix), len(self.sorted_keys)):
+            if not self.sorted_keys[i].startswith(prefix) or 0 < length <= len(keys):
+                break
+            keys.append(self.sorted_keys[i])
+        return keys
+
+    def scan(self, prefix):
+        """Yields (key, value) of all keys that start with prefix, in order.
+        """
+        for k in self.iter(prefix):
+            yield k, decode(self.db[k])
+
+    def keys(self):
+        return list(self.sorted_keys)
+
+    def flush(self):
+        self.db.clear()
+        self.sorted_keys.clear()
+
+    def __getitem__(self, item):
+        value = self.get(item)
+        if value is None:
+            raise KeyError
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        self.delete(key)
+
+
+class MemoryContractDriver(ContractDriver):
+    """ContractDriver on a MemoryDriver. CacheDriver.commit keeps the writes it stored as
+    pending, so every later commit stores them again and the executor copies all of them
+    into the output of every transaction. Here they are dropped once stored, which keeps
+    the cost of a transaction the same however many came before it.
+    """
+    def __init__(self):
+        super().__init__(driver=MemoryDriver())
+
+    def commit(self):
+        super().commit()
+        self.pending_writes.clear()
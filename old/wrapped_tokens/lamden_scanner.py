@@ -0,0 +1,145 @@
+import asyncio
+import time
+
+from tracing import record_stage
+
+# Scans Lamden blocks for successful burns on the clearinghouse contract.
+#
+# Up to window blocks are requested at the same time, but blocks are decoded and handed
+# over strictly in order. The checkpoint only moves over blocks that were processed
+# without a gap, so a block that could not be fetched is retried before anything after
+# it is considered done.
+#
+# checkpoint is a state.ChainCheckpoint. All blocks that are fetched already when the
+# next block in order arrives are processed in one batch together with the checkpoint,
+# so handlers should only record work in the state store.
+
+
+def queue_sequence(tx, contract_name):
+    """Returns the sequence number router.burn queued the ABI under, from the state changes
+    of the transaction, or None if the block does not list them.
+    """
+    prefix = f'{contract_name}.queue:'
+
+    for change in tx.get('state') or []:
+        if change['key'].startswith(prefix):
+            return int(change['key'][len(prefix):])
+
+    return None
+
+
+def find_burn_transactions(block, contract_name):
+    """Returns the ABI, the transaction hash, the timestamp the sender signed the
+    transaction at and the queue sequence number of all successful burns on contract_name
+    in the block. The hash, timestamp and sequence are None if the block does not have them.
+    """
+    burns = []
+
+    for subblock in block.get('subblocks') or []:
+        for tx in subblock['transactions']:
+            payload = tx['transaction']['payload']
+
+            if payload['contract'] != contract_name or payload['function'] != 'burn':
+                continue
+
+            if tx['status'] != 0 or tx['result'].startswith('AssertionError('):
+                continue
+
+            # The result is the repr of the returned string
+            burns.append((tx['result'][1:-1], tx.get('hash'),
+                tx['transaction'].get('metadata', {}).get('timestamp'),
+                queue_sequence(tx, contract_name)))
+
+    return burns
+
+
+class LamdenScanner:
+    def __init__(self, masternodes, contract_name, checkpoint, handler,
+                 window=16, poll_interval=1):
+        # sessions.Upstream of the Lamden masternodes
+        self.masternodes = masternodes
+        self.contract_name = contract_name
+        self.checkpoint = checkpoint
+        self.handler = handler
+
+        self.window = window
+        self.poll_interval = poll_interval
+
+        self.is_running = False
+
+    async def latest_block_number(self):
+        data = await self.masternodes.get_json('/latest_block_num')
+        return data['latest_block_number']
+
+    async def get_block(self, number):
+        return await self.masternodes.get_json('/blocks', num=number)
+
+    def process(self, block_number, block):
+        for abi, tx_hash, timestamp, sequence in find_burn_transactions(block, self.contract_name):
+            self.handler(abi, tx_hash, sequence)
+
+            if timestamp is not None:
+                record_stage('burn_seen', tx_hash or abi, float(timestamp), time.time(),
+                    lamden_block=block_number)
+
+    def fetched(self, fetches, number):
+        task = fetches.get(number)
+        return task is not None and task.done() and not task.cancelled() and task.exception() is None
+
+    async def scan(self, to_block=None):
+        """Processes all blocks after the checkpoint up to to_block (the latest block if not
+        given) and returns the last block that was processed.
+        """
+        if to_block is None:
+            to_block = await self.latest_block_number()
+
+        next_block = self.checkpoint.load() + 1
+        fetches = {}
+
+        try:
+            while next_block <= to_block:
+                # Keep the window full, starting from the oldest block not processed yet
+                for number in range(next_block, min(next_block + self.window, to_block + 1)):
+                    if number not in fetches:
+                        fetches[number] = asyncio.ensure_future(self.get_block(number))
+
+                try:
+                    block = await fetches.pop(next_block)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # Fetched again with the next window
+                    print(f'Could not fetch block {next_block}: {e}')
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+
+                with self.checkpoint.batch():
+                    self.process(next_block, block)
+                    next_block += 1
+
+                    while next_block <= to_block and self.fetched(fetches, next_block):
+                        self.process(next_block, fetches.pop(next_block).result())
+                        next_block += 1
+
+                    self.checkpoint.save(next_block - 1)
+        finally:
+            for task in fetches.values():
+                task.cancel()
+
+        return next_block - 1
+
+    async def serve(self):
+        self.is_running = True
+
+        while self.is_running:
+            try:
+                await self.scan()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f'Lamden scan failed: {e}')
+
+            await asyncio.sleep(self.poll_interval)
+
+    def stop(self):
+        self.is_running = False
@@ -0,0 +1,141 @@
+from collections import OrderedDict
+
+# Withdrawal proofs for the /lookup route.
+#
+# Proofs are read from the state store, which indexes every burn by the keccak256 hash of
+# its ABI and by Ethereum address and nonce as soon as the scanner records it. Once a
+# proof is posted to Lamden it never changes, so up to cache_size posted proofs are kept
+# in memory, least recently used first out. Everything else is read from the store again,
+# because the burn may be signed or posted a moment later.
+#
+# The route itself only passes the query arguments on to ProofIndex.lookup, which checks
+# them and returns the response body with its status.
+
+
+def split_signature(signature):
+    """Splits a 65 byte signature into the v, r and s that ClearingHouse.withdraw takes.
+    """
+    signature = signature[2:] if signature.startswith('0x') else signature
+    return int(signature[128:130], 16), '0x' + signature[:64], '0x' + signature[64:128]
+
+
+def valid_eth_address(address):
+    if len(address) != 42:
+        return False
+
+    if address[:2] != '0x':
+        return False
+
+    try:
+        int(address, 16)
+    except ValueError:
+        return False
+
+    return True
+
+
+def valid_hash(abi_hash):
+    if len(abi_hash) != 66 or abi_hash[:2] != '0x':
+        return False
+
+    try:
+        int(abi_hash, 16)
+    except ValueError:
+        return False
+
+    return True
+
+
+def format_proof(proof):
+    v, r, s = split_signature(proof['signed_abi'])
+
+    return {
+        'abi': proof['abi'],
+        'hash': proof['hash'],
+        'signature': proof['signed_abi'],
+        'ethereum_address': proof['ethereum_address'],
+        'posted': bool(proof['posted']),
+        # In the order of ClearingHouse.withdraw, which has to be sent from ethereum_address
+        'withdraw': {
+            'token': proof['token'],
+            'amount': proof['amount'],
+            'nonce': proof['nonce'],
+            # Inclusion path of the burn in the Merkle root that signature signs, empty
+            # for a burn that was signed on its own
+            'proof': proof['proof'],
+            'v': v,
+            'r': r,
+            's': s,
+        },
+    }
+
+
+class ProofIndex:
+    def __init__(self, store, cache_size=10000):
+        self.store = store
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, **query):
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return self.cache[key]
+
+        self.misses += 1
+
+        proof = self.store.find_proof(**query)
+        if proof is None:
+            return None
+
+        proof = format_proof(proof)
+        if not proof['posted']:
+            return proof
+
+        self.cache[key] = proof
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+        return proof
+
+    def by_hash(self, abi_hash):
+        abi_hash = abi_hash.lower()
+        return self.get(abi_hash, abi_hash=abi_hash)
+
+    def by_nonce(self, ethereum_address, nonce):
+        ethereum_address = ethereum_address.lower()
+        return self.get((ethereum_address, nonce), ethereum_address=ethereum_address, nonce=nonce)
+
+    def lookup(self, args):
+        """Returns the body and status of the /lookup response for the query arguments args,
+        a hash or an ethereum_address and nonce.
+        """
+        abi_hash = args.get('hash')
+        ethereum_address = args.get('ethereum_address')
+        nonce = args.get('nonce')
+
+        if abi_hash is not None:
+            if not valid_hash(abi_hash):
+                return {'error': 'Invalid hash'}, 400
+
+            proof = self.by_hash(abi_hash)
+
+        elif ethereum_address is not None and nonce is not None:
+            if not valid_eth_address(ethereum_address):
+                return {'error': 'Invalid Ethereum address'}, 400
+
+            if not nonce.isdigit():
+                return {'error': 'Invalid nonce'}, 400
+
+            proof = self.by_nonce(ethereum_address, int(nonce))
+
+        else:
+            return {'error': 'Pass hash, or ethereum_address and nonce'}, 400
+
+        if proof is None:
+            return {'error': 'No signed proof yet'}, 404
+
+        return proof, 200
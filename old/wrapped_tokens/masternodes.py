@@ -0,0 +1,112 @@
+import asyncio
+
+from sessions import Upstream
+
+# Reads from Lamden masternodes, routed by how well each of them has been doing.
+#
+# Every host has a moving average of its latency and of its error rate. Requests go to
+# the healthy host with the lowest latency first. A host whose error rate goes above
+# max_error_rate is left out for cooldown seconds, and then gets requests again so it
+# can recover.
+#
+# GET requests are hedged. If the first host has not answered after hedge_factor times
+# its average latency (but at least min_hedge_after seconds), the same request is sent
+# to the next best host, and whichever answers first is used.
+
+
+class HostStats:
+    def __init__(self):
+        self.latency = None
+        self.error_rate = 0
+        self.down_until = 0
+
+
+class Masternodes(Upstream):
+    def __init__(self, hosts, smoothing=0.2, max_error_rate=0.5, cooldown=30,
+                 hedge_factor=2, min_hedge_after=0.1, **kwargs):
+        super().__init__(hosts, **kwargs)
+
+        self.stats = {host: HostStats() for host in self.hosts}
+
+        self.smoothing = smoothing
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+
+        self.hedge_factor = hedge_factor
+        self.min_hedge_after = min_hedge_after
+
+    def record(self, host, latency, ok):
+        stats = self.stats[host]
+
+        if ok:
+            stats.latency = latency if stats.latency is None else \
+                (1 - self.smoothing) * stats.latency + self.smoothing * latency
+
+        stats.error_rate = (1 - self.smoothing) * stats.error_rate + self.smoothing * (0 if ok else 1)
+
+        if stats.error_rate > self.max_error_rate:
+            stats.down_until = asyncio.get_event_loop().time() + self.cooldown
+            # Starts over once the cooldown is up, so a single error does not eject it again
+            stats.error_rate = 0
+
+    def host_order(self):
+        now = asyncio.get_event_loop().time()
+
+        # Hosts without a measurement yet are tried first, so every host gets measured
+        def latency(host):
+            stats = self.stats[host]
+            return -1 if stats.latency is None else stats.latency
+
+        healthy = sorted((h for h in self.hosts if self.stats[h].down_until <= now), key=latency)
+        down = sorted((h for h in self.hosts if self.stats[h].down_until > now),
+            key=lambda h: self.stats[h].down_until)
+
+        return healthy + down
+
+    def hedge_after(self, host):
+        latency = self.stats[host].latency
+        if latency is None:
+            return self.min_hedge_after
+        return max(self.min_hedge_after, self.hedge_factor * latency)
+
+    async def hedged_request(self, method, path, **kwargs):
+        hosts = self.host_order()
+
+        if len(hosts) == 1:
+            return await self.request(method, path, hosts=hosts, **kwargs)
+
+        loop = asyncio.get_event_loop()
+        started = loop.time()
+
+        primary = asyncio.ensure_future(self.request(method, path, hosts=hosts, **kwargs))
+        done, _ = await asyncio.wait([primary], timeout=self.hedge_after(hosts[0]))
+        if done:
+            return primary.result()
+
+        hedge = asyncio.ensure_future(self.request(method, path, hosts=hosts[1:] + hosts[:1], **kwargs))
+        pending = {primary, hedge}
+
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+
+                # Only give up once both have failed
+                if not pending:
+                    return done.pop().result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+            # The time the first host took so far is all we learn about it, but it is
+            # enough to stop preferring it
+            if primary in pending:
+                self.record(hosts[0], loop.time() - started, True)
+
+    async def get_json(self, path, **params):
+        response = await self.hedged_request('GET', path, params=params)
+        response.raise_for_status()
+        return response.json()
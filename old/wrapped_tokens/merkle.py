@@ -0,0 +1,84 @@
+from eth_account import Account
+from eth_account.messages import encode_defunct
+from web3 import Web3
+
+# Merkle trees over the burns of one router epoch.
+#
+# Leaves are the keccak256 hashes of the ABIs returned by router.burn, in the order they
+# were appended to the epoch. Pairs are hashed in sorted order and an unpaired node is
+# carried up unchanged, which is what ClearingHouse.computeRoot expects.
+
+
+def hash_leaf(abi):
+    return bytes(Web3.keccak(hexstr=abi))
+
+
+def hash_pair(a, b):
+    if a > b:
+        a, b = b, a
+    return bytes(Web3.keccak(a + b))
+
+
+def build_levels(leaves):
+    levels = [list(leaves)]
+
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [hash_pair(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+
+        if len(level) % 2 == 1:
+            parents.append(level[-1])
+
+        levels.append(parents)
+
+    return levels
+
+
+def inclusion_path(levels, index):
+    path = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            path.append(level[sibling])
+        index //= 2
+
+    return path
+
+
+def merkle_root(abis):
+    assert len(abis) > 0, 'An epoch has at least one burn'
+    levels = build_levels(hash_leaf(abi) for abi in abis)
+    return levels[-1][0]
+
+
+def merkle_proof(abis, index):
+    """Returns the inclusion path of abis[index] as a list of sibling hashes, bottom up.
+    This is the proof argument of ClearingHouse.withdraw.
+    """
+    assert 0 <= index < len(abis), 'Index out of range'
+    levels = build_levels(hash_leaf(abi) for abi in abis)
+    return inclusion_path(levels, index)
+
+
+def merkle_tree(abis):
+    """Returns the leaves, the root and the inclusion paths of all abis, building the tree
+    only once.
+    """
+    assert len(abis) > 0, 'An epoch has at least one burn'
+    levels = build_levels(hash_leaf(abi) for abi in abis)
+    return levels[0], levels[-1][0], [inclusion_path(levels, i) for i in range(len(abis))]
+
+
+def verify_proof(abi, proof, root):
+    computed = hash_leaf(abi)
+    for sibling in proof:
+        computed = hash_pair(computed, sibling)
+    return computed == root
+
+
+def sign_root(root, private_key):
+    """Signs a root the same way the operator signs single burn hashes, so withdraw can
+    recover the operator's address from it with hashEthMsg and ecrecover.
+    """
+    signed = Account.sign_message(encode_defunct(primitive=root), private_key=private_key)
+    return signed
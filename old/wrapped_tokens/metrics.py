@@ -0,0 +1,83 @@
+import asyncio
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Prometheus metrics of the operator, served by WebServer on /metrics.
+#
+# STAGE_SECONDS has one histogram per stage a deposit or burn goes through, each measuring
+# the time since the stage before it:
+#
+#   event_seen      Ethereum block of the deposit -> recorded as a pending mint
+#   mint_submitted  recorded -> mint transaction accepted by the masternode
+#   mint_confirmed  accepted -> transaction result on Lamden
+#   burn_seen       Lamden burn transaction -> recorded as a burn to sign
+#   signed          recorded -> root of its epoch signed
+#   proof_posted    signed -> post_root transaction result on Lamden
+#
+# Comparing them shows which stage holds items back when throughput drops.
+
+STAGE_SECONDS = Histogram('operator_stage_seconds', 'Seconds from the previous stage to this one',
+    ['stage'], buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900, 3600))
+
+CHAIN_HEAD = Gauge('operator_chain_head_block', 'Latest block of the chain', ['chain'])
+CHAIN_LAG = Gauge('operator_chain_lag_blocks', 'Blocks the operator has not processed yet', ['chain'])
+
+QUEUE_DEPTH = Gauge('operator_queue_depth', 'Items waiting in the state store', ['queue'])
+
+TRANSACTION_FAILURES = Counter('operator_transaction_failures_total',
+    'Lamden transactions that did not succeed', ['function', 'reason'])
+
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.labels(stage).observe(max(seconds, 0))
+
+
+def track_queues(store):
+    """Reads the queue depths from the state store whenever the metrics are scraped.
+    """
+    QUEUE_DEPTH.labels('pending_mints').set_function(store.count_pending_mints)
+    QUEUE_DEPTH.labels('failed_mints').set_function(store.count_failed_mints)
+    QUEUE_DEPTH.labels('unsigned_burns').set_function(store.count_unsigned_burns)
+    QUEUE_DEPTH.labels('unsealed_burns').set_function(store.count_unsealed_burns)
+    QUEUE_DEPTH.labels('unsequenced_burns').set_function(store.count_unsequenced_burns)
+    QUEUE_DEPTH.labels('unposted_roots').set_function(store.count_unposted_epochs)
+
+
+class ChainLag:
+    """Polls the latest block of a chain every interval seconds and compares it to the
+    checkpoint. While caught_up returns True, the operator is at the head no matter where
+    the checkpoint is, e.g. while the EventListener is subscribed.
+    """
+    def __init__(self, chain, latest_block, checkpoint, caught_up=None, interval=15):
+        self.chain = chain
+        self.latest_block = latest_block
+        self.checkpoint = checkpoint
+        self.caught_up = caught_up
+        self.interval = interval
+
+        self.is_running = False
+
+    async def update(self):
+        head = await self.latest_block()
+        CHAIN_HEAD.labels(self.chain).set(head)
+
+        if self.caught_up is not None and self.caught_up():
+            CHAIN_LAG.labels(self.chain).set(0)
+        else:
+            CHAIN_LAG.labels(self.chain).set(max(head - self.checkpoint.load(), 0))
+
+    async def serve(self):
+        self.is_running = True
+
+        while self.is_running:
+            try:
+                await self.update()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f'Could not get the latest {self.chain} block: {e}')
+
+            await asyncio.sleep(self.interval)
+
+    def stop(self):
+        self.is_running = False
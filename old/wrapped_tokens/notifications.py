@@ -0,0 +1,58 @@
+import asyncio
+
+from state import parse_abi
+
+# Tells websocket clients about new withdrawal proofs as soon as the operator signed them.
+#
+# Clients subscribe to ABI hashes or Ethereum addresses. Every subscriber has its own
+# queue of at most max_queue proofs. A client that does not keep up loses the oldest
+# proofs first, and can still get them from /lookup. Nothing is looked up for burns
+# nobody subscribed to, so idle connections cost nothing but memory.
+
+
+class ProofNotifier:
+    def __init__(self, proofs, max_queue=100):
+        # lookup.ProofIndex the proofs are read from
+        self.proofs = proofs
+        self.max_queue = max_queue
+
+        self.subscribers = {}
+
+    def subscribe(self, keys):
+        """Returns a queue that receives the proofs of all ABI hashes and Ethereum addresses
+        in keys. Both are lower case.
+        """
+        queue = asyncio.Queue(self.max_queue)
+        for key in keys:
+            self.subscribers.setdefault(key, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, queue, keys):
+        for key in keys:
+            queues = self.subscribers.get(key, set())
+            queues.discard(queue)
+            if not queues:
+                self.subscribers.pop(key, None)
+
+    def put(self, queue, proof):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(proof)
+
+    def publish(self, signatures):
+        """Called with the abi and hash of every burn whose proof was stored.
+        """
+        for signature in signatures:
+            abi_hash = signature['hash'].lower()
+            ethereum_address = parse_abi(signature['abi'])['ethereum_address']
+
+            queues = self.subscribers.get(abi_hash, set()) | self.subscribers.get(ethereum_address, set())
+            if not queues:
+                continue
+
+            proof = self.proofs.by_hash(abi_hash)
+            if proof is None:
+                continue
+
+            for queue in queues:
+                self.put(queue, proof)
@@ -1,8 +1,29 @@
 import asyncio
-from web3 import Web3, HTTPProvider
+from web3 import Web3
+import websockets
 import json
+import os
+import time
+from functools import partial
+
+from lamden.crypto.wallet import Wallet
+
+from backfill import Backfill, normalize_log
+from dispatcher import MintDispatcher, ProofDispatcher
+from lamden_scanner import LamdenScanner
+from lookup import ProofIndex, valid_eth_address, valid_hash
+from notifications import ProofNotifier
+from masternodes import Masternodes
+from metrics import ChainLag, track_queues
+from signer import BurnSigner
+from stamps import StampEstimator
+from sessions import Upstream
+from state import StateStore, ChainCheckpoint, event_id
+from submitter import Submitter
+from tracing import TRACER, CollectorExporter, FileExporter, record_stage
 
 import ssl
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from sanic import Sanic
 from sanic import response
 
@@ -10,41 +31,199 @@ from sanic import response
 ETH_NETWORK_CODE = 42
 ETH_NETWORK_STR = 'mainnet' if ETH_NETWORK_CODE == 1 else 'kovan'
 
-CLEARING_HOUSE_ADDRESS = '0x0'
+CLEARING_HOUSE_ADDRESS = '0x42617d2D05d076EC95e0cbE8fCd3e01915501ae5'
+INFURA_KEY = os.environ.get('INFURA_KEY', '')
 INFURA_BASE = f'https://{ETH_NETWORK_STR}.infura.io/v3/{INFURA_KEY}'
+INFURA_WS = f'wss://{ETH_NETWORK_STR}.infura.io/ws/v3/{INFURA_KEY}'
 
-ABI = json.load('abi.json')
+# Block the clearinghouse was deployed in, where a backfill without checkpoint starts
+CLEARING_HOUSE_START_BLOCK = int(os.environ.get('CLEARING_HOUSE_START_BLOCK', 0))
 
+# The JS operator's config, the masternode requests are spread over all of its hosts
+with open(os.path.join(os.path.dirname(__file__), '..', '..', 'server', 'conf.json')) as f:
+    LAMDEN_MASTERNODES = json.load(f)['lamden']['network']['hosts']
+LAMDEN_CONTRACT_NAME = 'con_clearing_house_0099'
+LAMDEN_START_BLOCK = int(os.environ.get('LAMDEN_START_BLOCK', 0))
+LAMDEN_SK = os.environ.get('LAMDEN_SK', '')
+LAMDEN_CONTRACTS = os.path.join(os.path.dirname(__file__), '..', '..', 'lamden')
 
-def handle_event(event):
-    print(event)
-    # and whatever
+# Key the clearinghouse accepts withdraw signatures from
+ETH_PRIVATE_KEY = os.environ.get('ETH_PRIVATE_KEY', '')
+
+STATE_FILE = os.path.join(os.path.dirname(__file__), 'state.db')
+
+# Where transfer traces are exported to, an OTLP/HTTP collector (e.g. http://localhost:4318)
+# or a file of OTLP/JSON lines. Tracing is off if neither is set.
+TRACE_COLLECTOR = os.environ.get('TRACE_COLLECTOR', '')
+TRACE_FILE = os.environ.get('TRACE_FILE', '')
+
+# Same ABI as the deployed clearinghouse, see server/abi/clearinghouse.json
+with open(os.path.join(os.path.dirname(__file__), 'abi.json')) as f:
+    ABI = json.load(f)
+
+
+def record_mint(store, event, dispatcher=None):
+    args = event['args']
+    queued = store.add_pending_mint(event_id(event), args['token'], hex(args['amount']), args['receiver'])
+
+    if queued and dispatcher is not None:
+        dispatcher.notify()
+
+
+def record_burn(store, abi, tx_hash=None, sequence=None, signer=None):
+    queued = store.add_burn(abi, tx_hash, sequence)
+
+    if queued and sequence is None:
+        print(f'The block of burn {tx_hash} lists no state changes, its sequence number is read '
+            'from the router queue once its epoch is sealed')
+
+    if queued and signer is not None:
+        signer.notify()
 
 
 class EventListener:
-    def __init__(self):
-        self.client = Web3(HTTPProvider(INFURA_BASE))
+    """Receives TokensWrapped events through a websocket eth_subscribe, so waiting for the
+    next event never blocks the event loop the web server runs on.
+
+    When the connection drops, it reconnects after initial_backoff seconds, multiplying
+    the delay by backoff_factor after every failed attempt up to max_backoff. connect opens
+    the websocket, websockets.connect by default.
+
+    After every (re)connect, the events emitted since the checkpoint are fetched with a
+    Backfill before the subscription is read, so downtime does not lose deposits.
+
+    By default every event is recorded as a pending mint in the state store.
+    """
+    def __init__(self, store, upstream, ws_url=INFURA_WS, handler=None,
+                 initial_backoff=1, max_backoff=60, backoff_factor=2, connect=None,
+                 **backfill_options):
+        # Only used to decode logs, requests go through the shared upstream
+        self.client = Web3()
 
         self.clearinghouse = self.client.eth.contract(
             address=CLEARING_HOUSE_ADDRESS,
             abi=ABI
         )
 
-        self.event_filter = self.clearinghouse.events.TokensWrapped.createFilter(fromBlock='latest')
-
+        self.store = store
+        self.upstream = upstream
+        self.ws_url = ws_url
+        self.connect = connect or websockets.connect
+        self.handler = handler or partial(record_mint, store)
+
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.backoff_factor = backoff_factor
+
+        event_abi = next(e for e in ABI if e['type'] == 'event' and e['name'] == 'TokensWrapped')
+        signature = f"{event_abi['name']}({','.join(i['type'] for i in event_abi['inputs'])})"
+        self.log_filter = {
+            'address': CLEARING_HOUSE_ADDRESS,
+            'topics': [Web3.keccak(text=signature).hex()]
+        }
+
+        self.checkpoint = ChainCheckpoint(store, 'ethereum', start_block=CLEARING_HOUSE_START_BLOCK)
+        self.backfill = Backfill(upstream, self.clearinghouse.events.TokensWrapped(),
+            self.log_filter, self.checkpoint, self.handler, **backfill_options)
+        self.last_block = None
+
+        # Whether the subscription delivers new events and the backfill before it is done
+        self.caught_up = False
+        self.block_request = (None, None)
+
+        self.ws = None
         self.is_running = False
 
+    async def subscribe(self, ws):
+        await ws.send(json.dumps({
+            'jsonrpc': '2.0',
+            'id': 1,
+            'method': 'eth_subscribe',
+            'params': ['logs', self.log_filter]
+        }))
+
+        reply = json.loads(await ws.recv())
+        if 'error' in reply:
+            raise ConnectionError(reply['error'])
+
+        return reply['result']
+
+    async def listen(self, ws, subscription):
+        async for message in ws:
+            notification = json.loads(message)
+
+            params = notification.get('params', {})
+            if params.get('subscription') != subscription:
+                continue
+
+            log = params['result']
+
+            # Logs of blocks that were reorganized away are sent again with removed set
+            if log.get('removed'):
+                continue
+
+            event = self.clearinghouse.events.TokensWrapped().processLog(normalize_log(log))
+
+            # Already handled by the backfill that ran after subscribing
+            if event['blockNumber'] <= self.last_block:
+                continue
+
+            with self.store.batch():
+                self.handler(event)
+
+                # Later events of the same block may still follow, so only the blocks
+                # before it are complete
+                self.checkpoint.save(event['blockNumber'] - 1)
+
+            asyncio.ensure_future(self.observe_seen(event, time.time()))
+
+    def get_block(self, block_number):
+        # Events usually come in bursts of the same block, which share one request
+        if self.block_request[0] != block_number:
+            self.block_request = (block_number, asyncio.ensure_future(
+                self.upstream.rpc('eth_getBlockByNumber', [hex(block_number), False])))
+        return self.block_request[1]
+
+    async def observe_seen(self, event, seen_at):
+        try:
+            block = await self.get_block(event['blockNumber'])
+        except Exception:
+            return
+
+        record_stage('event_seen', event_id(event), int(block['timestamp'], 16), seen_at,
+            ethereum_block=event['blockNumber'])
+
     async def serve(self):
         self.is_running = True
+        backoff = self.initial_backoff
 
         while self.is_running:
-            for event in self.event_filter.get_new_entries():
-                handle_event(event)
-            await asyncio.sleep(0)
+            try:
+                async with self.connect(self.ws_url) as ws:
+                    self.ws = ws
+                    subscription = await self.subscribe(ws)
+                    self.last_block = await self.backfill.run()
+                    self.caught_up = True
+                    backoff = self.initial_backoff
+                    await self.listen(ws, subscription)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f'Listener disconnected: {e}. Reconnecting in {backoff}s')
+            finally:
+                self.caught_up = False
+
+            if self.is_running:
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * self.backoff_factor, self.max_backoff)
 
     def stop(self):
         self.is_running = False
 
+        # Wakes up listen, which otherwise waits for the next message
+        if self.ws is not None:
+            asyncio.ensure_future(self.ws.close())
+
     def mint_tokens(self):
         pass
 
@@ -81,16 +260,71 @@ class WebServer:
         self.debug = debug
         self.access_log = access_log
 
+        self.store = StateStore(STATE_FILE)
+
+        # One pooled client per upstream, shared by everything that talks to it
+        self.masternodes = Masternodes(LAMDEN_MASTERNODES)
+        self.ethereum = Upstream([INFURA_BASE])
+
+        # Pending nonces are only known to the masternode a transaction was sent to
+        self.submitter = Submitter(self.masternodes.pinned(), Wallet(seed=LAMDEN_SK),
+            LAMDEN_CONTRACT_NAME, readers=self.masternodes)
+
+        # Stamp limits are measured on a local copy of the contracts the operator calls
+        with open(os.path.join(LAMDEN_CONTRACTS, 'router.py')) as f, \
+                open(os.path.join(LAMDEN_CONTRACTS, 'token.py')) as g:
+            self.estimator = StampEstimator(LAMDEN_CONTRACT_NAME, f.read(), g.read(),
+                operator=self.submitter.wallet.verifying_key)
+
+        self.dispatcher = MintDispatcher(self.store, self.submitter, estimator=self.estimator)
+
         # Main controller class
-        self.controller = EventListener()
+        self.controller = EventListener(self.store, self.ethereum,
+            handler=partial(record_mint, self.store, dispatcher=self.dispatcher))
+
+        self.proof_dispatcher = ProofDispatcher(self.store, self.submitter, estimator=self.estimator)
+        self.signer = BurnSigner(self.store, ETH_PRIVATE_KEY, self.submitter, estimator=self.estimator,
+            on_signed=self.on_signed)
+
+        self.lamden_scanner = LamdenScanner(self.masternodes, LAMDEN_CONTRACT_NAME,
+            ChainCheckpoint(self.store, 'lamden', start_block=LAMDEN_START_BLOCK),
+            partial(record_burn, self.store, signer=self.signer))
+
+        self.proofs = ProofIndex(self.store)
+        self.notifier = ProofNotifier(self.proofs)
+
+        track_queues(self.store)
+
+        if TRACE_COLLECTOR:
+            TRACER.exporter = CollectorExporter(Upstream([TRACE_COLLECTOR]))
+        elif TRACE_FILE:
+            TRACER.exporter = FileExporter(TRACE_FILE)
+        self.chain_lags = [
+            ChainLag('ethereum', self.controller.backfill.latest_block, self.controller.checkpoint,
+                caught_up=lambda: self.controller.caught_up),
+            ChainLag('lamden', self.lamden_scanner.latest_block_number, self.lamden_scanner.checkpoint),
+        ]
 
         # Add Routes
-        self.app.add_route(self.start_swap, '/start', methods=['POST'])
-        self.app.add_route(self.lookup_uuid, '/lookup', methods=['GET'])
+        self.app.add_route(self.lookup, '/lookup', methods=['GET'])
+        self.app.add_websocket_route(self.subscribe, '/subscribe')
+        self.app.add_route(self.metrics, '/metrics', methods=['GET'])
+
+    def on_signed(self, signatures):
+        self.proof_dispatcher.notify()
+        self.notifier.publish(signatures)
 
     async def start(self):
         # Start server with SSL enabled or not
         asyncio.ensure_future(self.controller.serve())
+        asyncio.ensure_future(self.lamden_scanner.serve())
+        asyncio.ensure_future(self.dispatcher.serve())
+        asyncio.ensure_future(self.signer.serve())
+        asyncio.ensure_future(self.proof_dispatcher.serve())
+        for chain_lag in self.chain_lags:
+            asyncio.ensure_future(chain_lag.serve())
+        if TRACER.exporter is not None:
+            asyncio.ensure_future(TRACER.serve())
         await self.app.create_server(
             host='0.0.0.0',
             port=self.port,
@@ -98,21 +332,6 @@ class WebServer:
             access_log=self.access_log,
             return_asyncio_server=True)
 
-    @staticmethod
-    def valid_eth_address(address):
-        if len(address) != 42:
-            return False
-
-        if address[:2] != '0x':
-            return False
-
-        try:
-            int(address, 16)
-        except ValueError:
-            return False
-
-        return True
-
     @staticmethod
     def valid_lamden_address(address):
         if len(address) != 64:
@@ -125,6 +344,55 @@ class WebServer:
 
         return True
 
+    async def lookup(self, request):
+        """Returns the withdrawal proof of a burn, looked up by the keccak256 hash of its ABI
+        (?hash=0x...) or by the Ethereum address it was burned to and its nonce
+        (?ethereum_address=0x...&nonce=1).
+        """
+        body, status = self.proofs.lookup(request.args)
+        return response.json(body, status=status)
+
+    async def subscribe(self, request, ws):
+        """Sends every withdrawal proof of the given ABI hashes (?hash=0x...) and Ethereum
+        addresses (?ethereum_address=0x...) as a JSON message once it is signed. Both can be
+        repeated. Proofs of the hashes that are signed already are sent right away.
+        """
+        hashes = [h.lower() for h in request.args.getlist('hash', [])]
+        addresses = [a.lower() for a in request.args.getlist('ethereum_address', [])]
+
+        if not hashes and not addresses:
+            await ws.send(json.dumps({'error': 'Pass hash or ethereum_address'}))
+            return
+
+        for abi_hash in hashes:
+            if not valid_hash(abi_hash):
+                await ws.send(json.dumps({'error': 'Invalid hash'}))
+                return
+
+        for address in addresses:
+            if not valid_eth_address(address):
+                await ws.send(json.dumps({'error': 'Invalid Ethereum address'}))
+                return
+
+        # Subscribed before looking up, so a proof signed in between is not missed
+        keys = hashes + addresses
+        queue = self.notifier.subscribe(keys)
+
+        try:
+            for abi_hash in hashes:
+                proof = self.proofs.by_hash(abi_hash)
+                if proof is not None:
+                    await ws.send(json.dumps(proof))
+
+            while True:
+                proof = await queue.get()
+                await ws.send(json.dumps(proof))
+        finally:
+            self.notifier.unsubscribe(queue, keys)
+
+    async def metrics(self, request):
+        return response.raw(generate_latest(), content_type=CONTENT_TYPE_LATEST)
+
     async def burn(self, request):
         ethereum_contract = request.args.get('ethereum_contract')
         ethereum_address = request.args.get('ethereum_address')
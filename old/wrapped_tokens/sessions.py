@@ -0,0 +1,140 @@
+import asyncio
+import copy
+import itertools
+import random
+
+import httpx
+
+# One shared HTTP client per upstream service (the Lamden masternodes, the Ethereum RPC).
+#
+# Connections are pooled and kept alive between requests, and HTTP/2 is used when the
+# h2 package is installed. Requests are spread over all hosts of the upstream in turn,
+# at most max_per_host at a time per host. Failed requests are retried on the next host
+# after a random delay of up to backoff * 2 ** attempt seconds (full jitter).
+#
+# pinned() returns a view that sends every request to one host over the same pool, for
+# callers that depend on which host they talk to.
+
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+# Status codes worth retrying, everything else is returned to the caller
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    pass
+
+
+class Upstream:
+    def __init__(self, hosts, max_per_host=16, keepalive_per_host=8, timeout=10,
+                 retries=3, backoff=0.25, max_backoff=8, transport=None):
+        assert len(hosts) > 0, 'An upstream needs at least one host'
+        self.hosts = [host.rstrip('/') for host in hosts]
+
+        # transport replaces the network, e.g. with an httpx.MockTransport
+        self.client = httpx.AsyncClient(
+            http2=HTTP2,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_per_host * len(self.hosts),
+                max_keepalive_connections=keepalive_per_host * len(self.hosts)
+            ),
+            transport=transport
+        )
+        self.host_limits = {host: asyncio.Semaphore(max_per_host) for host in self.hosts}
+        self.next_start = itertools.cycle(range(len(self.hosts)))
+
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.rpc_id = itertools.count(1)
+
+    async def close(self):
+        await self.client.aclose()
+
+    def pinned(self, host=None):
+        """Returns a view of this upstream that sends every request to host, the first host
+        by default. It shares the connection pool, the per host limits and, in subclasses,
+        what they learn about the host. Closing either closes both.
+        """
+        host = self.hosts[0] if host is None else host.rstrip('/')
+        assert host in self.host_limits, f'{host} is not a host of this upstream'
+
+        view = copy.copy(self)
+        view.hosts = [host]
+        view.next_start = itertools.cycle([0])
+        return view
+
+    def host_order(self):
+        """Hosts in the order a request tries them. Requests start on the hosts in turn,
+        and each retry moves on to the next host.
+        """
+        start = next(self.next_start)
+        return self.hosts[start:] + self.hosts[:start]
+
+    def record(self, host, latency, ok):
+        """Called after every attempt, subclasses use it to track the health of hosts.
+        """
+
+    async def request(self, method, path, hosts=None, **kwargs):
+        hosts = hosts or self.host_order()
+        loop = asyncio.get_event_loop()
+
+        for attempt in range(self.retries + 1):
+            host = hosts[attempt % len(hosts)]
+            started = loop.time()
+
+            try:
+                async with self.host_limits[host]:
+                    response = await self.client.request(method, f'{host}{path}', **kwargs)
+
+                if response.status_code not in RETRY_STATUS:
+                    self.record(host, loop.time() - started, True)
+                    return response
+
+                error = UpstreamError(f'{host}{path} returned {response.status_code}')
+            except httpx.TransportError as e:
+                error = e
+
+            self.record(host, loop.time() - started, False)
+
+            if attempt < self.retries:
+                await asyncio.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+        raise error
+
+    async def hedged_request(self, method, path, **kwargs):
+        """Like request. Subclasses send it to a second host as well if the first is slow.
+        """
+        return await self.request(method, path, **kwargs)
+
+    async def get_json(self, path, **params):
+        response = await self.request('GET', path, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def post_json(self, path, content):
+        response = await self.request('POST', path, content=content)
+        return response.json()
+
+    async def rpc(self, method, params=()):
+        """Calls an Ethereum JSON-RPC method and returns its result.
+        """
+        response = await self.request('POST', '', json={
+            'jsonrpc': '2.0',
+            'id': next(self.rpc_id),
+            'method': method,
+            'params': list(params)
+        })
+        response.raise_for_status()
+
+        reply = response.json()
+        if 'error' in reply:
+            raise UpstreamError(reply['error'])
+
+        return reply['result']
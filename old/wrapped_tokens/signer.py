@@ -0,0 +1,216 @@
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from eth_account import Account
+from eth_account.messages import encode_defunct
+from web3 import Web3
+
+from merkle import merkle_tree, sign_root
+from tracing import record_stage
+
+# Signs the burns of the router for ClearingHouse.withdraw, one epoch at a time.
+#
+# The LamdenScanner records every burn with the sequence number router.burn queued it
+# under. Once burns are waiting, for max_latency seconds or batch_size of them, the signer
+# seals the open epoch with router.seal_epoch. The epoch holds every burn queued on the
+# router until then, so it is signed once the scanner recorded all of them: the Merkle root
+# over their keccak256 hashes is signed once, and each burn keeps its inclusion path as
+# its proof. ProofDispatcher posts the signed root with router.post_root.
+#
+# Which sequence numbers an epoch holds is read from the router after every seal, so an
+# epoch that was sealed right before a restart is signed as well. The sequence numbers of
+# the burns come from the state changes Lamden blocks list for each transaction. A block
+# that does not list them leaves its burns without one; they count as unsealed, and once
+# an epoch misses burns, the ABIs it is missing are read from the router's queue to find
+# their sequence numbers.
+#
+# Building the tree and signing run on a process pool, so a large epoch does not block
+# the event loop. The signature is recovered again before it is stored, and nothing that
+# does not recover to the operator's address is ever posted.
+
+
+def sign_epoch(abis, private_key):
+    """Builds the Merkle tree over the ABIs of an epoch and signs its root the way
+    web3.eth.accounts.sign does in the JS operator. Returns the hashes of the ABIs, the root,
+    its signature, the inclusion path of every ABI and the address the signature recovers to.
+    """
+    leaves, root, paths = merkle_tree(abis)
+    signature = Web3.toHex(sign_root(root, private_key).signature)
+
+    return {
+        'hashes': [Web3.toHex(leaf) for leaf in leaves],
+        'root': Web3.toHex(root),
+        'signature': signature,
+        'proofs': [[Web3.toHex(sibling) for sibling in path] for path in paths],
+        'signer': Account.recover_message(encode_defunct(primitive=root), signature=signature),
+    }
+
+
+class SignatureMismatch(Exception):
+    pass
+
+
+class BurnSigner:
+    def __init__(self, store, private_key, submitter, batch_size=1024, max_latency=5,
+                 poll_interval=1, seal_stamps=100, estimator=None, on_signed=None, pool=None):
+        self.store = store
+        self.private_key = private_key
+        self.address = Account.from_key(private_key).address
+
+        # submitter.Submitter of the router, which seals the epochs and reads their bounds
+        self.submitter = submitter
+        self.estimator = estimator
+
+        # Epochs are signed one after the other, a single worker keeps the loop free. Any
+        # concurrent.futures executor will do where no processes can be started.
+        self.pool = pool or ProcessPoolExecutor(max_workers=1)
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.poll_interval = poll_interval
+        self.seal_stamps = seal_stamps
+        self.on_signed = on_signed
+
+        self.signed = 0
+        self.signing_time = 0
+
+        # sequence: ABI of the entries read from the router's queue, for epochs not signed yet
+        self.queued = {}
+
+        # Whether the store knows every epoch sealed on the router
+        self.synced = False
+
+        self.wakeup = asyncio.Event()
+        self.is_running = False
+
+    @property
+    def signatures_per_second(self):
+        """Burns covered by a signature per second of signing.
+        """
+        return self.signed / self.signing_time if self.signing_time else 0
+
+    def notify(self):
+        """Tells the signer that new burns were added to the store.
+        """
+        self.wakeup.set()
+
+    async def sync_epochs(self):
+        """Records the epochs sealed on the router that the store does not know yet.
+        """
+        sealed = int(await self.submitter.get_variable('epoch'))
+
+        for epoch in range(self.store.next_epoch(), sealed):
+            first_sequence = int(await self.submitter.get_variable('epoch_starts', epoch))
+            next_first_sequence = int(await self.submitter.get_variable('epoch_starts', epoch + 1))
+            self.store.add_epoch(epoch, first_sequence, next_first_sequence - 1)
+
+        self.synced = True
+
+    def seal_due(self):
+        burns = self.store.unsealed_burns(1)
+        if not burns:
+            return False
+
+        return (self.store.count_unsealed_burns() >= self.batch_size
+            or time.time() - burns[0][1] >= self.max_latency)
+
+    async def seal(self):
+        stamps = self.seal_stamps
+        if self.estimator is not None:
+            try:
+                stamps = self.estimator.estimate('seal_epoch')
+            except Exception as e:
+                print(f'Could not estimate stamps for seal_epoch: {e}')
+
+        try:
+            await self.submitter.send('seal_epoch', {}, stamps)
+        finally:
+            # Also when the result got lost, the epoch may have been sealed anyway
+            self.synced = False
+
+    async def find_sequences(self, epoch, first_sequence, last_sequence, burns):
+        """Reads the ABIs the router queued under the sequence numbers of an epoch that no
+        recorded burn has, and gives burns recorded without a sequence number theirs.
+        """
+        known = {burn[3] for burn in burns}
+
+        for sequence in range(first_sequence, last_sequence + 1):
+            if sequence not in known and sequence not in self.queued:
+                self.queued[sequence] = await self.submitter.get_variable('queue', sequence)
+
+        found = self.store.set_burn_sequences([(self.queued[sequence], sequence)
+            for sequence in range(first_sequence, last_sequence + 1)
+            if sequence not in known and self.queued[sequence] is not None])
+        if found:
+            print(f'Found the sequence numbers of {found} burns of epoch {epoch} in the router queue')
+
+    async def sign(self, epoch, first_sequence, last_sequence):
+        """Signs an epoch once all of its burns are recorded, and returns whether it did.
+        Raises SignatureMismatch if the signature does not recover to the operator's address.
+        """
+        burns = self.store.epoch_burns(first_sequence, last_sequence)
+        if len(burns) < last_sequence - first_sequence + 1 and self.store.count_unsequenced_burns() > 0:
+            await self.find_sequences(epoch, first_sequence, last_sequence, burns)
+            burns = self.store.epoch_burns(first_sequence, last_sequence)
+
+        if len(burns) < last_sequence - first_sequence + 1:
+            return False
+
+        abis = [burn[0] for burn in burns]
+        loop = asyncio.get_event_loop()
+
+        started = time.perf_counter()
+        signed = await loop.run_in_executor(self.pool, sign_epoch, abis, self.private_key)
+        self.signing_time += time.perf_counter() - started
+
+        if signed['signer'] != self.address:
+            raise SignatureMismatch(f"Root of epoch {epoch} recovers to {signed['signer']}")
+
+        self.store.set_epoch_signature(epoch, signed['root'], signed['signature'],
+            list(zip(abis, signed['proofs'])))
+        self.signed += len(abis)
+        for sequence in range(first_sequence, last_sequence + 1):
+            self.queued.pop(sequence, None)
+
+        now = time.time()
+        for abi, seen_at, tx_hash, _ in burns:
+            record_stage('signed', tx_hash or abi, seen_at, now, epoch=epoch, batch_size=len(burns))
+        print(f'Signed epoch {epoch} of {len(burns)} burns, {self.signatures_per_second:.0f} burns/s')
+
+        if self.on_signed is not None:
+            self.on_signed([{'abi': abi, 'hash': abi_hash} for abi, abi_hash in zip(abis, signed['hashes'])])
+
+        return True
+
+    async def serve(self):
+        self.is_running = True
+
+        while self.is_running:
+            try:
+                if not self.synced:
+                    await self.sync_epochs()
+
+                # An epoch whose burns are not all scanned yet does not hold up later ones
+                for epoch in self.store.unsigned_epochs():
+                    await self.sign(*epoch)
+
+                if self.seal_due():
+                    await self.seal()
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f'Could not sign burns: {e}')
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def stop(self):
+        self.is_running = False
+        self.notify()
+        self.pool.shutdown(wait=False)
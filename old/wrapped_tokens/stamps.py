@@ -0,0 +1,129 @@
+import math
+
+from contracting.client import ContractingClient
+
+from drivers import MemoryContractDriver
+
+# Stamp limits for the operator's Lamden transactions.
+#
+# Instead of a fixed limit per call, every function is run once per batch size against a
+# local copy of the router (and a token it mints), with the operator as owner. The stamps
+# the dry run used, times margin plus min_extra, is the limit sent with the transaction.
+# Limits are cached by function and batch size, and dry runs never change the local state.
+#
+# The arguments of a dry run are as long as real ones, since the cost of a write grows
+# with the size of its key and value.
+
+ETH_TOKEN = '0x' + '1' * 40
+ETH_ADDRESS = '0x' + '2' * 40
+LAMDEN_WALLET = 'a' * 64
+AMOUNT = '0x' + 'f' * 16
+ABI = '0' * 256
+SIGNED_ABI = '0x' + '1' * 130
+ROOT = '0x' + '1' * 64
+
+# Name of the local token, which may not be the name of a Python module like token
+TOKEN_NAME = 'con_token'
+
+# Enough stamps for any dry run, paid for by the local operator
+BALANCE = 10 ** 9
+
+
+def sample_event_id(i):
+    return f'0x{i:064x}:{i % 1000}'
+
+
+def sample_kwargs(function, batch_size):
+    """Arguments for a call of function with batch_size items, every item a different key.
+    """
+    if function == 'mint':
+        return {'ethereum_contract': ETH_TOKEN, 'amount': AMOUNT, 'lamden_wallet': LAMDEN_WALLET,
+            'event_id': sample_event_id(0)}
+    if function == 'mint_batch':
+        return {'records': [[ETH_TOKEN, AMOUNT, f'{i:064x}', sample_event_id(i)] for i in range(batch_size)]}
+    if function == 'burn':
+        return {'ethereum_contract': ETH_TOKEN, 'ethereum_address': ETH_ADDRESS,
+            'lamden_address': LAMDEN_WALLET, 'amount': 1}
+    if function == 'post_proof':
+        return {'hashed_abi': ABI, 'signed_abi': SIGNED_ABI}
+    if function == 'post_proofs':
+        return {'pairs': [[f'{i:0256x}', SIGNED_ABI] for i in range(batch_size)]}
+    if function == 'seal_epoch':
+        return {}
+    if function == 'post_root':
+        return {'epoch_number': 0, 'root': ROOT, 'signed_root': SIGNED_ABI}
+
+    raise ValueError(f'No sample arguments for {function}')
+
+
+class StampEstimator:
+    def __init__(self, contract_name, router_code, token_code, operator='sys', driver=None,
+                 margin=1.25, min_extra=5):
+        self.contract_name = contract_name
+        self.operator = operator
+
+        self.driver = driver or MemoryContractDriver()
+        self.client = ContractingClient(signer=operator, driver=self.driver)
+
+        self.margin = margin
+        self.min_extra = min_extra
+
+        self.cache = {}
+
+        self.deploy(router_code, token_code)
+
+    def deploy(self, router_code, token_code):
+        self.client.submit(router_code, name=self.contract_name, signer=self.operator)
+        self.client.submit(token_code, name=TOKEN_NAME)
+
+        # The token only lets its owner mint
+        self.client.set_var(contract=TOKEN_NAME, variable='owner', value=self.contract_name,
+            mark=True)
+
+        router = self.client.get_contract(self.contract_name)
+        router.add_token(signer=self.operator, ethereum_contract=ETH_TOKEN,
+            lamden_contract=TOKEN_NAME, decimals=18)
+
+        # For burn, which takes the tokens from the wallet
+        token = self.client.get_contract(TOKEN_NAME)
+        self.client.set_var(contract=TOKEN_NAME, variable='balances', arguments=[LAMDEN_WALLET],
+            value=BALANCE, mark=True)
+        token.approve(signer=LAMDEN_WALLET, amount=BALANCE, to=self.contract_name)
+
+        self.client.set_var(contract='currency', variable='balances', arguments=[self.operator],
+            value=BALANCE, mark=True)
+
+        # Epoch 0 is sealed without a root, for post_root, and epoch 1 has a burn to seal
+        burn = sample_kwargs('burn', 1)
+        router.burn(signer=self.operator, **burn)
+        router.seal_epoch(signer=self.operator)
+        router.burn(signer=self.operator, **burn)
+
+        # Dry runs drop everything that is not committed
+        self.driver.commit()
+
+    def dry_run(self, function, batch_size=1):
+        """Returns the stamps a call uses, without keeping any of its writes.
+        """
+        try:
+            output = self.client.executor.execute(sender=self.operator,
+                contract_name=self.contract_name, function_name=function,
+                kwargs=sample_kwargs(function, batch_size), metering=True, auto_commit=False)
+        finally:
+            self.driver.clear_pending_state()
+
+        if output['status_code'] != 0:
+            raise output['result']
+
+        return output['stamps_used']
+
+    def estimate(self, function, batch_size=1):
+        """Returns the stamp limit for a call of function with batch_size items.
+        """
+        key = (function, batch_size)
+
+        if key not in self.cache:
+            used = self.dry_run(function, batch_size)
+            self.cache[key] = math.ceil(used * self.margin) + self.min_extra
+
+        return self.cache[key]
@@ -0,0 +1,360 @@
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from web3 import Web3
+
+# Operator state, kept in one SQLite database in WAL mode.
+#
+# Every method commits on its own, unless it is called inside batch(), in which case all
+# writes of the batch are committed together when the outermost batch exits.
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS checkpoints (
+    chain TEXT PRIMARY KEY,
+    block INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS processed_events (
+    event_id TEXT PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS pending_mints (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id TEXT UNIQUE NOT NULL,
+    ethereum_contract TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    lamden_wallet TEXT NOT NULL,
+    seen_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS failed_mints (
+    event_id TEXT PRIMARY KEY,
+    ethereum_contract TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    lamden_wallet TEXT NOT NULL,
+    seen_at REAL NOT NULL,
+    failed_at REAL NOT NULL,
+    error TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS proofs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    abi TEXT UNIQUE NOT NULL,
+    hash TEXT NOT NULL,
+    token TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    nonce INTEGER NOT NULL,
+    ethereum_address TEXT NOT NULL,
+    tx_hash TEXT,
+    sequence INTEGER,
+    signed_abi TEXT,
+    proof TEXT,
+    posted INTEGER NOT NULL DEFAULT 0,
+    seen_at REAL NOT NULL,
+    signed_at REAL
+);
+
+CREATE INDEX IF NOT EXISTS proofs_hash ON proofs (hash);
+CREATE INDEX IF NOT EXISTS proofs_address_nonce ON proofs (ethereum_address, nonce);
+CREATE INDEX IF NOT EXISTS proofs_sequence ON proofs (sequence);
+
+CREATE TABLE IF NOT EXISTS epochs (
+    epoch INTEGER PRIMARY KEY,
+    first_sequence INTEGER NOT NULL,
+    last_sequence INTEGER NOT NULL,
+    root TEXT,
+    signed_root TEXT,
+    posted INTEGER NOT NULL DEFAULT 0,
+    sealed_at REAL NOT NULL,
+    signed_at REAL
+);
+'''
+
+PROOF_COLUMNS = ('abi', 'hash', 'token', 'amount', 'nonce', 'ethereum_address', 'signed_abi', 'proof',
+    'posted')
+
+
+def parse_abi(abi):
+    """Splits a burn ABI (token, amount, nonce and address, each padded to 32 bytes) into
+    its fields. Addresses are lower case, amounts the uint256 as a decimal string.
+    """
+    words = [abi[i:i + 64] for i in range(0, 256, 64)]
+    return {
+        'token': '0x' + words[0][24:].lower(),
+        'amount': str(int(words[1], 16)),
+        'nonce': int(words[2], 16),
+        'ethereum_address': '0x' + words[3][24:].lower(),
+    }
+
+
+def event_id(event):
+    """Identifies an Ethereum log by its transaction and position in the block, the way
+    server/eth.js does: 0x prefixed transaction hash, a colon and the log index. It is the
+    event_id router.mint takes.
+    """
+    return f"{Web3.toHex(event['transactionHash'])}:{event['logIndex']}"
+
+
+class StateStore:
+    def __init__(self, path):
+        # Transactions are started explicitly by batch
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        # In WAL mode, NORMAL only syncs at checkpoints and still never corrupts the database
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+
+        self.depth = 0
+
+    @contextmanager
+    def batch(self):
+        if self.depth == 0:
+            self.db.execute('BEGIN')
+        self.depth += 1
+
+        try:
+            yield self
+        except BaseException:
+            self.depth -= 1
+            if self.depth == 0:
+                self.db.execute('ROLLBACK')
+            raise
+
+        self.depth -= 1
+        if self.depth == 0:
+            self.db.execute('COMMIT')
+
+    def close(self):
+        self.db.close()
+
+    # Checkpoints
+
+    def get_checkpoint(self, chain, default=None):
+        row = self.db.execute('SELECT block FROM checkpoints WHERE chain = ?', (chain,)).fetchone()
+        return default if row is None else row[0]
+
+    def set_checkpoint(self, chain, block):
+        with self.batch():
+            self.db.execute('INSERT OR REPLACE INTO checkpoints (chain, block) VALUES (?, ?)',
+                (chain, block))
+
+    # Processed events
+
+    def is_processed(self, event_id):
+        row = self.db.execute('SELECT 1 FROM processed_events WHERE event_id = ?', (event_id,)).fetchone()
+        return row is not None
+
+    def mark_processed(self, event_id):
+        """Returns False if the event was already processed.
+        """
+        with self.batch():
+            cursor = self.db.execute('INSERT OR IGNORE INTO processed_events (event_id) VALUES (?)',
+                (event_id,))
+        return cursor.rowcount == 1
+
+    # Pending mints
+
+    def add_pending_mint(self, event_id, ethereum_contract, amount, lamden_wallet):
+        """Queues a mint for an Ethereum event, unless the event was already processed.
+        Returns whether the mint was queued.
+        """
+        with self.batch():
+            if not self.mark_processed(event_id):
+                return False
+
+            self.db.execute('INSERT INTO pending_mints (event_id, ethereum_contract, amount, lamden_wallet, seen_at) '
+                'VALUES (?, ?, ?, ?, ?)', (event_id, ethereum_contract, amount, lamden_wallet, time.time()))
+        return True
+
+    def pending_mints(self, limit=None):
+        """Returns (event_id, ethereum_contract, amount, lamden_wallet, seen_at) of the oldest
+        pending mints.
+        """
+        return self.db.execute('SELECT event_id, ethereum_contract, amount, lamden_wallet, seen_at '
+            'FROM pending_mints ORDER BY id LIMIT ?', (-1 if limit is None else limit,)).fetchall()
+
+    def count_pending_mints(self):
+        return self.db.execute('SELECT COUNT(*) FROM pending_mints').fetchone()[0]
+
+    def remove_pending_mints(self, event_ids):
+        with self.batch():
+            self.db.executemany('DELETE FROM pending_mints WHERE event_id = ?',
+                [(e,) for e in event_ids])
+
+    def fail_pending_mint(self, event_id, error):
+        """Moves a pending mint the router refused on its own to failed_mints, so it does
+        not hold up the mints queued after it. It stays there until someone looks at it.
+        """
+        with self.batch():
+            self.db.execute('INSERT OR REPLACE INTO failed_mints (event_id, ethereum_contract, amount, '
+                'lamden_wallet, seen_at, failed_at, error) SELECT event_id, ethereum_contract, amount, '
+                'lamden_wallet, seen_at, ?, ? FROM pending_mints WHERE event_id = ?',
+                (time.time(), error, event_id))
+            self.db.execute('DELETE FROM pending_mints WHERE event_id = ?', (event_id,))
+
+    def failed_mints(self):
+        """Returns (event_id, ethereum_contract, amount, lamden_wallet, error) of the failed
+        mints, oldest first.
+        """
+        return self.db.execute('SELECT event_id, ethereum_contract, amount, lamden_wallet, error '
+            'FROM failed_mints ORDER BY failed_at').fetchall()
+
+    def count_failed_mints(self):
+        return self.db.execute('SELECT COUNT(*) FROM failed_mints').fetchone()[0]
+
+    # Burns
+
+    def add_burn(self, abi, tx_hash=None, sequence=None):
+        """Records a burn ABI that still has to be signed, indexed by its keccak256 hash and
+        by address and nonce. tx_hash is the Lamden transaction of the burn and sequence the
+        number router.burn queued it under. Returns False if it is known already.
+        """
+        fields = parse_abi(abi)
+
+        with self.batch():
+            cursor = self.db.execute('INSERT OR IGNORE INTO proofs '
+                '(abi, hash, token, amount, nonce, ethereum_address, tx_hash, sequence, seen_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (abi, Web3.toHex(Web3.keccak(hexstr=abi)), fields['token'], fields['amount'],
+                 fields['nonce'], fields['ethereum_address'], tx_hash, sequence, time.time()))
+        return cursor.rowcount == 1
+
+    def count_unsigned_burns(self):
+        return self.db.execute('SELECT COUNT(*) FROM proofs WHERE signed_abi IS NULL').fetchone()[0]
+
+    def count_unsequenced_burns(self):
+        return self.db.execute('SELECT COUNT(*) FROM proofs WHERE sequence IS NULL').fetchone()[0]
+
+    def set_burn_sequences(self, sequences):
+        """Sets the sequence number of burns that were recorded without one. sequences is a
+        list of (abi, sequence). Returns how many burns got their sequence number.
+        """
+        with self.batch():
+            cursor = self.db.executemany('UPDATE proofs SET sequence = ? WHERE abi = ? AND sequence IS NULL',
+                [(sequence, abi) for abi, sequence in sequences])
+        return cursor.rowcount
+
+    # Epochs
+
+    def last_sealed_sequence(self):
+        row = self.db.execute('SELECT MAX(last_sequence) FROM epochs').fetchone()
+        return row[0] or 0
+
+    def next_epoch(self):
+        """Returns the number of the first epoch that is not recorded yet.
+        """
+        row = self.db.execute('SELECT MAX(epoch) FROM epochs').fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def unsealed_burns(self, limit=None):
+        """Returns (abi, seen_at, tx_hash, sequence) of the oldest burns that do not belong to
+        a sealed epoch yet. Burns without a sequence number come first, as far as the store
+        knows they are not sealed.
+        """
+        return self.db.execute('SELECT abi, seen_at, tx_hash, sequence FROM proofs '
+            'WHERE sequence > ? OR sequence IS NULL ORDER BY sequence LIMIT ?',
+            (self.last_sealed_sequence(), -1 if limit is None else limit)).fetchall()
+
+    def count_unsealed_burns(self):
+        return self.db.execute('SELECT COUNT(*) FROM proofs WHERE sequence > ? OR sequence IS NULL',
+            (self.last_sealed_sequence(),)).fetchone()[0]
+
+    def add_epoch(self, epoch, first_sequence, last_sequence):
+        """Records a sealed epoch of the router, which holds the burns queued under
+        first_sequence to last_sequence.
+        """
+        with self.batch():
+            self.db.execute('INSERT OR IGNORE INTO epochs (epoch, first_sequence, last_sequence, sealed_at) '
+                'VALUES (?, ?, ?, ?)', (epoch, first_sequence, last_sequence, time.time()))
+
+    def unsigned_epochs(self):
+        """Returns (epoch, first_sequence, last_sequence) of the sealed epochs whose root is
+        not signed yet, oldest first.
+        """
+        return self.db.execute('SELECT epoch, first_sequence, last_sequence FROM epochs '
+            'WHERE signed_root IS NULL ORDER BY epoch').fetchall()
+
+    def epoch_burns(self, first_sequence, last_sequence):
+        """Returns (abi, seen_at, tx_hash, sequence) of the recorded burns of an epoch, in the
+        order they were queued. Burns of blocks that were not scanned yet are missing.
+        """
+        return self.db.execute('SELECT abi, seen_at, tx_hash, sequence FROM proofs '
+            'WHERE sequence BETWEEN ? AND ? ORDER BY sequence', (first_sequence, last_sequence)).fetchall()
+
+    def set_epoch_signature(self, epoch, root, signed_root, proofs):
+        """Stores the signed Merkle root of an epoch. proofs is a list of (abi, proof), proof
+        being the inclusion path of the burn as a list of hex strings. The signature of the
+        root is the signature of every burn in it.
+        """
+        signed_at = time.time()
+
+        with self.batch():
+            self.db.execute('UPDATE epochs SET root = ?, signed_root = ?, signed_at = ? WHERE epoch = ?',
+                (root, signed_root, signed_at, epoch))
+            self.db.executemany('UPDATE proofs SET signed_abi = ?, proof = ?, signed_at = ? WHERE abi = ?',
+                [(signed_root, json.dumps(proof), signed_at, abi) for abi, proof in proofs])
+
+    def unposted_epochs(self, limit=None):
+        """Returns (epoch, first_sequence, last_sequence, root, signed_root, signed_at) of the
+        oldest signed epochs whose root is not posted yet.
+        """
+        return self.db.execute('SELECT epoch, first_sequence, last_sequence, root, signed_root, signed_at '
+            'FROM epochs WHERE signed_root IS NOT NULL AND posted = 0 ORDER BY epoch LIMIT ?',
+            (-1 if limit is None else limit,)).fetchall()
+
+    def count_unposted_epochs(self):
+        return self.db.execute('SELECT COUNT(*) FROM epochs '
+            'WHERE signed_root IS NOT NULL AND posted = 0').fetchone()[0]
+
+    def mark_epochs_posted(self, epochs):
+        with self.batch():
+            for epoch in epochs:
+                self.db.execute('UPDATE epochs SET posted = 1 WHERE epoch = ?', (epoch,))
+                self.db.execute('UPDATE proofs SET posted = 1 WHERE sequence BETWEEN '
+                    '(SELECT first_sequence FROM epochs WHERE epoch = ?) AND '
+                    '(SELECT last_sequence FROM epochs WHERE epoch = ?)', (epoch, epoch))
+
+    # Proofs
+
+    def get_proof(self, abi):
+        row = self.db.execute('SELECT signed_abi FROM proofs WHERE abi = ?', (abi,)).fetchone()
+        return None if row is None else row[0]
+
+    def find_proof(self, abi_hash=None, ethereum_address=None, nonce=None):
+        """Returns the signed proof with the given ABI hash, or of the given address and
+        nonce, as a dict. proof is the inclusion path of the burn in its epoch. Returns None if
+        there is no signed proof for it.
+        """
+        if abi_hash is not None:
+            where, args = 'hash = ?', (abi_hash.lower(),)
+        else:
+            where, args = 'ethereum_address = ? AND nonce = ?', (ethereum_address.lower(), nonce)
+
+        row = self.db.execute(f'SELECT {", ".join(PROOF_COLUMNS)} FROM proofs '
+            f'WHERE {where} AND signed_abi IS NOT NULL', args).fetchone()
+        if row is None:
+            return None
+
+        proof = dict(zip(PROOF_COLUMNS, row))
+        proof['proof'] = json.loads(proof['proof']) if proof['proof'] else []
+        return proof
+
+
+class ChainCheckpoint:
+    """The last processed block of one chain, in the interface Backfill and LamdenScanner use.
+    """
+    def __init__(self, store, chain, start_block=0):
+        self.store = store
+        self.chain = chain
+        self.start_block = start_block
+
+    def load(self):
+        return self.store.get_checkpoint(self.chain, self.start_block - 1)
+
+    def save(self, block):
+        self.store.set_checkpoint(self.chain, block)
+
+    def batch(self):
+        return self.store.batch()
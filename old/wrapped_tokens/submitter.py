@@ -0,0 +1,163 @@
+import asyncio
+
+from lamden.crypto.transaction import build_transaction
+
+from metrics import TRANSACTION_FAILURES
+
+# Sends transactions to the operator's Lamden contract and waits for their results.
+#
+# The wallet's nonce is tracked locally, so a transaction can be signed and sent without
+# asking the masternode first. Up to max_in_flight transactions wait for their results
+# at the same time. Sending itself is serialized, because the masternode rejects a
+# nonce that is lower than one it has already seen.
+#
+# When the masternode rejects a transaction, the nonce is resynced and the transaction
+# is sent again. When the result of a transaction does not show up in time, the nonce is
+# resynced as well. Only if its nonce is still unused was the transaction dropped, and
+# only then is it sent again. Once the nonce is used, the transaction is never sent again:
+# it may have been processed with its result lagging behind, and sending it twice would
+# run it twice. Its result is waited for once more, and if it still does not show up,
+# send raises a TimeoutError and the caller has to find out from the contract's state.
+#
+# Masternodes track pending nonces on their own, so masternodes should be an Upstream
+# with a single host, e.g. Masternodes.pinned(). Results and variables can be read from
+# any masternode, through readers, with hedged requests.
+
+
+class TransactionFailed(Exception):
+    pass
+
+
+class TransactionReverted(TransactionFailed):
+    """The transaction was processed, but the contract raised. Sending it again as it is
+    fails the same way.
+    """
+
+
+class Submitter:
+    def __init__(self, masternodes, wallet, contract_name, readers=None, max_in_flight=16,
+                 max_resubmits=3, result_timeout=60, poll_interval=1):
+        # sessions.Upstream of the Lamden masternodes
+        self.masternodes = masternodes
+        self.readers = readers or masternodes
+        self.wallet = wallet
+        self.contract_name = contract_name
+
+        self.max_resubmits = max_resubmits
+        self.result_timeout = result_timeout
+        self.poll_interval = poll_interval
+
+        self.nonce = None
+        self.processor = None
+
+        self.send_lock = asyncio.Lock()
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+
+    async def get_nonce(self):
+        data = await self.masternodes.get_json(f'/nonce/{self.wallet.verifying_key}')
+        return data['nonce'], data['processor']
+
+    async def resync(self):
+        self.nonce, self.processor = await self.get_nonce()
+
+    async def get_variable(self, variable, key=None):
+        """Returns the value of a variable of the contract, or of key in one of its Hashes.
+        The key of a Hash with several dimensions is a tuple. Returns None if it is not set.
+        """
+        if isinstance(key, tuple):
+            key = ','.join(str(k) for k in key)
+
+        params = {} if key is None else {'key': key}
+        response = await self.readers.hedged_request('GET', f'/contracts/{self.contract_name}/{variable}',
+            params=params)
+
+        # Masternodes answer unset values with 404
+        if response.status_code == 404:
+            return None
+
+        response.raise_for_status()
+        return response.json()['value']
+
+    async def get_result(self, tx_hash):
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self.result_timeout
+
+        while loop.time() < deadline:
+            response = await self.readers.hedged_request('GET', '/tx', params={'hash': tx_hash})
+            if response.status_code == 200:
+                result = response.json()
+                if 'error' not in result:
+                    return result
+
+            await asyncio.sleep(self.poll_interval)
+
+        return None
+
+    async def post(self, function, kwargs, stamps):
+        """Signs the transaction with the next local nonce and sends it. Returns the nonce
+        and the transaction hash.
+        """
+        async with self.send_lock:
+            if self.nonce is None:
+                await self.resync()
+
+            for attempt in range(self.max_resubmits + 1):
+                tx = build_transaction(wallet=self.wallet, contract=self.contract_name,
+                    function=function, kwargs=kwargs, nonce=self.nonce, processor=self.processor,
+                    stamps=stamps)
+
+                reply = await self.masternodes.post_json('/', tx)
+
+                if 'error' not in reply:
+                    nonce = self.nonce
+                    self.nonce += 1
+                    return nonce, reply['hash']
+
+                # Most likely the local nonce is out of date
+                await self.resync()
+
+            TRANSACTION_FAILURES.labels(function, 'rejected').inc()
+            raise TransactionFailed(reply['error'])
+
+    async def send(self, function, kwargs, stamps, on_posted=None):
+        """Sends one transaction and returns its result once it is in a block. Raises
+        TransactionFailed if the transaction was rejected, TransactionReverted if it did not
+        succeed, and TimeoutError
+        if its result did not show up, in which case it may or may not have been processed.
+
+        on_posted is called with the transaction hash every time the masternode accepted
+        the transaction.
+        """
+        async with self.in_flight:
+            for attempt in range(self.max_resubmits + 1):
+                nonce, tx_hash = await self.post(function, kwargs, stamps)
+                if on_posted is not None:
+                    on_posted(tx_hash)
+
+                result = await self.get_result(tx_hash)
+
+                if result is not None:
+                    break
+
+                async with self.send_lock:
+                    await self.resync()
+                    processed = self.nonce > nonce
+
+                if processed:
+                    result = await self.get_result(tx_hash)
+                    if result is not None:
+                        break
+
+                    TRANSACTION_FAILURES.labels(function, 'lost').inc()
+                    raise TimeoutError(f'Result of transaction {tx_hash} did not show up, '
+                        f'but its nonce {nonce} was used')
+            else:
+                TRANSACTION_FAILURES.labels(function, 'dropped').inc()
+                raise TimeoutError(f'Transaction was dropped {self.max_resubmits + 1} times')
+
+        if result['status'] != 0:
+            # The result is the repr of the exception, e.g. AssertionError('Only owner can call!')
+            TRANSACTION_FAILURES.labels(function, str(result['result']).split('(')[0]).inc()
+            raise TransactionReverted(result['result'])
+
+        return result
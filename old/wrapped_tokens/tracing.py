@@ -0,0 +1,137 @@
+import asyncio
+import hashlib
+import json
+import os
+
+from metrics import observe_stage
+
+# Traces of single transfers through the operator, in OpenTelemetry's OTLP/JSON format.
+#
+# Every transfer has a trace, whose ID is derived from the key of the transfer: the event
+# ID (transaction hash and log index) of a deposit, or the Lamden transaction hash of a
+# burn. Every stage a transfer passes adds a span to its trace, lasting from the stage
+# before it to this one (see metrics.py for the stages).
+#
+# Spans are buffered and written every flush_interval seconds, or as soon as max_buffer
+# spans are waiting, either as one JSON line per flush to a file or to the /v1/traces
+# endpoint of a collector. Without an exporter, nothing is buffered at all.
+
+SERVICE_NAME = 'wrapped-tokens-operator'
+
+SPAN_KIND_INTERNAL = 1
+
+
+def trace_id(key):
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def attribute(key, value):
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+def make_span(key, name, start, end, **attributes):
+    return {
+        'traceId': trace_id(key),
+        'spanId': os.urandom(8).hex(),
+        'name': name,
+        'kind': SPAN_KIND_INTERNAL,
+        'startTimeUnixNano': str(int(start * 1e9)),
+        'endTimeUnixNano': str(int(max(start, end) * 1e9)),
+        'attributes': [attribute('transfer.key', key)] +
+            [attribute(k, v) for k, v in attributes.items() if v is not None],
+    }
+
+
+def export_request(spans):
+    """Wraps spans into an ExportTraceServiceRequest.
+    """
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': [attribute('service.name', SERVICE_NAME)]},
+            'scopeSpans': [{
+                'scope': {'name': __name__},
+                'spans': spans,
+            }],
+        }],
+    }
+
+
+class FileExporter:
+    def __init__(self, path):
+        self.path = path
+
+    async def export(self, request):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(request) + '\n')
+
+
+class CollectorExporter:
+    def __init__(self, upstream):
+        # sessions.Upstream of the collector's OTLP/HTTP endpoint
+        self.upstream = upstream
+
+    async def export(self, request):
+        response = await self.upstream.request('POST', '/v1/traces', json=request)
+        response.raise_for_status()
+
+
+class Tracer:
+    def __init__(self, exporter=None, flush_interval=5, max_buffer=512):
+        self.exporter = exporter
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+
+        self.spans = []
+        self.wakeup = asyncio.Event()
+        self.is_running = False
+
+    def add(self, key, name, start, end, **attributes):
+        if self.exporter is None:
+            return
+
+        self.spans.append(make_span(key, name, start, end, **attributes))
+        if len(self.spans) >= self.max_buffer:
+            self.wakeup.set()
+
+    async def flush(self):
+        spans, self.spans = self.spans, []
+        if not spans:
+            return
+
+        try:
+            await self.exporter.export(export_request(spans))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f'Could not export {len(spans)} spans: {e}')
+
+    async def serve(self):
+        self.is_running = True
+
+        while self.is_running:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self.wakeup.clear()
+            await self.flush()
+
+    def stop(self):
+        self.is_running = False
+        self.wakeup.set()
+
+
+# Configured by WebServer, the stages record their spans here
+TRACER = Tracer()
+
+
+def record_stage(stage, key, start, end, **attributes):
+    """Records that a transfer reached a stage, in the stage histogram and in its trace.
+    """
+    observe_stage(stage, end - start)
+    TRACER.add(key, stage, start, end, **attributes)
@@ -35,8 +35,27 @@ async function getBlockDetails(blockNo) {
     }
 }
 
+// Returns null for unset values, which masternodes answer with 404, like
+// Submitter.get_variable of the Python operator
+async function getVariable(contract, variable, key) {
+    try {
+        const query = key === undefined ? '' : `?key=${key}`
+        const { data } = await axios.get(`${baseURL}/contracts/${contract}/${variable}${query}`)
+        if (!data) {
+            throw new Error('Value not recieved');
+        }
+        return data.value === undefined ? null : data.value;
+    } catch (error) {
+        if (error.response && error.response.status === 404) {
+            return null;
+        }
+        throw new Error('Something went wrong');
+    }
+}
+
 
 module.exports = {
     getLatestBlockNumber,
-    getBlockDetails
+    getBlockDetails,
+    getVariable
 }
\ No newline at end of file
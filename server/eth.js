@@ -10,7 +10,9 @@ const ETH_CONTRACT_ADDRESS = conf.eth.contract_address;
 const LAMDEN_CONTRACT_NAME = conf.lamden.contract;
 const LAMDEN_NETWORK_INFO = conf.lamden.network;
 
-async function mintTokens(tokenAddress, receiver, amount) {
+// eventId is "<transaction hash>:<log index>" of the TokensWrapped event, the router mints
+// every deposit only once
+async function mintTokens(tokenAddress, receiver, amount, eventId) {
     const { vk, sk } = conf.lamden.wallet;
     const txInfo = {
         senderVk: vk,
@@ -19,7 +21,8 @@ async function mintTokens(tokenAddress, receiver, amount) {
         kwargs: {
             ethereum_contract: tokenAddress,
             amount: amount,
-            lamden_wallet: receiver
+            lamden_wallet: receiver,
+            event_id: eventId
         },
         stampLimit: 65,
     }
@@ -38,7 +41,8 @@ async function ethEventListener(){
     .on('data', async (event) => {
         console.log(event.returnValues)
         const { token, receiver, amount } = event.returnValues;
-        const res = await mintTokens(token, receiver, '0x' + web3.utils.toBN(amount).toString('hex'));
+        const eventId = `${event.transactionHash}:${event.logIndex}`;
+        const res = await mintTokens(token, receiver, '0x' + web3.utils.toBN(amount).toString('hex'), eventId);
         console.log(res);
     })
     .on('error', console.error);
@@ -16,6 +16,8 @@ const grabber = require('./block-grabber');
 
 const LAMDEN_CONTRACT_NAME = conf.lamden.contract;
 const LAMDEN_NETWORK_INFO = conf.lamden.network;
+// Upper bound on the proofs posted in one post_proofs transaction
+const MAX_PROOFS_PER_TX = 50;
 
 const lamdenWallet = Lamden.wallet.create_wallet({ sk: conf.lamden.wallet.sk })
 const network = new Lamden.Network(LAMDEN_NETWORK_INFO)
@@ -24,12 +26,9 @@ function setupDatabse() {
     // @ts-ignore
     const adapter = new FileSync('./db/db.json');
     const db = low(adapter)
-    const lamden_block = db.getState().lastChecked;
-    if (!lamden_block) {
-        db.defaults({
-            "lamden_block": 21327
-        }).write()
-    }
+    db.defaults({
+        "lamden_sequence": 0
+    }).write()
     return db;
 }
 
@@ -39,22 +38,23 @@ function sign(data) {
     return web3.eth.accounts.sign(data, conf.eth.privKey)
 }
 
-async function checkBlock(blockNo) {
-    const block = await grabber.getBlockDetails(blockNo);
-    if (block.subblocks && block.subblocks !== "undefined") {
-        for (const sb of block.subblocks) {
-            for (const tx of sb.transactions) {
-                if (tx.transaction.payload.contract === LAMDEN_CONTRACT_NAME) {
-                    if (!tx.result.startsWith('AssertionError(') && tx.status === 0) {
-                        if (tx.transaction.payload.function === 'burn') {
-                            return tx.result.substring(1, tx.result.length-1)
-                        }
-                    }
-                }
-            }
-        }
+// Burns are queued by the contract under consecutive sequence numbers starting at 1.
+// The router sets sequence to 0 when it is deployed, so a missing value means the contract
+// predates the queue and has to be redeployed.
+async function getSequence() {
+    const sequence = await grabber.getVariable(LAMDEN_CONTRACT_NAME, 'sequence');
+    if (sequence === null) {
+        throw new Error(`${LAMDEN_CONTRACT_NAME} has no sequence variable, redeploy lamden/router.py`);
+    }
+    return Number(sequence);
+}
+
+async function getQueuedABI(sequence) {
+    const abi = await grabber.getVariable(LAMDEN_CONTRACT_NAME, 'queue', sequence);
+    if (abi === null) {
+        throw new Error(`${LAMDEN_CONTRACT_NAME} has no ABI queued under ${sequence}`);
     }
-    return 'Not Found';
+    return abi;
 }
 
 async function submitProof(hashed_abi, signed_abi) {
@@ -74,35 +74,59 @@ async function submitProof(hashed_abi, signed_abi) {
     return tx.checkForTransactionResult()
 }
 
+// pairs is a list of [hashed_abi, signed_abi]
+async function submitProofs(pairs) {
+    const { vk, sk } = lamdenWallet;
+    const txInfo = {
+        senderVk: vk,
+        contractName: LAMDEN_CONTRACT_NAME,
+        methodName: "post_proofs",
+        kwargs: {
+            pairs
+        },
+        stampLimit: 65 * pairs.length,
+    }
+    const tx = new Lamden.TransactionBuilder(LAMDEN_NETWORK_INFO, txInfo)
+    await tx.send(sk)
+    return tx.checkForTransactionResult()
+}
+
 async function main(db) {
-    const latestBlock = await grabber.getLatestBlockNumber(); 
-    const lastCheckedBlock = db.get('lamden_block').value();
-    console.log('Last Block Checked: ', lastCheckedBlock);
-    console.log('Latest Block Number: ', latestBlock);
-
-    for (let blockNo = lastCheckedBlock + 1; blockNo <= latestBlock; blockNo++) {
-        console.log('Checking: ', blockNo)
-        const unSignedABI = await checkBlock(blockNo);
-        if (unSignedABI !== 'Not Found') {
-            try {
+    const latestSequence = await getSequence();
+    const lastSequence = db.get('lamden_sequence').value();
+    console.log('Last Sequence Processed: ', lastSequence);
+    console.log('Latest Sequence: ', latestSequence);
+
+    // Burns are signed in order, so stop at the first failure and retry it on the next poll
+    for (let first = lastSequence + 1; first <= latestSequence; first += MAX_PROOFS_PER_TX) {
+        const last = Math.min(first + MAX_PROOFS_PER_TX - 1, latestSequence);
+        console.log('Processing: ', first, 'to', last)
+        try {
+            const pairs = [];
+            for (let sequence = first; sequence <= last; sequence++) {
+                const unSignedABI = await getQueuedABI(sequence);
                 console.log(unSignedABI)
                 let signedABIObj = sign(unSignedABI);
                 console.log(signedABIObj)
-                const signedABI = signedABIObj.signature;
-                const r = await submitProof(unSignedABI, signedABI);
-
-                if (r && r.result && !r.result.startsWith('AssertionError(') && r.status === 0) {
-                    console.log('Submitted Sucessfully')
-                    db.set('lamden_block', blockNo).write();
-                } else {
-                    console.log('Ops! There was an error')
-                    console.log(r)
-                }
-            } catch (error) {
-                console.log(error)                
+                pairs.push([unSignedABI, signedABIObj.signature]);
+            }
+
+            // A single proof is cheaper to post on its own
+            const r = pairs.length === 1
+                ? await submitProof(pairs[0][0], pairs[0][1])
+                : await submitProofs(pairs);
+
+            if (r && r.result && !r.result.startsWith('AssertionError(') && r.status === 0) {
+                console.log('Submitted Sucessfully')
+                db.set('lamden_sequence', last).write();
+            } else {
+                console.log('Ops! There was an error')
+                console.log(r)
+                break;
             }
-        } else {
-            db.set('lamden_block', blockNo).write();
+        } catch (error) {
+            console.log(error)
+            break;
         }
     }
 }
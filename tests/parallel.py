@@ -0,0 +1,122 @@
+#tests/parallel.py
+import argparse
+import io
+import multiprocessing
+import os
+import sys
+import time
+import unittest
+
+# Runs the test classes on several processes at once:
+#   python3 -m tests.parallel [-j WORKERS] [--storage memory|mongo] [module ...]
+#
+# Every worker process gets its own contract storage from tests.util.make_client (its own
+# MongoDB collection, or dicts in memory), so classes on different workers never see each
+# other's contracts. The classes are spread over the workers by their number of tests,
+# in a fixed order, and each worker runs its classes one after the other.
+
+MODULES = ["tests.test_router", "tests.test_lamden_bridge", "tests.test_static",
+    "tests.wrapped_tokens.test_backfill", "tests.wrapped_tokens.test_dispatcher",
+    "tests.wrapped_tokens.test_lamden_scanner", "tests.wrapped_tokens.test_listener",
+    "tests.wrapped_tokens.test_lookup", "tests.wrapped_tokens.test_masternodes",
+    "tests.wrapped_tokens.test_merkle", "tests.wrapped_tokens.test_metrics",
+    "tests.wrapped_tokens.test_notifications", "tests.wrapped_tokens.test_sessions",
+    "tests.wrapped_tokens.test_signer", "tests.wrapped_tokens.test_stamps",
+    "tests.wrapped_tokens.test_state", "tests.wrapped_tokens.test_submitter",
+    "tests.wrapped_tokens.test_tracing"]
+
+
+def use_storage(worker, storage):
+    # Has to happen before a test module is imported, as they create their client on import
+    os.environ["TEST_WORKER"] = str(worker)
+    os.environ["CONTRACT_STORAGE"] = storage
+
+
+def collect(modules, storage):
+    """Returns {class name: number of tests} of all test classes in modules.
+    """
+    use_storage("collect", storage)
+
+    classes = {}
+    for test in iterTests(unittest.defaultTestLoader.loadTestsFromNames(modules)):
+        name = f"{type(test).__module__}.{type(test).__qualname__}"
+        classes[name] = classes.get(name, 0) + 1
+    return classes
+
+
+def iterTests(suite):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from iterTests(test)
+        else:
+            yield test
+
+
+def shard(classes, workers):
+    """Spreads the classes over at most workers shards with about the same number of tests.
+    """
+    shards = [[] for _ in range(min(workers, len(classes)))]
+    sizes = [0] * len(shards)
+
+    for name in sorted(classes, key=lambda name: (-classes[name], name)):
+        i = sizes.index(min(sizes))
+        shards[i].append(name)
+        sizes[i] += classes[name]
+
+    return [sorted(names) for names in shards]
+
+
+def run(worker, names, storage, verbosity):
+    use_storage(worker, storage)
+
+    stream = io.StringIO()
+    suite = unittest.defaultTestLoader.loadTestsFromNames(names)
+    result = unittest.TextTestRunner(stream=stream, verbosity=verbosity).run(suite)
+
+    return {
+        "run": result.testsRun,
+        "failures": len(result.failures),
+        "errors": len(result.errors),
+        "skipped": len(result.skipped),
+        "ok": result.wasSuccessful(),
+        "output": stream.getvalue(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the test classes in parallel")
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--storage", choices=["memory", "mongo"],
+        default=os.environ.get("CONTRACT_STORAGE", "mongo"))
+    parser.add_argument("-v", "--verbose", action="store_const", const=2, default=1)
+    args = parser.parse_args()
+
+    start = time.time()
+
+    # New processes instead of forks, and one task per process: a worker must not inherit
+    # test modules that were imported with the storage of another worker
+    context = multiprocessing.get_context("spawn")
+
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        classes = pool.apply(collect, (args.modules, args.storage))
+
+    shards = shard(classes, args.workers)
+
+    with context.Pool(len(shards), maxtasksperchild=1) as pool:
+        results = pool.starmap(run,
+            [(i, names, args.storage, args.verbose) for i, names in enumerate(shards)])
+
+    for i, result in enumerate(results):
+        print(f"Worker {i}: {', '.join(shards[i])}")
+        print(result["output"])
+
+    total = {k: sum(result[k] for result in results) for k in ("run", "failures", "errors", "skipped")}
+    print(f"Ran {total['run']} tests on {len(shards)} workers in {time.time() - start:.3f}s "
+        f"({total['failures']} failures, {total['errors']} errors, {total['skipped']} skipped)")
+
+    return 0 if all(result["ok"] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
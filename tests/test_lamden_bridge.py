@@ -1,10 +1,10 @@
 #tests/test_lamden_bridge.py
+import hashlib
 import unittest
 
-from contracting.client import ContractingClient
-from tests.util import submit_compiled
+from tests.util import submit_compiled, submit_cached, make_client
 
-client = ContractingClient()
+client = make_client()
 
 ETH_TOKEN = "0xF08eF1668524a98893D97F16Ad134dA8cccefb03"
 ETH_ADDRESS = "0xEA674fdDe714fd979de3EdF0F56AA9716B898ec8"
@@ -25,7 +25,7 @@ class TestLamdenBridge(unittest.TestCase):
             code = f.read()
             args = {"contract_address": ETH_TOKEN,
                 "decimals":18}
-            self.c.submit(code, name="lamden_bridge", constructor_args=args)
+            submit_cached(self.c, code, name="lamden_bridge", constructor_args=args)
             self.l_bridge = self.c.get_contract("lamden_bridge")    
 
     def tearDown(self):
@@ -277,6 +277,12 @@ class TestLamdenBridge(unittest.TestCase):
             current_Nonce = self.getNonce()
             self.assertEqual(current_Nonce, supposed_Nonce)
 
+            # Deposits are queued in order, and the queued ABI hashes to the returned value
+            sequence = self.l_bridge.quick_read(variable="sequence")
+            self.assertEqual(sequence, supposed_Nonce)
+            queued_abi = self.l_bridge.quick_read(variable="queue", key=sequence)
+            self.assertEqual(hashlib.sha3_256(bytes.fromhex(queued_abi)).hexdigest(), case[1])
+
         for case in fail_cases:
             with self.assertRaises(BaseException):
                 result = self.l_bridge.deposit(signer="user", **case)
@@ -363,6 +369,29 @@ class TestLamdenBridge(unittest.TestCase):
             with self.assertRaises(BaseException, msg=f"Failure Case {i}"):
                 self.l_bridge.post_proof(**case)
 
+    def test_post_proofs(self):
+        pairs = [["abc", "def"], ["ghi", "ijk"], ["lmn", "opq"]]
+
+        self.l_bridge.post_proofs(signer=self.c.signer, pairs=pairs)
+
+        for hashed_abi, signed_abi in pairs:
+            posted_proof = self.l_bridge.quick_read(variable="proofs", key=hashed_abi)
+            self.assertEqual(posted_proof, signed_abi)
+
+        fail_cases = [
+            # Non-owner tries to post proofs
+            {"signer": "foreigner", "pairs": [["rst", "uvw"]]},
+            # Pairs that are not (hashed_abi, signed_abi)
+            {"signer": self.c.signer, "pairs": [["rst"]]},
+            {"signer": self.c.signer, "pairs": [["rst", "uvw", "xyz"]]},
+        ]
+
+        for i, case in enumerate(fail_cases):
+            with self.assertRaises(BaseException, msg=f"Failure Case {i}"):
+                self.l_bridge.post_proofs(**case)
+
+            self.assertIsNone(self.l_bridge.quick_read(variable="proofs", key="rst"))
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
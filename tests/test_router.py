@@ -1,14 +1,16 @@
 #tests/test_router.py
 import unittest
-from contracting.client import ContractingClient
-from tests.util import getAllHashValues, randomEthAddress
+from tests.util import getAllHashValues, randomEthAddress, StateSnapshot, submit_cached, make_client
 from contracting.stdlib.bridge import decimal
 
-client = ContractingClient()
+client = make_client()
 
 # Necessary so that token contract allows router to mint
 ROUTER_NAME = "con_clearing_house_62"
 
+def eventId(i, log_index=0):
+    return f"0x{i:064x}:{log_index}"
+
 def calcBalances(client, token_name, transactions):
     balances = getAllHashValues(client, token_name, "balances")
     for k, v in balances.items():
@@ -48,30 +50,36 @@ def incrementNonces(nonces, *accounts):
     return nonces
 
 class TestRouter(unittest.TestCase):
-    def setUp(self):
-        self.c = client
-        self.c.flush()
+    @classmethod
+    def setUpClass(cls):
+        cls.c = client
+        cls.c.flush()
 
         with open("lamden/router.py") as f:
             code = f.read()
-            self.c.submit(code, name=ROUTER_NAME)
-            self.router = self.c.get_contract(ROUTER_NAME)    
+            submit_cached(cls.c, code, name=ROUTER_NAME)
+            cls.router = cls.c.get_contract(ROUTER_NAME)    
 
         with open("lamden/token.py") as f:
-            self.token_code = f.read()
-            self.c.submit(self.token_code, "token1")
-            self.token1 = self.c.get_contract("token1")
+            cls.token_code = f.read()
+            submit_cached(cls.c, cls.token_code, "token1")
+            cls.token1 = cls.c.get_contract("token1")
+
+        cls.snapshot = StateSnapshot(cls.c)
+
+    def setUp(self):
+        self.snapshot.restore()
 
 
-    def tearDown(self):
-        self.c.flush()
+    @classmethod
+    def tearDownClass(cls):
+        cls.c.flush()
 
 
     def test_mint(self):
         ETH_TOKEN1 = randomEthAddress() # for well suited token
         ETH_TOKEN2 = randomEthAddress() # for well suited token
         ETH_TOKEN3 = randomEthAddress() # for unregistered token
-        ETH_TOKEN4 = randomEthAddress() # for token with decimal=None
 
         # If a dict has a 'add_token' key, the contracts are flushed, resubmitted and the 
         # token (as described by the correspoding value of key 'add_token') is resubmitted and added 
@@ -84,24 +92,24 @@ class TestRouter(unittest.TestCase):
                 {"ethereum_contract": ETH_TOKEN1 , "lamden_contract": "token1", "decimals": 18},
             "mint":
                 {"signer": self.c.signer, "ethereum_contract": ETH_TOKEN1, "amount": "0x10",
-                    "lamden_wallet": "user"}},
+                    "lamden_wallet": "user", "event_id": eventId(1)}},
             {"mint":
                 {"signer": self.c.signer, "ethereum_contract": ETH_TOKEN1, "amount": "10",
-                "lamden_wallet": "user"}},
+                "lamden_wallet": "user", "event_id": eventId(2)}},
             {"mint":
                 {"signer": self.c.signer, "ethereum_contract": ETH_TOKEN1, "amount": "0x10",
-                "lamden_wallet": ROUTER_NAME}},
+                "lamden_wallet": ROUTER_NAME, "event_id": eventId(3)}},
             {"add_token": 
                 {"ethereum_contract": ETH_TOKEN2, "lamden_contract": "token1", "decimals": 0},
             "mint":
                 {"signer": self.c.signer, "ethereum_contract": ETH_TOKEN2, "amount": "10",
-                "lamden_wallet": "user"}},
+                "lamden_wallet": "user", "event_id": eventId(4)}},
             {"mint":
                 {"signer": self.c.signer, "ethereum_contract": ETH_TOKEN2, "amount": "10",
-                "lamden_wallet": self.c.signer}},
+                "lamden_wallet": self.c.signer, "event_id": eventId(5)}},
             {"mint":
                 {"signer": self.c.signer, "ethereum_contract": ETH_TOKEN2, "amount": "10",
-                "lamden_wallet": ROUTER_NAME}},
+                "lamden_wallet": ROUTER_NAME, "event_id": eventId(6)}},
         ]
 
         fail_cases=[
@@ -110,85 +118,76 @@ class TestRouter(unittest.TestCase):
                 {"ethereum_contract": ETH_TOKEN1 , "lamden_contract": "token1", "decimals": 18},
             "mint":
                 {"signer": self.c.signer, "ethereum_contract": ETH_TOKEN1, "amount": "text",
-                "lamden_wallet": "user"},
+                "lamden_wallet": "user", "event_id": eventId(7)},
             "msg":
                 "Impossible amount could be minted"},
             {"mint":
                 {"signer": self.c.signer, "ethereum_contract": ETH_TOKEN1, "amount": "-0x14",
-                "lamden_wallet": "user"},
+                "lamden_wallet": "user", "event_id": eventId(8)},
             "msg":
                 "Impossible amount could be minted"},
             {"mint":
                 {"signer": self.c.signer, "ethereum_contract": ETH_TOKEN1, "amount": "",
-                "lamden_wallet": "user"},
+                "lamden_wallet": "user", "event_id": eventId(9)},
             "msg":
                 "Impossible amount could be minted"},
             {"mint":
                 {"signer": self.c.signer, "ethereum_contract": ETH_TOKEN1, "amount": None,
-                "lamden_wallet": "user"},
+                "lamden_wallet": "user", "event_id": eventId(10)},
             "msg":
                 "Impossible amount could be minted"},
 
             # Non-onwer trying to mint
             {"mint":
                 {"signer": "foreigner", "ethereum_contract": ETH_TOKEN1, "amount": "0x14",
-                "lamden_wallet": "user"},
+                "lamden_wallet": "user", "event_id": eventId(11)},
             "msg":
                 "Non-owner is able to mint, but shouldn't"},
             {"mint":
                 {"signer": "user", "ethereum_contract": ETH_TOKEN1, "amount": "0x14",
-                "lamden_wallet": "user"},
+                "lamden_wallet": "user", "event_id": eventId(12)},
             "msg":
                 "Non-owner is able to mint, but shouldn't"},
             {"mint":
                 {"signer": "user", "ethereum_contract": ETH_TOKEN1, "amount": "0x14",
-                "lamden_wallet": self.c.signer},
+                "lamden_wallet": self.c.signer, "event_id": eventId(13)},
             "msg":
                 "Non-owner is able to mint, but shouldn't"},
             {"mint":
                 {"signer": "user", "ethereum_contract": ETH_TOKEN1, "amount": "0x14",
-                    "lamden_wallet": ROUTER_NAME},
+                    "lamden_wallet": ROUTER_NAME, "event_id": eventId(14)},
             "msg":
                 "Non-owner is able to mint, but shouldn't"},
             {"mint":
                 {"signer": "user", "ethereum_contract": ETH_TOKEN1, "amount": "0x14",
-                    "lamden_wallet": None},
+                    "lamden_wallet": None, "event_id": eventId(15)},
             "msg":
                 "Non-owner is able to mint, but shouldn't"},
 
             # Unregistered ethereum token
             {"mint":
                 {"signer": self.c.signer, "ethereum_contract": ETH_TOKEN3, "amount": "0x14",
-                "lamden_wallet": "user"},
+                "lamden_wallet": "user", "event_id": eventId(16)},
             "msg":
                 "An unsupported ethereum token was able to be minted"},
             {"mint":
                 {"signer": self.c.signer, "ethereum_contract": None, "amount": "0x14",
-                "lamden_wallet": "user"},
+                "lamden_wallet": "user", "event_id": eventId(17)},
             "msg":
                 "An unsupported ethereum token was able to be minted"},
             {"add_token": 
                     {"ethereum_contract": ETH_TOKEN1, "lamden_contract": "token1", "decimals": 18},
             "mint":
                 {"signer": self.c.signer, "ethereum_contract": ETH_TOKEN3, "amount": "0x14",
-                "lamden_wallet": "user"},
+                "lamden_wallet": "user", "event_id": eventId(18)},
             "msg":
                 "An unsupported ethereum token was able to be minted"},
-
-            # bad decimals
-            {"add_token": 
-                {"ethereum_contract": ETH_TOKEN4, "lamden_contract": "token1", "decimals": None},
-            "mint":
-                {"signer": self.c.signer, "ethereum_contract": ETH_TOKEN4, "amount": "0x14",
-                "lamden_wallet": "user"},
-            "msg":
-                "Impossible amount of decimals shouldn't work"},
         ]
 
         for i, case in enumerate(test_cases):
             with self.subTest(i=i):
                 if "add_token" in case:
-                    self.setUp()
+                    self.snapshot.restore()
                     decimals = case["add_token"]["decimals"]
                     self.router.add_token(**(case["add_token"]))
 
@@ -205,7 +204,7 @@ class TestRouter(unittest.TestCase):
         for i, case in enumerate(fail_cases):
             with self.subTest(i=i):
                 if "add_token" in case:
-                    self.setUp()
+                    self.snapshot.restore()
                     decimals = case["add_token"]["decimals"]
                     self.router.add_token(**(case["add_token"]))
 
@@ -222,28 +221,34 @@ class TestRouter(unittest.TestCase):
             
 
 class TestMint(unittest.TestCase):
-    def setUp(self):
-        self.c = client
-        self.c.flush()
+    @classmethod
+    def setUpClass(cls):
+        cls.c = client
+        cls.c.flush()
 
         with open("lamden/router.py") as f:
             code = f.read()
-            self.c.submit(code, name=ROUTER_NAME)
-            self.router = self.c.get_contract(ROUTER_NAME)    
+            submit_cached(cls.c, code, name=ROUTER_NAME)
+            cls.router = cls.c.get_contract(ROUTER_NAME)    
 
         with open("lamden/token.py") as f:
-            self.token_code = f.read()
-            self.c.submit(self.token_code, "token1")
-            self.token1 = self.c.get_contract("token1")
+            cls.token_code = f.read()
+            submit_cached(cls.c, cls.token_code, "token1")
+            cls.token1 = cls.c.get_contract("token1")
 
         with open("tests/contracts/token_no_transfer.py") as f:
-            self.token_code = f.read()
-            self.c.submit(self.token_code, "token2")
+            cls.token_code = f.read()
+            submit_cached(cls.c, cls.token_code, "token2")
 
-        self.ETH_TOKEN1 = "0x1111111111111111111111111111111111111111"
-        self.router.add_token(ethereum_contract=self.ETH_TOKEN1, lamden_contract="token1",
+        cls.ETH_TOKEN1 = "0x1111111111111111111111111111111111111111"
+        cls.router.add_token(ethereum_contract=cls.ETH_TOKEN1, lamden_contract="token1",
             decimals=18)
 
+        cls.snapshot = StateSnapshot(cls.c)
+
+    def setUp(self):
+        self.snapshot.restore()
+
         self.approved = getAllHashValues(self.c, "token1", "balances", level=2)
         self.balances = getAllHashValues(self.c, "token1", "balances")
         self.nonces = getAllHashValues(self.c, ROUTER_NAME, "nonces")
@@ -252,9 +257,9 @@ class TestMint(unittest.TestCase):
     def testMint(self):
         test_cases = [
             {"signer": self.c.signer, "ethereum_contract": self.ETH_TOKEN1, "amount": "0x10",
-            "lamden_wallet": "user"},
+            "lamden_wallet": "user", "event_id": eventId(19)},
             {"signer": self.c.signer, "ethereum_contract": self.ETH_TOKEN1, "amount": "10",
-            "lamden_wallet": "user"},
+            "lamden_wallet": "user", "event_id": eventId(20)},
         ]
 
         for i, case in enumerate(test_cases):
@@ -271,18 +276,50 @@ class TestMint(unittest.TestCase):
                 self.assertEqual(self.approved, approvals_after)
 
 
+    def testFailMintTwice(self):
+        self.router.mint(ethereum_contract=self.ETH_TOKEN1, amount="0x10", lamden_wallet="user",
+            event_id=eventId(1))
+        self.balances = getAllHashValues(self.c, "token1", "balances")
+
+        test_cases = [
+            {"ethereum_contract": self.ETH_TOKEN1, "amount": "0x10", "lamden_wallet": "user",
+                "event_id": eventId(1)},
+            # The event id alone decides
+            {"ethereum_contract": self.ETH_TOKEN1, "amount": "0x20", "lamden_wallet": "user2",
+                "event_id": eventId(1)},
+            # Malformed event ids
+            {"ethereum_contract": self.ETH_TOKEN1, "amount": "0x10", "lamden_wallet": "user",
+                "event_id": eventId(2)[:-2]},
+            {"ethereum_contract": self.ETH_TOKEN1, "amount": "0x10", "lamden_wallet": "user",
+                "event_id": eventId(2) + ":0"},
+        ]
+
+        for i, case in enumerate(test_cases):
+            with self.subTest(i=i):
+                with self.assertRaises(BaseException, msg="A deposit was able to be minted twice."):
+                    self.router.mint(**case)
+
+                self.assertEqual(self.balances, getAllHashValues(self.c, "token1", "balances"))
+
+        # Another log of the same transaction is another deposit
+        supposed_balances = calcBalances(self.c, "token1", {"user": int("0x10", 16) / 10**18})
+        self.router.mint(ethereum_contract=self.ETH_TOKEN1, amount="0x10", lamden_wallet="user",
+            event_id=eventId(1, log_index=1))
+        self.assertEqual(supposed_balances, getAllHashValues(self.c, "token1", "balances"))
+
+
     def testFailNonOwner(self):
         test_cases = [
             {"signer": "foreigner", "ethereum_contract": self.ETH_TOKEN1, "amount": "0x14",
-            "lamden_wallet": "user"},
+            "lamden_wallet": "user", "event_id": eventId(21)},
             {"signer": "user", "ethereum_contract": self.ETH_TOKEN1, "amount": "0x14",
-            "lamden_wallet": "user"},
+            "lamden_wallet": "user", "event_id": eventId(22)},
             {"signer": "user", "ethereum_contract": self.ETH_TOKEN1, "amount": "0x14",
-            "lamden_wallet": self.c.signer},
+            "lamden_wallet": self.c.signer, "event_id": eventId(23)},
             {"signer": "user", "ethereum_contract": self.ETH_TOKEN1, "amount": "0x14",
-                "lamden_wallet": ROUTER_NAME},
+                "lamden_wallet": ROUTER_NAME, "event_id": eventId(24)},
             {"signer": "user", "ethereum_contract": self.ETH_TOKEN1, "amount": "0x14",
-                "lamden_wallet": None},
+                "lamden_wallet": None, "event_id": eventId(25)},
         ]
 
         for i, case in enumerate(test_cases):
@@ -302,13 +339,13 @@ class TestMint(unittest.TestCase):
         test_cases = [
             # Not supported tokens
             {"ethereum_contract": "0x0000000000000000000000000000000000000000",
-                "amount": "0x14", "lamden_wallet": "user"},
+                "amount": "0x14", "lamden_wallet": "user", "event_id": eventId(26)},
             # impossible eth addresses
             {"ethereum_contract": "0000000000000000000000000000000000000000",
-                "amount": "0x14", "lamden_wallet": "user"},
-            {"ethereum_contract": "000", "amount": "0x14", "lamden_wallet": "user"},
-            {"ethereum_contract": "", "amount": "0x14", "lamden_wallet": self.c.signer},
-            {"ethereum_contract": None, "amount": "0x14", "lamden_wallet": ROUTER_NAME},
+                "amount": "0x14", "lamden_wallet": "user", "event_id": eventId(27)},
+            {"ethereum_contract": "000", "amount": "0x14", "lamden_wallet": "user", "event_id": eventId(28)},
+            {"ethereum_contract": "", "amount": "0x14", "lamden_wallet": self.c.signer, "event_id": eventId(29)},
+            {"ethereum_contract": None, "amount": "0x14", "lamden_wallet": ROUTER_NAME, "event_id": eventId(30)},
         ]
 
         for i, case in enumerate(test_cases):
@@ -328,7 +365,7 @@ class TestMint(unittest.TestCase):
     def testFailLamdenWallet(self):
         test_cases = [
             {"signer": self.c.signer, "ethereum_contract": self.ETH_TOKEN1, "amount": "0x10",
-            "lamden_wallet": ""},
+            "lamden_wallet": "", "event_id": eventId(31)},
         ]
 
         for i, case in enumerate(test_cases):
@@ -346,11 +383,11 @@ class TestMint(unittest.TestCase):
 
     def testFailAmount(self):
         test_cases = [
-            {"ethereum_contract": self.ETH_TOKEN1, "amount": "text", "lamden_wallet": "user"},
-            {"ethereum_contract": self.ETH_TOKEN1, "amount": "-0x14", "lamden_wallet": "user"},
-            {"ethereum_contract": self.ETH_TOKEN1, "amount": "", "lamden_wallet": "user"},
-            {"ethereum_contract": self.ETH_TOKEN1, "amount": None, "lamden_wallet": "user"},
-            {"ethereum_contract": self.ETH_TOKEN1, "amount": 10, "lamden_wallet": "user"},
+            {"ethereum_contract": self.ETH_TOKEN1, "amount": "text", "lamden_wallet": "user", "event_id": eventId(32)},
+            {"ethereum_contract": self.ETH_TOKEN1, "amount": "-0x14", "lamden_wallet": "user", "event_id": eventId(33)},
+            {"ethereum_contract": self.ETH_TOKEN1, "amount": "", "lamden_wallet": "user", "event_id": eventId(34)},
+            {"ethereum_contract": self.ETH_TOKEN1, "amount": None, "lamden_wallet": "user", "event_id": eventId(35)},
+            {"ethereum_contract": self.ETH_TOKEN1, "amount": 10, "lamden_wallet": "user", "event_id": eventId(36)},
         ]
 
         for i, case in enumerate(test_cases):
@@ -366,63 +403,194 @@ class TestMint(unittest.TestCase):
                 self.assertEqual(self.approved, approvals_after)
 
 
-class TestAddToken(unittest.TestCase):
+class TestMintBatch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.c = client
+        cls.c.flush()
+
+        with open("lamden/router.py") as f:
+            code = f.read()
+            submit_cached(cls.c, code, name=ROUTER_NAME)
+            cls.router = cls.c.get_contract(ROUTER_NAME)
+
+        with open("lamden/token.py") as f:
+            cls.token_code = f.read()
+            submit_cached(cls.c, cls.token_code, "token1")
+            submit_cached(cls.c, cls.token_code, "token2")
+
+        cls.ETH_TOKEN1 = "0x1111111111111111111111111111111111111111"
+        cls.ETH_TOKEN2 = "0x2222222222222222222222222222222222222222"
+        cls.router.add_token(ethereum_contract=cls.ETH_TOKEN1, lamden_contract="token1",
+            decimals=18)
+        cls.router.add_token(ethereum_contract=cls.ETH_TOKEN2, lamden_contract="token2",
+            decimals=0)
+
+        cls.snapshot = StateSnapshot(cls.c)
+
     def setUp(self):
-        self.c = client
-        self.c.flush()
+        self.snapshot.restore()
+
+        self.balances1 = getAllHashValues(self.c, "token1", "balances")
+        self.balances2 = getAllHashValues(self.c, "token2", "balances")
+        self.nonces = getAllHashValues(self.c, ROUTER_NAME, "nonces")
+
+
+    def mintBatch(self, **kwargs):
+        """Calls mint_batch and drops its writes if it fails, like a Lamden node. The client
+        keeps the writes of a failed call until the next commit.
+        """
+        self.c.raw_driver.commit()
+        try:
+            self.router.mint_batch(**kwargs)
+        except BaseException:
+            self.c.raw_driver.clear_pending_state()
+            raise
+
+
+    def testMintBatch(self):
+        records = [
+            [self.ETH_TOKEN1, "0x10", "user", eventId(1)],
+            [self.ETH_TOKEN2, "10", "user", eventId(2)],
+            [self.ETH_TOKEN1, "10", "user2", eventId(2, log_index=1)],
+            [self.ETH_TOKEN1, "0x10", "user", eventId(3)],
+            [self.ETH_TOKEN2, "0x10", self.c.signer, eventId(4)],
+        ]
+
+        supposed_balances1 = calcBalances(self.c, "token1",
+            {"user": 2 * int("0x10", 16) / 10**18, "user2": int("10", 16) / 10**18})
+        supposed_balances2 = calcBalances(self.c, "token2",
+            {"user": int("10", 16), self.c.signer: int("0x10", 16)})
+
+        self.router.mint_batch(records=records)
+
+        self.assertEqual(supposed_balances1, getAllHashValues(self.c, "token1", "balances"))
+        self.assertEqual(supposed_balances2, getAllHashValues(self.c, "token2", "balances"))
+        self.assertEqual(self.nonces, getAllHashValues(self.c, ROUTER_NAME, "nonces"))
+
+
+    def testMintBatchEmpty(self):
+        self.router.mint_batch(records=[])
+
+        self.assertEqual(self.balances1, getAllHashValues(self.c, "token1", "balances"))
+        self.assertEqual(self.balances2, getAllHashValues(self.c, "token2", "balances"))
+
+
+    def testFailMintBatch(self):
+        test_cases = [
+            # Non-owner trying to mint
+            {"signer": "user", "records": [[self.ETH_TOKEN1, "0x10", "user", eventId(1)]]},
+            {"signer": "foreigner", "records": [[self.ETH_TOKEN2, "0x10", "user", eventId(1)]]},
+            # Unsupported ethereum token
+            {"records": [["0x0000000000000000000000000000000000000000", "0x10", "user", eventId(1)],
+                [self.ETH_TOKEN1, "0x10", "user", eventId(2)]]},
+            {"records": [[None, "0x10", "user", eventId(1)]]},
+            # Impossible amounts
+            {"records": [[self.ETH_TOKEN1, "text", "user", eventId(1)],
+                [self.ETH_TOKEN1, "0x10", "user", eventId(2)]]},
+            {"records": [[self.ETH_TOKEN1, "-0x14", "user", eventId(1)]]},
+            {"records": [[self.ETH_TOKEN1, None, "user", eventId(1)]]},
+            # The same deposit twice
+            {"records": [[self.ETH_TOKEN1, "0x10", "user", eventId(1)],
+                [self.ETH_TOKEN2, "0x10", "user2", eventId(1)]]},
+            {"records": [[self.ETH_TOKEN1, "0x10", "user", "0x1"]]},
+            # Malformed records
+            {"records": [[self.ETH_TOKEN1, "0x10", "user"]]},
+            {"records": [[self.ETH_TOKEN1, "0x10", "user", eventId(1), "user2"]]},
+            {"records": None},
+        ]
+
+        for i, case in enumerate(test_cases):
+            with self.subTest(i=i):
+                with self.assertRaises(BaseException):
+                    self.mintBatch(**case)
+
+                self.assertEqual(self.balances1, getAllHashValues(self.c, "token1", "balances"))
+                self.assertEqual(self.balances2, getAllHashValues(self.c, "token2", "balances"))
+                self.assertEqual(self.nonces, getAllHashValues(self.c, ROUTER_NAME, "nonces"))
+
+
+    def testFailMintedBefore(self):
+        self.router.mint(ethereum_contract=self.ETH_TOKEN1, amount="0x10", lamden_wallet="user",
+            event_id=eventId(2))
+        balances1 = getAllHashValues(self.c, "token1", "balances")
+
+        # Nothing of a batch is minted if one of its deposits was minted before
+        with self.assertRaises(BaseException):
+            self.mintBatch(records=[[self.ETH_TOKEN1, "0x10", "user", eventId(1)],
+                [self.ETH_TOKEN1, "0x10", "user", eventId(2)], [self.ETH_TOKEN2, "10", "user", eventId(3)]])
+
+        self.assertEqual(balances1, getAllHashValues(self.c, "token1", "balances"))
+        self.assertEqual(self.balances2, getAllHashValues(self.c, "token2", "balances"))
+
+        self.router.mint_batch(records=[[self.ETH_TOKEN1, "0x10", "user", eventId(1)],
+            [self.ETH_TOKEN2, "10", "user", eventId(3)]])
+
+        with self.assertRaises(BaseException):
+            self.router.mint(ethereum_contract=self.ETH_TOKEN2, amount="10", lamden_wallet="user",
+                event_id=eventId(3))
+
+
+class TestAddToken(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.c = client
+        cls.c.flush()
 
         with open("lamden/router.py") as f:
             code = f.read()
-            self.c.submit(code, name=ROUTER_NAME)
-            self.router = self.c.get_contract(ROUTER_NAME)    
+            submit_cached(cls.c, code, name=ROUTER_NAME)
+            cls.router = cls.c.get_contract(ROUTER_NAME)    
 
         with open("lamden/token.py") as f:
-            self.token_code = f.read()
-            self.c.submit(self.token_code, "token1")
-            self.token1 = self.c.get_contract("token1")
+            cls.token_code = f.read()
+            submit_cached(cls.c, cls.token_code, "token1")
+            cls.token1 = cls.c.get_contract("token1")
 
-        self.token1.quick_write(variable="balances", key="user", value=decimal.ContractingDecimal(100))
-        self.token1.quick_write(variable="balances", key="user2", value=decimal.ContractingDecimal(100))
-        self.token1.approve(signer="user", amount=100, to=ROUTER_NAME)
+        cls.token1.quick_write(variable="balances", key="user", value=decimal.ContractingDecimal(100))
+        cls.token1.quick_write(variable="balances", key="user2", value=decimal.ContractingDecimal(100))
+        cls.token1.approve(signer="user", amount=100, to=ROUTER_NAME)
 
-        self.ETH_TOKEN1 = "0x1111111111111111111111111111111111111111"
-        self.router.add_token(ethereum_contract=self.ETH_TOKEN1, lamden_contract="token1",
+        cls.ETH_TOKEN1 = "0x1111111111111111111111111111111111111111"
+        cls.router.add_token(ethereum_contract=cls.ETH_TOKEN1, lamden_contract="token1",
             decimals=18)
 
+        cls.snapshot = StateSnapshot(cls.c)
+
+    def setUp(self):
+        self.snapshot.restore()
+
         self.nonces = getAllHashValues(self.c, ROUTER_NAME, "nonces")
         self.supported = getAllHashValues(self.c, ROUTER_NAME, "supported_tokens")
-        self.decimals = getAllHashValues(self.c, ROUTER_NAME, "supported_tokens", level=2)
 
 
     def testAddToken(self):
         test_cases = [
             {"ethereum_contract": randomEthAddress(), "lamden_contract": "token1", "decimals": 18},
             {"ethereum_contract": randomEthAddress(), "lamden_contract": "token1", "decimals": 0},
-            {"ethereum_contract": randomEthAddress(), "lamden_contract": "token1", "decimals": -3},
         ]
 
         for i, case in enumerate(test_cases):
             with self.subTest(i=i):
-                eth_con = case["ethereum_contract"]
-                lam_con = case["lamden_contract"]
-                self.supported[eth_con] = lam_con 
-                self.decimals[eth_con, "decimals"] = case["decimals"]
+                self.supported[case["ethereum_contract"]] = {
+                    "lamden_contract": case["lamden_contract"],
+                    "decimals": case["decimals"],
+                    "scale": 10 ** case["decimals"]}
 
                 self.router.add_token(**case)
 
                 nonces_after = getAllHashValues(self.c, ROUTER_NAME, "nonces")
                 supported_after = getAllHashValues(self.c, ROUTER_NAME, "supported_tokens")
-                decimals_after = getAllHashValues(self.c, ROUTER_NAME, "supported_tokens", level=2)
                 self.assertEqual(self.nonces, nonces_after)
                 self.assertEqual(self.supported, supported_after)
-                self.assertEqual(self.decimals, decimals_after)
 
-    @unittest.skip("FAILED")
     def testFailDecimals(self):
         test_cases = [
             {"ethereum_contract": randomEthAddress(), "lamden_contract": "token1", "decimals": None},
             {"ethereum_contract": randomEthAddress(), "lamden_contract": "token1", "decimals": ""},
             {"ethereum_contract": randomEthAddress(), "lamden_contract": "token1", "decimals": "18"},
+            {"ethereum_contract": randomEthAddress(), "lamden_contract": "token1", "decimals": True},
+            {"ethereum_contract": randomEthAddress(), "lamden_contract": "token1", "decimals": -3},
         ]
 
         for i, case in enumerate(test_cases):
@@ -432,10 +600,8 @@ class TestAddToken(unittest.TestCase):
 
                 nonces_after = getAllHashValues(self.c, ROUTER_NAME, "nonces")
                 supported_after = getAllHashValues(self.c, ROUTER_NAME, "supported_tokens")
-                decimals_after = getAllHashValues(self.c, ROUTER_NAME, "supported_tokens", level=2)
                 self.assertEqual(self.nonces, nonces_after)
                 self.assertEqual(self.supported, supported_after)
-                self.assertEqual(self.decimals, decimals_after)
 
     
     def testFailInterface(self):
@@ -469,7 +635,7 @@ class TestAddToken(unittest.TestCase):
                 try:
                     with open(f"tests/contracts/{lamden_contract}.py") as f:
                         code = f.read()
-                        self.c.submit(code, name=lamden_contract)
+                        submit_cached(self.c, code, name=lamden_contract)
                 except:
                     pass
 
@@ -478,10 +644,8 @@ class TestAddToken(unittest.TestCase):
 
                 nonces_after = getAllHashValues(self.c, ROUTER_NAME, "nonces")
                 supported_after = getAllHashValues(self.c, ROUTER_NAME, "supported_tokens")
-                decimals_after = getAllHashValues(self.c, ROUTER_NAME, "supported_tokens", level=2)
                 self.assertEqual(self.nonces, nonces_after)
                 self.assertEqual(self.supported, supported_after)
-                self.assertEqual(self.decimals, decimals_after)
 
 
     @unittest.skip("FAILED")
@@ -500,10 +664,8 @@ class TestAddToken(unittest.TestCase):
 
                 nonces_after = getAllHashValues(self.c, ROUTER_NAME, "nonces")
                 supported_after = getAllHashValues(self.c, ROUTER_NAME, "supported_tokens")
-                decimals_after = getAllHashValues(self.c, ROUTER_NAME, "supported_tokens", level=2)
                 self.assertEqual(self.nonces, nonces_after)
                 self.assertEqual(self.supported, supported_after)
-                self.assertEqual(self.decimals, decimals_after)
 
 
     def testFailNonOwner(self):
@@ -519,36 +681,40 @@ class TestAddToken(unittest.TestCase):
 
                 nonces_after = getAllHashValues(self.c, ROUTER_NAME, "nonces")
                 supported_after = getAllHashValues(self.c, ROUTER_NAME, "supported_tokens")
-                decimals_after = getAllHashValues(self.c, ROUTER_NAME, "supported_tokens", level=2)
                 self.assertEqual(self.nonces, nonces_after)
                 self.assertEqual(self.supported, supported_after)
-                self.assertEqual(self.decimals, decimals_after)
 
 
 class TestBurn(unittest.TestCase):
-    def setUp(self):
-        self.maxDiff = None
-        self.c = client
-        self.c.flush()
+    @classmethod
+    def setUpClass(cls):
+        cls.c = client
+        cls.c.flush()
 
         with open("lamden/router.py") as f:
             code = f.read()
-            self.c.submit(code, name=ROUTER_NAME)
-            self.router = self.c.get_contract(ROUTER_NAME)    
+            submit_cached(cls.c, code, name=ROUTER_NAME)
+            cls.router = cls.c.get_contract(ROUTER_NAME)    
 
         with open("lamden/token.py") as f:
-            self.token_code = f.read()
-            self.c.submit(self.token_code, "token1")
-            self.token1 = self.c.get_contract("token1")
+            cls.token_code = f.read()
+            submit_cached(cls.c, cls.token_code, "token1")
+            cls.token1 = cls.c.get_contract("token1")
 
-        self.token1.quick_write(variable="balances", key="user", value=decimal.ContractingDecimal(100))
-        self.token1.quick_write(variable="balances", key="user2", value=decimal.ContractingDecimal(100))
-        self.token1.approve(signer="user", amount=100, to=ROUTER_NAME)
+        cls.token1.quick_write(variable="balances", key="user", value=decimal.ContractingDecimal(100))
+        cls.token1.quick_write(variable="balances", key="user2", value=decimal.ContractingDecimal(100))
+        cls.token1.approve(signer="user", amount=100, to=ROUTER_NAME)
 
-        self.ETH_TOKEN1 = "0x1111111111111111111111111111111111111111"
-        self.router.add_token(ethereum_contract=self.ETH_TOKEN1, lamden_contract="token1",
+        cls.ETH_TOKEN1 = "0x1111111111111111111111111111111111111111"
+        cls.router.add_token(ethereum_contract=cls.ETH_TOKEN1, lamden_contract="token1",
             decimals=18)
 
+        cls.snapshot = StateSnapshot(cls.c)
+
+    def setUp(self):
+        self.maxDiff = None
+        self.snapshot.restore()
+
         self.approved = getAllHashValues(self.c, "token1", "balances", level=2)
         self.balances = getAllHashValues(self.c, "token1", "balances")
         self.nonces = getAllHashValues(self.c, ROUTER_NAME, "nonces")
@@ -742,15 +908,135 @@ class TestBurn(unittest.TestCase):
                 self.assertEqual(self.approved, approvals_after)
 
 
-class TestPostProof(unittest.TestCase):
+class TestEpochs(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.c = client
+        cls.c.flush()
+
+        with open("lamden/router.py") as f:
+            code = f.read()
+            submit_cached(cls.c, code, name=ROUTER_NAME)
+            cls.router = cls.c.get_contract(ROUTER_NAME)
+
+        with open("lamden/token.py") as f:
+            cls.token_code = f.read()
+            submit_cached(cls.c, cls.token_code, "token1")
+            cls.token1 = cls.c.get_contract("token1")
+
+        cls.token1.quick_write(variable="balances", key="user", value=decimal.ContractingDecimal(100))
+        cls.token1.approve(signer="user", amount=100, to=ROUTER_NAME)
+
+        cls.ETH_TOKEN1 = "0x1111111111111111111111111111111111111111"
+        cls.router.add_token(ethereum_contract=cls.ETH_TOKEN1, lamden_contract="token1",
+            decimals=18)
+
+        cls.snapshot = StateSnapshot(cls.c)
+
     def setUp(self):
-        self.c = client
-        self.c.flush()
+        self.snapshot.restore()
+
+    def burn(self, amount=1):
+        return self.router.burn(ethereum_contract=self.ETH_TOKEN1,
+            ethereum_address=randomEthAddress(), lamden_address="user", amount=amount)
+
+    def testBurnsAreQueued(self):
+        abis = [self.burn() for _ in range(3)]
+
+        self.assertEqual(self.router.quick_read(variable="sequence"), 3)
+        self.assertEqual(getAllHashValues(self.c, ROUTER_NAME, "queue"),
+            {str(i + 1): abi for i, abi in enumerate(abis)})
+        self.assertEqual(self.router.quick_read(variable="epoch"), 0)
+        self.assertEqual(getAllHashValues(self.c, ROUTER_NAME, "epoch_starts"), {"0": 1})
+
+    def testSealEpoch(self):
+        first = [self.burn() for _ in range(2)]
+        self.assertEqual(self.router.seal_epoch(), 0)
+        second = [self.burn()]
+
+        self.assertEqual(self.router.quick_read(variable="epoch"), 1)
+        self.assertEqual(getAllHashValues(self.c, ROUTER_NAME, "epoch_starts"), {"0": 1, "1": 3})
+        self.assertEqual(getAllHashValues(self.c, ROUTER_NAME, "queue"),
+            {"1": first[0], "2": first[1], "3": second[0]})
+
+        self.assertEqual(self.router.seal_epoch(), 1)
+        self.assertEqual(getAllHashValues(self.c, ROUTER_NAME, "epoch_starts"),
+            {"0": 1, "1": 3, "2": 4})
+
+    def testPostRoot(self):
+        self.burn()
+        self.burn()
+        self.router.seal_epoch()
+
+        self.router.post_root(epoch_number=0, root="root", signed_root="signature")
+
+        self.assertEqual(getAllHashValues(self.c, ROUTER_NAME, "epoch_roots"), {"0": "root"})
+        self.assertEqual(getAllHashValues(self.c, ROUTER_NAME, "proofs"), {"root": "signature"})
+
+    def testFailSealEpoch(self):
+        # Nothing to seal
+        with self.assertRaises(BaseException):
+            self.router.seal_epoch()
+
+        self.burn()
+
+        # Non-owner
+        with self.assertRaises(BaseException):
+            self.router.seal_epoch(signer="user")
+
+        self.router.seal_epoch()
+
+        # The burn above already belongs to the sealed epoch
+        with self.assertRaises(BaseException):
+            self.router.seal_epoch()
+
+        self.assertEqual(self.router.quick_read(variable="epoch"), 1)
+
+    def testFailPostRoot(self):
+        self.burn()
+        self.router.seal_epoch()
+        self.burn()
+
+        fail_cases = [
+            # Non-owner
+            {"signer": "user", "epoch_number": 0, "root": "root", "signed_root": "signature"},
+            # Epoch 1 is still open
+            {"epoch_number": 1, "root": "root", "signed_root": "signature"},
+            # Epochs that never existed
+            {"epoch_number": 2, "root": "root", "signed_root": "signature"},
+            {"epoch_number": -1, "root": "root", "signed_root": "signature"},
+        ]
+
+        for i, case in enumerate(fail_cases):
+            with self.subTest(i=i):
+                with self.assertRaises(BaseException):
+                    self.router.post_root(**case)
+
+                self.assertEqual(getAllHashValues(self.c, ROUTER_NAME, "epoch_roots"), {})
+                self.assertEqual(getAllHashValues(self.c, ROUTER_NAME, "proofs"), {})
+
+        # Roots cannot be overwritten
+        self.router.post_root(epoch_number=0, root="root", signed_root="signature")
+        with self.assertRaises(BaseException):
+            self.router.post_root(epoch_number=0, root="other", signed_root="other signature")
+        self.assertEqual(getAllHashValues(self.c, ROUTER_NAME, "epoch_roots"), {"0": "root"})
+
+
+class TestPostProof(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.c = client
+        cls.c.flush()
 
         with open("lamden/router.py") as f:
             code = f.read()
-            self.c.submit(code, name=ROUTER_NAME)
-            self.router = self.c.get_contract(ROUTER_NAME)    
+            submit_cached(cls.c, code, name=ROUTER_NAME)
+            cls.router = cls.c.get_contract(ROUTER_NAME)    
+
+        cls.snapshot = StateSnapshot(cls.c)
+
+    def setUp(self):
+        self.snapshot.restore()
 
         self.nonces = getAllHashValues(self.c, ROUTER_NAME, "nonces")
         self.proofs = getAllHashValues(self.c, ROUTER_NAME, "proofs")
@@ -786,6 +1072,35 @@ class TestPostProof(unittest.TestCase):
             self.assertEqual(self.proofs, proofs_after)
             self.assertEqual(self.nonces, nonces_after)
 
+    def testPostProofs(self):
+        pairs = [["text", "random_text"], ["other text", "signature"], ["third", "last"]]
+
+        self.router.post_proofs(pairs=pairs)
+
+        for hashed_abi, signed_abi in pairs:
+            self.proofs[hashed_abi] = signed_abi
+
+        nonces_after = getAllHashValues(self.c, ROUTER_NAME, "nonces")
+        proofs_after = getAllHashValues(self.c, ROUTER_NAME, "proofs")
+        self.assertEqual(self.proofs, proofs_after)
+        self.assertEqual(self.nonces, nonces_after)
+
+    def testFailPostProofs(self):
+        fail_cases = [
+            {"signer": "user", "pairs": [["text", "random_text"]]},
+            {"signer": "foreigner", "pairs": [["text", "random_text"], ["other text", "signature"]]},
+            {"pairs": [["text"]]},
+            {"pairs": ["text"]},
+        ]
+
+        for i, case in enumerate(fail_cases):
+            with self.subTest(i=i):
+                with self.assertRaises(BaseException):
+                    self.router.post_proofs(**case)
+
+                proofs_after = getAllHashValues(self.c, ROUTER_NAME, "proofs")
+                self.assertEqual(self.proofs, proofs_after)
+
        
 
 if __name__ == '__main__':
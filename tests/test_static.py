@@ -1,12 +1,11 @@
 #tests/test_static.py
 import unittest
-from contracting.client import ContractingClient
-from tests.util import submit_compiled
+from tests.util import submit_compiled, submit_cached, make_client
 
 # These are tests for the static methods of the lamden_bridge.py and the router.py
 # contracts.
 
-client = ContractingClient()
+client = make_client()
 
 class TestStatic(unittest.TestCase):
     def setUp(self):
@@ -180,7 +179,7 @@ class TestStaticLamdenBridge(TestStatic):
 
         with open("lamden/lamden_bridge.py") as f:
             code = f.read()
-            self.c.submit(code, name="lamden_bridge")
+            submit_cached(self.c, code, name="lamden_bridge")
             self.contract = self.c.get_contract("lamden_bridge")    
 
 class TestStaticRouter(TestStatic):
@@ -189,7 +188,7 @@ class TestStaticRouter(TestStatic):
 
         with open("lamden/router.py") as f:
             code = f.read()
-            self.c.submit(code, name="router")
+            submit_cached(self.c, code, name="router")
             self.contract = self.c.get_contract("router")    
 
 def load_tests(loader, tests, pattern):
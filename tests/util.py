@@ -2,29 +2,152 @@ from contracting.execution.runtime import rt
 from contracting.stdlib import env
 from contracting import config
 from contracting import client
+from contracting.client import ContractingClient
+from contracting.compilation.compiler import ContractingCompiler
+from contracting.db.driver import ContractDriver, Driver, InMemDriver, CODE_KEY, COMPILED_KEY, OWNER_KEY, \
+    TIME_KEY, DEVELOPER_KEY
+from contracting.db.encoder import decode
+from contracting.execution.module import install_database_loader
+from contracting.stdlib.bridge.time import Datetime
+from datetime import datetime
+import hashlib
+import marshal
+import os
 import pdb
+import re
+import sys
 
 from random import randbytes
 
-# We need to import "currency" but only have compiled code (obtained from lamden masternodes).
-# client.submit only allows compiled code, so try to submit compiled code 
-def submit_compiled(client, name, code_obj, owner=None, developer=None, args=None):
-    """Submits compiled code of a contract.
+from old.wrapped_tokens.drivers import MemoryDriver, MemoryContractDriver
+
+
+# Where the test clients keep their state:
+#   CONTRACT_STORAGE=memory  in a MemoryDriver of each client, nothing is shared
+#   CONTRACT_STORAGE=mongo   in MongoDB (default), in the collection state_<TEST_WORKER>
+#                            if TEST_WORKER is set and the default collection otherwise
+# tests.parallel sets TEST_WORKER for each of its worker processes.
+def make_client():
+    """Returns the ContractingClient of a test module.
     """
+    storage = os.environ.get("CONTRACT_STORAGE", "mongo")
+    worker = os.environ.get("TEST_WORKER")
+
+    if storage == "memory":
+        return ContractingClient(driver=MemoryContractDriver())
+    if storage != "mongo":
+        raise ValueError(f"Unknown CONTRACT_STORAGE {storage}, use memory or mongo")
+
+    if worker is None:
+        return ContractingClient()
+    return ContractingClient(driver=ContractDriver(driver=Driver(collection=f"state_{worker}")))
+
+
+class ContractCache:
+    """Compiled contracts, keyed by a hash of their name and source. Each entry is the source
+    as contracting stores it (linted and transformed) and its code object. With a path, the
+    entries are also kept in that directory, so later runs can skip compiling as well.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.compiled = {}
+
+    def key(self, name, code):
+        return hashlib.sha256(f"{name}\0{code}".encode()).hexdigest()
+
+    def filename(self, key):
+        # Code objects can only be loaded by the Python version that dumped them
+        return os.path.join(self.path, f"{key}.{sys.implementation.cache_tag}")
+
+    def compile(self, name, code, transform=True):
+        """Returns (source, code_obj) of a contract. Without transform, code is taken to be
+        compiled by contracting already.
+        """
+        key = self.key(name, code)
+
+        if key in self.compiled:
+            return self.compiled[key]
+
+        if self.path and os.path.exists(self.filename(key)):
+            with open(self.filename(key), "rb") as f:
+                self.compiled[key] = marshal.load(f)
+            return self.compiled[key]
+
+        if transform:
+            source = ContractingCompiler(module_name=name).parse_to_code(code, lint=True)
+        else:
+            source = code
+        self.compiled[key] = (source, compile(source, "", "exec"))
+
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+            with open(self.filename(key) + ".tmp", "wb") as f:
+                marshal.dump(self.compiled[key], f)
+            os.replace(self.filename(key) + ".tmp", self.filename(key))
+
+        return self.compiled[key]
+
+
+# Set CONTRACT_CACHE to a directory to keep compiled contracts between runs
+CONTRACTS = ContractCache(os.environ.get("CONTRACT_CACHE"))
+
+
+def store_contract(driver, name, source, code_obj, owner=None, developer=None):
+    """Does what ContractDriver.set_contract does, without compiling the source again.
+    """
+    if driver.get_contract(name) is None:
+        driver.set_var(name, CODE_KEY, value=source)
+        driver.set_var(name, COMPILED_KEY, value=marshal.dumps(code_obj))
+        driver.set_var(name, OWNER_KEY, value=owner)
+        driver.set_var(name, TIME_KEY, value=Datetime._from_datetime(datetime.now()))
+        driver.set_var(name, DEVELOPER_KEY, value=developer)
+
+
+def run_constructor(code_obj, args=None):
     scope = env.gather()
     scope.update({"__contract__": True})
     scope.update(rt.env)
 
     exec(code_obj, scope)
 
-    if args:
-        scope[config.INIT_FUNC_NAME](**args)
-    else:
-        scope[config.INIT_FUNC_NAME]()
-    
+    if scope.get(config.INIT_FUNC_NAME) is not None:
+        scope[config.INIT_FUNC_NAME](**(args or {}))
+
+
+def submit_cached(client, code, name, owner=None, constructor_args=None, signer=None):
+    """Submits a contract like client.submit does, but compiles each source only once.
+    """
+    assert not name.isdigit() and all(c.isalnum() or c == "_" for c in name), "Invalid contract name!"
+    assert name.islower(), "Name must be lowercase!"
+    assert client.raw_driver.get_contract(name) is None, "Contract already exists."
+
+    source, code_obj = CONTRACTS.compile(name, code)
+    signer = signer or client.signer
 
-    client.raw_driver.set_contract(name=name, code=code_obj, owner=owner,
-        overwrite=False, developer=developer)
+    # The constructor runs in the context a transaction to the submission contract has,
+    # including the import hook that loads other contracts
+    rt.env.update({"__Driver": client.raw_driver})
+    install_database_loader(driver=client.raw_driver)
+    rt.context._base_state = {
+        "signer": signer,
+        "caller": signer,
+        "this": "submission",
+        "owner": None
+    }
+
+    run_constructor(code_obj, constructor_args)
+    store_contract(client.raw_driver, name, source, code_obj, owner=owner, developer=signer)
+
+
+# We need to import "currency" but only have compiled code (obtained from lamden masternodes).
+# client.submit only allows compiled code, so try to submit compiled code 
+def submit_compiled(client, name, code_obj, owner=None, developer=None, args=None):
+    """Submits compiled code of a contract.
+    """
+    source, code = CONTRACTS.compile(name, code_obj, transform=False)
+
+    run_constructor(code, args)
+    store_contract(client.raw_driver, name, source, code, owner=owner, developer=developer)
 
 
 def tupleOrOne(list):
@@ -34,21 +157,79 @@ def tupleOrOne(list):
     else:
         return list[0]
 
+def scanPrefix(driver, prefix):
+    """Yields (key, value) of all keys in the database of a driver that start with prefix,
+    fetched in one query instead of one per key.
+    """
+    if isinstance(driver, MemoryDriver):
+        yield from driver.scan(prefix)
+    elif isinstance(driver, InMemDriver):
+        p = prefix.encode()
+        for k in sorted(driver.db):
+            if k.startswith(p):
+                yield k.decode(), decode(driver.db[k])
+    elif isinstance(driver, Driver):
+        # An anchored regex on _id is answered from the index
+        for entry in driver.db.find({'_id': {'$regex': '^' + re.escape(prefix)}}):
+            yield entry['_id'], decode(entry['v'])
+    else:
+        for k in driver.iter(prefix):
+            yield k, driver.get(k)
+
+
+def iterHashValues(client, contract_name, variable_name, level=1):
+    """Yields (key, value) of every entry of a Hash whose key has level elements, with key as
+    a tuple. Values that were written but not committed yet take the place of the stored ones.
+    """
+    prefix = f"{contract_name}.{variable_name}:"
+    contract_driver = client.raw_driver
+
+    pending = {k: v for k, v in contract_driver.cache.items() if k.startswith(prefix)}
+
+    def entries():
+        for k, v in scanPrefix(contract_driver.driver, prefix):
+            yield k, pending.pop(k, v)
+        yield from pending.items()
+
+    for k, v in entries():
+        key = k[len(prefix):].split(":")
+        if v is not None and len(key) == level:
+            yield tuple(key), v
+
+
+class StateSnapshot:
+    """Copy of the state of a ContractingClient, taken once after the contracts of a test
+    class are deployed. restore() drops the cached writes and only undoes the stored keys
+    that changed since, so tests start from the deployed state without flushing and
+    resubmitting the contracts.
+    """
+    def __init__(self, client):
+        self.client = client
+
+        # Contracting keeps writes in the cache of its ContractDriver until they are committed
+        client.raw_driver.commit()
+        self.state = dict(scanPrefix(client.raw_driver.driver, ""))
+
+    def restore(self):
+        contract_driver = self.client.raw_driver
+        contract_driver.clear_pending_state()
+
+        driver = contract_driver.driver
+        current = dict(scanPrefix(driver, ""))
+
+        for k in current.keys() - self.state.keys():
+            driver.delete(k)
+
+        for k, v in self.state.items():
+            if current.get(k) != v:
+                driver.set(k, v)
+
+
 def getKeys(client, contract_name, variable_name, level=1):
     """Returns all keys of a hash. Each key is a list containing one or multiple elements
     depending on whether the key is from a multihash or not
     """
-    contract = client.get_contract(contract_name)
-    if contract:
-        raw_keys = contract.keys()
-        keys = []
-        id = f"{contract_name}.{variable_name}"
-        for k in raw_keys:
-            if k[:len(id)]==id and k.count(":")==level:
-                key_name = k[k.find(":")+1:]
-                key = key_name.split(":")
-                keys.append(key)
-        return keys
+    return [list(key) for key, _ in iterHashValues(client, contract_name, variable_name, level)]
 
 
 def getAllHashValues(client, contract_name, variable_name, level=1):
@@ -57,14 +238,8 @@ def getAllHashValues(client, contract_name, variable_name, level=1):
     level=2 will return all hashes with two value key, e.g. balances[key1, key2]
     etc.
     """
-    keys = getKeys(client, contract_name, variable_name, level)
-    if not keys:
-        return {}
-    contract = client.get_contract(contract_name)
-    values = {}
-    for a in keys:
-        values[tupleOrOne(a)] = client.get_var(contract_name, variable_name, arguments=a)
-    return values
+    return {tupleOrOne(list(key)): value
+        for key, value in iterHashValues(client, contract_name, variable_name, level)}
 
 def randomEthAddress():
     return "0x" + randbytes(20).hex()
\ No newline at end of file
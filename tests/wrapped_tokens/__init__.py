@@ -0,0 +1,10 @@
+#tests/wrapped_tokens/__init__.py
+import os
+import sys
+
+# Tests of the Python operator. Its modules import each other as siblings (from state
+# import StateStore), the way server.py is run from old/wrapped_tokens.
+OPERATOR_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "old", "wrapped_tokens"))
+
+if OPERATOR_DIR not in sys.path:
+    sys.path.insert(0, OPERATOR_DIR)
@@ -0,0 +1,130 @@
+#tests/wrapped_tokens/fakes.py
+import asyncio
+
+from tests.wrapped_tokens import OPERATOR_DIR  # noqa: F401
+
+import httpx
+
+from sessions import Upstream
+from submitter import TransactionFailed, TransactionReverted
+
+HOSTS = ["http://a", "http://b", "http://c"]
+
+
+class FakeRouter:
+    """Stands in for the submitter.Submitter of the router. Transactions run right away on a
+    model of the router's queue, epochs and mints. lost_results[function] transactions of a
+    function run, but their result is lost like one that does not show up in time, and
+    rejected[function] of them are rejected by the masternode without running.
+    """
+    def __init__(self):
+        self.sequence = 0
+        self.queue = {}
+        self.epoch = 0
+        self.epoch_starts = {0: 1}
+        self.epoch_roots = {}
+        self.proofs = {}
+
+        # (transaction hash, log index): (ethereum_contract, amount, lamden_wallet)
+        self.minted = {}
+        self.unsupported_tokens = set()
+
+        self.sent = []
+        self.lost_results = {}
+        self.rejected = {}
+
+    def burn(self, abi):
+        self.sequence += 1
+        self.queue[self.sequence] = abi
+        return self.sequence
+
+    async def get_variable(self, variable, key=None):
+        value = getattr(self, variable)
+        return value if key is None else value.get(key)
+
+    async def send(self, function, kwargs, stamps, on_posted=None):
+        self.sent.append((function, kwargs, stamps))
+        await asyncio.sleep(0)
+
+        if self.rejected.get(function, 0) > 0:
+            self.rejected[function] -= 1
+            raise TransactionFailed("Transaction nonce is invalid.")
+
+        tx_hash = f"tx{len(self.sent)}"
+        if on_posted is not None:
+            on_posted(tx_hash)
+
+        try:
+            result = getattr(self, function)(**kwargs)
+        except AssertionError as e:
+            raise TransactionReverted(f"AssertionError({str(e)!r})")
+
+        if self.lost_results.get(function, 0) > 0:
+            self.lost_results[function] -= 1
+            raise TimeoutError("Transaction was dropped")
+
+        return {"hash": tx_hash, "status": 0, "result": repr(result)}
+
+    def seal_epoch(self):
+        sealed = self.epoch
+        assert self.sequence >= self.epoch_starts[sealed], "Epoch has no burns!"
+
+        self.epoch_starts[sealed + 1] = self.sequence + 1
+        self.epoch = sealed + 1
+        return sealed
+
+    def post_root(self, epoch_number, root, signed_root):
+        assert epoch_number < self.epoch, "Epoch is not sealed!"
+        assert self.epoch_roots.get(epoch_number) is None, "Root already posted!"
+
+        self.epoch_roots[epoch_number] = root
+        self.proofs[root] = signed_root
+
+    def mint(self, ethereum_contract, amount, lamden_wallet, event_id):
+        self.mint_batch([[ethereum_contract, amount, lamden_wallet, event_id]])
+
+    def mint_batch(self, records):
+        deposits = [tuple(event_id.split(":")) for _, _, _, event_id in records]
+        assert all(len(deposit) == 2 for deposit in deposits), "Invalid event id!"
+        assert len(set(deposits)) == len(deposits), "Deposit already minted!"
+        assert not any(deposit in self.minted for deposit in deposits), "Deposit already minted!"
+        assert not any(record[0] in self.unsupported_tokens for record in records), "Invalid Ethereum Token!"
+
+        for deposit, (ethereum_contract, amount, lamden_wallet, _) in zip(deposits, records):
+            self.minted[deposit] = (ethereum_contract, amount, lamden_wallet)
+
+
+class FakeHosts:
+    """Answers the requests of a sessions.Upstream in place of the network. status[host] is
+    a list of status codes the host answers with in turn, the last one from then on, and a
+    host in down raises a connection error. Requests to a host take delays[host] seconds.
+    """
+    def __init__(self, status=None, down=(), delays=None):
+        self.status = status or {}
+        self.down = down
+        self.delays = delays or {}
+
+        self.requests = []
+        self.running = {}
+        self.max_running = {}
+
+    async def handle(self, request):
+        host = f"{request.url.scheme}://{request.url.host}"
+        self.requests.append(host)
+
+        self.running[host] = self.running.get(host, 0) + 1
+        self.max_running[host] = max(self.max_running.get(host, 0), self.running[host])
+        try:
+            await asyncio.sleep(self.delays.get(host, 0))
+        finally:
+            self.running[host] -= 1
+
+        if host in self.down:
+            raise httpx.ConnectError("Connection refused", request=request)
+
+        codes = self.status.get(host, [200])
+        status = codes.pop(0) if len(codes) > 1 else codes[0]
+        return httpx.Response(status, json={"host": host})
+
+    def upstream(self, hosts=HOSTS, upstream=Upstream, **kwargs):
+        return upstream(hosts, backoff=0, transport=httpx.MockTransport(self.handle), **kwargs)
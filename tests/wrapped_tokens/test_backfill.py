@@ -0,0 +1,189 @@
+#tests/wrapped_tokens/test_backfill.py
+import asyncio
+import unittest
+
+from tests.wrapped_tokens import OPERATOR_DIR  # noqa: F401
+
+from backfill import Backfill
+from state import StateStore, ChainCheckpoint
+
+CONTRACT = "0x42617d2D05d076EC95e0cbE8fCd3e01915501ae5"
+LOG_FILTER = {"address": CONTRACT, "topics": ["0x" + "ab" * 32]}
+
+
+def log(block_number, log_index):
+    return {
+        "address": CONTRACT.lower(),
+        "topics": LOG_FILTER["topics"],
+        "data": "0x",
+        "blockHash": "0x" + f"{block_number:064x}",
+        "blockNumber": hex(block_number),
+        "transactionHash": "0x" + f"{block_number:060x}{log_index:04x}",
+        "transactionIndex": "0x0",
+        "logIndex": hex(log_index),
+    }
+
+
+class FakeEvent:
+    """Stands in for the TokensWrapped event of the clearinghouse contract.
+    """
+    def processLog(self, log):
+        return {"blockNumber": log["blockNumber"], "logIndex": log["logIndex"],
+            "transactionHash": log["transactionHash"]}
+
+
+class FakeUpstream:
+    """Answers eth_getLogs with two logs in every block that is a multiple of 3, the second
+    one first. Ranges of more than max_range blocks fail like a node that refuses to return
+    that many logs. Ranges that contain a block in failures fail as well, and fetches of
+    that block alone fail failures[block] times. Later ranges are answered first.
+    """
+    def __init__(self, latest, max_range=None, failures=None):
+        self.latest = latest
+        self.max_range = max_range
+        self.failures = dict(failures or {})
+        self.requested = []
+
+    async def rpc(self, method, params=()):
+        if method == "eth_blockNumber":
+            return hex(self.latest)
+
+        assert method == "eth_getLogs"
+        log_filter = params[0]
+        self.assertFilter(log_filter)
+
+        from_block, to_block = int(log_filter["fromBlock"], 16), int(log_filter["toBlock"], 16)
+        self.requested.append((from_block, to_block))
+
+        await asyncio.sleep(0.001 * (self.latest - from_block) / self.latest)
+
+        if self.max_range is not None and to_block - from_block + 1 > self.max_range:
+            raise ConnectionError("query returned more than 10000 results")
+
+        for n in range(from_block, to_block + 1):
+            if self.failures.get(n, 0) > 0:
+                if from_block == to_block:
+                    self.failures[n] -= 1
+                raise ConnectionError("request timed out")
+
+        return [log(n, i) for n in range(from_block, to_block + 1) if n % 3 == 0 for i in (1, 0)]
+
+    def assertFilter(self, log_filter):
+        assert log_filter["address"] == LOG_FILTER["address"]
+        assert log_filter["topics"] == LOG_FILTER["topics"]
+
+
+def expectedEvents(from_block, to_block):
+    return [(n, i) for n in range(from_block, to_block + 1) if n % 3 == 0 for i in (0, 1)]
+
+
+class TestBackfill(unittest.TestCase):
+    def setUp(self):
+        self.store = StateStore(":memory:")
+        self.checkpoint = ChainCheckpoint(self.store, "ethereum", start_block=1)
+        self.handled = []
+
+    def tearDown(self):
+        self.store.close()
+
+    def handler(self, event):
+        self.handled.append((event["blockNumber"], event["logIndex"]))
+        self.store.mark_processed(f"{event['blockNumber']}:{event['logIndex']}")
+
+    def backfill(self, upstream, **options):
+        options = dict({"chunk_size": 10, "concurrency": 4, "retry_delay": 0}, **options)
+        return Backfill(upstream, FakeEvent(), LOG_FILTER, self.checkpoint, self.handler, **options)
+
+    def testAllEventsInOrder(self):
+        upstream = FakeUpstream(100)
+
+        last = asyncio.run(self.backfill(upstream).run())
+
+        self.assertEqual(last, 100)
+        self.assertEqual(self.handled, expectedEvents(1, 100))
+        self.assertEqual(self.checkpoint.load(), 100)
+
+        # Every block was requested exactly once
+        blocks = sorted(n for start, end in upstream.requested for n in range(start, end + 1))
+        self.assertEqual(blocks, list(range(1, 101)))
+
+    def testFromCheckpointToBlock(self):
+        self.checkpoint.save(40)
+        upstream = FakeUpstream(100)
+
+        self.assertEqual(asyncio.run(self.backfill(upstream).run(to_block=70)), 70)
+        self.assertEqual(self.handled, expectedEvents(41, 70))
+        self.assertEqual(min(start for start, _ in upstream.requested), 41)
+        self.assertEqual(max(end for _, end in upstream.requested), 70)
+
+    def testNothingToDo(self):
+        self.checkpoint.save(100)
+        upstream = FakeUpstream(100)
+
+        self.assertEqual(asyncio.run(self.backfill(upstream).run()), 100)
+        self.assertEqual(self.handled, [])
+        self.assertEqual(upstream.requested, [])
+
+    def testSplitOnFailure(self):
+        upstream = FakeUpstream(100, max_range=6)
+        backfill = self.backfill(upstream, chunk_size=40)
+
+        self.assertEqual(asyncio.run(backfill.run()), 100)
+
+        self.assertEqual(self.handled, expectedEvents(1, 100))
+        self.assertEqual(self.checkpoint.load(), 100)
+        self.assertLessEqual(backfill.chunk_size, backfill.max_chunk_size)
+
+        # Failed ranges were split, never dropped
+        fetched = sorted(n for start, end in upstream.requested if end - start + 1 <= 6
+            for n in range(start, end + 1))
+        self.assertEqual(fetched, list(range(1, 101)))
+
+    def testRetryFailingBlock(self):
+        upstream = FakeUpstream(30, failures={13: 2})
+
+        self.assertEqual(asyncio.run(self.backfill(upstream, max_retries=5).run()), 30)
+        self.assertEqual(self.handled, expectedEvents(1, 30))
+        self.assertEqual(upstream.requested.count((13, 13)), 3)
+
+    def testMaxRetries(self):
+        upstream = FakeUpstream(100, failures={45: 100})
+
+        with self.assertRaises(ConnectionError):
+            asyncio.run(self.backfill(upstream, max_retries=2).run())
+
+        # The first fetch of the block and max_retries more
+        self.assertEqual(upstream.requested.count((45, 45)), 3)
+
+        # Only the chunks before the failing block are committed, however many after it
+        # were fetched already
+        checkpoint = self.checkpoint.load()
+        self.assertEqual(checkpoint, 44)
+        self.assertEqual(self.handled, expectedEvents(1, checkpoint))
+
+        # A second run starts at the failing block and handles nothing twice
+        upstream.failures = {}
+        self.assertEqual(asyncio.run(self.backfill(upstream).run()), 100)
+        self.assertEqual(self.handled, expectedEvents(1, 100))
+
+    def testRollbackWithCheckpoint(self):
+        def handler(event):
+            if event["blockNumber"] == 27:
+                raise ValueError("Handler failed")
+            self.handler(event)
+
+        backfill = Backfill(FakeUpstream(100), FakeEvent(), LOG_FILTER, self.checkpoint, handler,
+            chunk_size=10, retry_delay=0)
+
+        with self.assertRaises(ValueError):
+            asyncio.run(backfill.run())
+
+        # The chunk of block 27 was rolled back, events and checkpoint alike
+        self.assertEqual(self.checkpoint.load(), 20)
+        self.assertTrue(self.store.is_processed("18:0"))
+        self.assertFalse(self.store.is_processed("21:0"))
+        self.assertFalse(self.store.is_processed("24:1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
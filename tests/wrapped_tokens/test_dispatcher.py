@@ -0,0 +1,309 @@
+#tests/wrapped_tokens/test_dispatcher.py
+import asyncio
+import contextlib
+import io
+import unittest
+
+from tests.wrapped_tokens import OPERATOR_DIR  # noqa: F401
+from tests.wrapped_tokens.fakes import FakeRouter
+
+from web3 import Web3
+
+from dispatcher import Dispatcher, MintDispatcher, ProofDispatcher
+from state import StateStore
+from submitter import TransactionFailed
+
+ROOTS = ["0x" + f"{epoch + 1:x}" * 64 for epoch in range(3)]
+SIGNED_ROOTS = ["0x" + f"{epoch + 1:x}" * 130 for epoch in range(3)]
+
+
+ETH_TOKEN = "0x" + "1" * 40
+
+
+def burnABI(nonce):
+    return f"{nonce:0>256x}"
+
+
+def eventId(i):
+    return f"0x{i:064x}:{i % 2}"
+
+
+class TestMintDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.store = StateStore(":memory:")
+        self.router = FakeRouter()
+        self.dispatcher = MintDispatcher(self.store, self.router, retry_delay=0)
+
+        for i in range(1, 4):
+            self.store.add_pending_mint(eventId(i), ETH_TOKEN, hex(i), f"{i:064x}")
+
+    def tearDown(self):
+        self.store.close()
+
+    def dispatch(self, limit=3):
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(self.dispatcher.dispatch(self.store.pending_mints(limit)))
+
+    def testMint(self):
+        self.dispatch(limit=1)
+
+        self.assertEqual(self.router.sent[0][:2], ("mint", {"ethereum_contract": ETH_TOKEN, "amount": "0x1",
+            "lamden_wallet": f"{1:064x}", "event_id": eventId(1)}))
+        self.assertEqual(self.router.minted, {tuple(eventId(1).split(":")): (ETH_TOKEN, "0x1", f"{1:064x}")})
+        self.assertEqual(self.store.count_pending_mints(), 2)
+
+    def testMintBatch(self):
+        self.dispatch()
+
+        self.assertEqual(self.router.sent[0][0], "mint_batch")
+        self.assertEqual([record[3] for record in self.router.sent[0][1]["records"]],
+            [eventId(i) for i in range(1, 4)])
+        self.assertEqual(len(self.router.minted), 3)
+        self.assertEqual(self.store.count_pending_mints(), 0)
+
+    def testMintedWithLostResult(self):
+        self.router.lost_results["mint_batch"] = 1
+
+        # The deposits are found in minted instead
+        self.dispatch()
+
+        self.assertEqual(len(self.router.sent), 1)
+        self.assertEqual(len(self.router.minted), 3)
+        self.assertEqual(self.store.count_pending_mints(), 0)
+
+    def testMintedBeforeRestart(self):
+        # A batch of two of the deposits got minted, but its result never arrived
+        self.router.mint_batch([[ETH_TOKEN, hex(i), f"{i:064x}", eventId(i)] for i in (1, 3)])
+
+        # The router refuses the batch, the minted deposits are done and the other is sent alone
+        self.dispatch()
+
+        self.assertEqual(self.store.count_pending_mints(), 0)
+        self.assertEqual(self.store.count_failed_mints(), 0)
+        self.assertEqual(sorted(self.router.minted), sorted(tuple(eventId(i).split(":")) for i in range(1, 4)))
+        self.assertEqual([function for function, _, _ in self.router.sent], ["mint_batch", "mint"])
+
+    def testRefusedDepositIsPutAside(self):
+        bad_token = "0x" + "f" * 40
+        self.router.unsupported_tokens.add(bad_token)
+        for i in range(4, 12):
+            self.store.add_pending_mint(eventId(i), bad_token if i == 6 else ETH_TOKEN, hex(i), f"{i:064x}")
+
+        self.dispatch(limit=11)
+
+        self.assertEqual(self.store.count_pending_mints(), 0)
+        self.assertEqual(len(self.router.minted), 10)
+        self.assertEqual([mint[:4] for mint in self.store.failed_mints()],
+            [(eventId(6), bad_token, hex(6), f"{6:064x}")])
+        self.assertIn("Invalid Ethereum Token!", self.store.failed_mints()[0][4])
+
+        # The refused deposit is found by halving the batch, not by sending every deposit alone
+        self.assertLessEqual(len(self.router.sent), 9)
+        self.assertIn(("mint", {"ethereum_contract": bad_token, "amount": hex(6),
+            "lamden_wallet": f"{6:064x}", "event_id": eventId(6)}), [sent[:2] for sent in self.router.sent])
+
+    def testRejectedBatchStaysPending(self):
+        # A transaction the masternode rejects did not run, so nothing is put aside
+        self.router.rejected["mint_batch"] = 1
+
+        with self.assertRaises(TransactionFailed):
+            self.dispatch()
+
+        self.assertEqual(self.router.minted, {})
+        self.assertEqual(self.store.count_pending_mints(), 3)
+        self.assertEqual(self.store.count_failed_mints(), 0)
+        self.assertEqual(len(self.router.sent), 1)
+
+
+class ListDispatcher(Dispatcher):
+    """Dispatches numbers from a list. A batch is held until release is set, and
+    failures[0] batches fail.
+    """
+    def __init__(self, **kwargs):
+        super().__init__(store=None, submitter=None, retry_delay=0, **kwargs)
+        self.queue = []
+        self.batches = []
+        self.failures = [0]
+        self.release = asyncio.Event()
+        self.release.set()
+
+    def add(self, *items):
+        self.queue.extend(items)
+        self.notify()
+
+    def count_pending(self):
+        return len(self.queue)
+
+    def pending(self, limit):
+        return self.queue[:limit]
+
+    def key(self, item):
+        return item
+
+    async def dispatch(self, items):
+        self.batches.append((asyncio.get_event_loop().time(), items))
+        await self.release.wait()
+
+        if self.failures[0] > 0:
+            self.failures[0] -= 1
+            raise TransactionFailed("Transaction nonce is invalid.")
+        self.queue = [item for item in self.queue if item not in items]
+
+
+class TestServe(unittest.TestCase):
+    def serve(self, steps, **kwargs):
+        """Runs steps(dispatcher) while the dispatcher serves.
+        """
+        async def main():
+            dispatcher = ListDispatcher(**kwargs)
+            task = asyncio.ensure_future(dispatcher.serve())
+            try:
+                await steps(dispatcher)
+            finally:
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+            return dispatcher
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            return asyncio.run(main())
+
+    def testLatencyBudget(self):
+        async def steps(dispatcher):
+            self.start = asyncio.get_event_loop().time()
+            dispatcher.add(1)
+            await asyncio.sleep(0.05)
+            self.assertEqual(dispatcher.batches, [])
+
+            await asyncio.sleep(0.3)
+
+        dispatcher = self.serve(steps, max_batch_size=3, max_latency=0.2)
+
+        self.assertEqual([batch for _, batch in dispatcher.batches], [[1]])
+        self.assertGreaterEqual(dispatcher.batches[0][0] - self.start, 0.2)
+        self.assertEqual(dispatcher.queue, [])
+
+    def testSizeLimit(self):
+        async def steps(dispatcher):
+            dispatcher.add(*range(7))
+            await asyncio.sleep(0.1)
+
+        dispatcher = self.serve(steps, max_batch_size=3, max_latency=10)
+
+        # Full batches go out right away, the last one waits for more items or its deadline
+        self.assertEqual([batch for _, batch in dispatcher.batches], [[0, 1, 2], [3, 4, 5]])
+        self.assertEqual(dispatcher.queue, [6])
+
+    def testItemsInFlightAreLeftOut(self):
+        async def steps(dispatcher):
+            dispatcher.release.clear()
+            dispatcher.add(1, 2)
+            await asyncio.sleep(0.1)
+
+            # 1 and 2 are still being sent, the next batch only has the new item
+            dispatcher.add(3)
+            await asyncio.sleep(0.1)
+            self.assertEqual(dispatcher.sending, {1, 2, 3})
+
+            dispatcher.release.set()
+            await asyncio.sleep(0.01)
+
+        dispatcher = self.serve(steps, max_batch_size=3, max_latency=0.05)
+
+        self.assertEqual([batch for _, batch in dispatcher.batches], [[1, 2], [3]])
+        self.assertEqual(dispatcher.queue, [])
+        self.assertEqual(dispatcher.sending, set())
+
+    def testFailedBatchIsSentAgain(self):
+        async def steps(dispatcher):
+            dispatcher.failures[0] = 1
+            dispatcher.add(1, 2)
+            await asyncio.sleep(0.1)
+
+        dispatcher = self.serve(steps, max_batch_size=2, max_latency=10)
+
+        # Without anything new added, the failed items are noticed again and make a full batch
+        self.assertEqual([batch for _, batch in dispatcher.batches], [[1, 2], [1, 2]])
+        self.assertEqual(dispatcher.queue, [])
+
+    def testLeftoverItemsAreSentOnStart(self):
+        async def main():
+            dispatcher = ListDispatcher(max_batch_size=2, max_latency=0.01)
+            dispatcher.queue = [1]
+            task = asyncio.ensure_future(dispatcher.serve())
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+            return dispatcher
+
+        dispatcher = asyncio.run(main())
+        self.assertEqual([batch for _, batch in dispatcher.batches], [[1]])
+
+
+class TestProofDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.store = StateStore(":memory:")
+        self.router = FakeRouter()
+        self.dispatcher = ProofDispatcher(self.store, self.router, retry_delay=0)
+
+        # Three epochs of two burns each, sealed on the router and signed
+        for epoch in range(3):
+            for nonce in (2 * epoch + 1, 2 * epoch + 2):
+                self.store.add_burn(burnABI(nonce), f"tx{nonce}", self.router.burn(burnABI(nonce)))
+            self.router.seal_epoch()
+
+            first_sequence = 2 * epoch + 1
+            self.store.add_epoch(epoch, first_sequence, first_sequence + 1)
+            self.store.set_epoch_signature(epoch, ROOTS[epoch], SIGNED_ROOTS[epoch],
+                [(burnABI(first_sequence), []), (burnABI(first_sequence + 1), [])])
+
+    def tearDown(self):
+        self.store.close()
+
+    def dispatch(self, limit=3):
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(self.dispatcher.dispatch(self.store.unposted_epochs(limit)))
+
+    def testPostRoots(self):
+        self.dispatch()
+
+        self.assertEqual(self.router.epoch_roots, dict(enumerate(ROOTS)))
+        self.assertEqual(self.router.proofs, dict(zip(ROOTS, SIGNED_ROOTS)))
+        self.assertEqual([function for function, _, _ in self.router.sent], ["post_root"] * 3)
+
+        self.assertEqual(self.store.count_unposted_epochs(), 0)
+        self.assertTrue(all(self.store.find_proof(abi_hash=Web3.toHex(Web3.keccak(hexstr=burnABI(nonce))))["posted"]
+            for nonce in range(1, 7)))
+
+    def testRootPostedWithLostResult(self):
+        self.router.lost_results["post_root"] = 1
+        self.dispatch(limit=1)
+
+        # The root is found on the router instead
+        self.assertEqual(self.store.count_unposted_epochs(), 2)
+        self.assertEqual(self.router.epoch_roots, {0: ROOTS[0]})
+        self.assertEqual(len(self.router.sent), 1)
+
+    def testRootPostedBeforeRestart(self):
+        self.router.post_root(0, ROOTS[0], SIGNED_ROOTS[0])
+
+        # Sending it again fails on the router, which already holds the root
+        self.dispatch(limit=1)
+
+        self.assertEqual(self.store.count_unposted_epochs(), 2)
+        self.assertEqual(self.router.epoch_roots, {0: ROOTS[0]})
+
+    def testFailedRootIsNotPosted(self):
+        # Another root is already posted for epoch 1, this one must never be marked posted
+        self.router.epoch_roots[1] = ROOTS[2]
+
+        with self.assertRaises(TransactionFailed):
+            self.dispatch()
+
+        self.assertEqual([epoch[0] for epoch in self.store.unposted_epochs()], [1])
+        self.assertEqual(self.router.epoch_roots, {0: ROOTS[0], 1: ROOTS[2], 2: ROOTS[2]})
+
+
+if __name__ == "__main__":
+    unittest.main()
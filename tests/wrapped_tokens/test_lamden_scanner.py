@@ -0,0 +1,168 @@
+#tests/wrapped_tokens/test_lamden_scanner.py
+import asyncio
+import contextlib
+import io
+import unittest
+
+from tests.wrapped_tokens import OPERATOR_DIR  # noqa: F401
+
+from lamden_scanner import LamdenScanner, find_burn_transactions
+from state import StateStore, ChainCheckpoint
+
+CONTRACT_NAME = "con_clearing_house"
+
+
+def burnABI(i):
+    return f"{i:064x}" * 4
+
+
+def burnTransaction(abi, contract=CONTRACT_NAME, function="burn", status=0, result=None, sequence=1):
+    return {
+        "hash": f"tx{abi[:8]}",
+        "status": status,
+        "result": repr(abi) if result is None else result,
+        "state": [
+            {"key": f"{contract}.nonces:0x{'2' * 40}", "value": sequence},
+            {"key": f"{contract}.queue:{sequence}", "value": abi},
+            {"key": f"{contract}.sequence", "value": sequence},
+        ],
+        "transaction": {
+            "payload": {"contract": contract, "function": function},
+            "metadata": {"timestamp": 1600000000},
+        },
+    }
+
+
+def block(*transactions):
+    return {"subblocks": [{"transactions": list(transactions)}]}
+
+
+class FakeMasternodes:
+    """Serves blocks 1 to latest, block n having a burn with burnABI(n). Blocks are answered
+    in reverse order of their numbers within a window, and failures[n] fetches of block n
+    fail before one succeeds.
+    """
+    def __init__(self, latest, failures=None):
+        self.latest = latest
+        self.failures = dict(failures or {})
+        self.fetched = []
+
+    async def get_json(self, path, **params):
+        if path == "/latest_block_num":
+            return {"latest_block_number": self.latest}
+
+        number = params["num"]
+        self.fetched.append(number)
+
+        # Later blocks of a window arrive first
+        await asyncio.sleep(0.001 * (self.latest - number))
+
+        if self.failures.get(number, 0) > 0:
+            self.failures[number] -= 1
+            raise ConnectionError(f"Block {number} not available")
+
+        return block(burnTransaction(burnABI(number), sequence=number))
+
+
+class TestLamdenScanner(unittest.TestCase):
+    def setUp(self):
+        self.store = StateStore(":memory:")
+        self.checkpoint = ChainCheckpoint(self.store, "lamden", start_block=1)
+        self.handled = []
+
+    def tearDown(self):
+        self.store.close()
+
+    def handler(self, abi, tx_hash, sequence):
+        self.handled.append(abi)
+        self.store.add_burn(abi, tx_hash, sequence)
+
+    def scan(self, masternodes, **kwargs):
+        scanner = LamdenScanner(masternodes, CONTRACT_NAME, self.checkpoint, self.handler,
+            window=4, poll_interval=0)
+        return asyncio.run(scanner.scan(**kwargs))
+
+    def testScanInOrder(self):
+        last = self.scan(FakeMasternodes(10))
+
+        self.assertEqual(last, 10)
+        self.assertEqual(self.handled, [burnABI(i) for i in range(1, 11)])
+        self.assertEqual(self.checkpoint.load(), 10)
+
+    def testScanFromCheckpoint(self):
+        self.checkpoint.save(6)
+        masternodes = FakeMasternodes(10)
+
+        self.assertEqual(self.scan(masternodes), 10)
+        self.assertEqual(sorted(set(masternodes.fetched)), [7, 8, 9, 10])
+        self.assertEqual(self.handled, [burnABI(i) for i in range(7, 11)])
+
+    def testScanToBlock(self):
+        masternodes = FakeMasternodes(10)
+
+        self.assertEqual(self.scan(masternodes, to_block=3), 3)
+        self.assertEqual(self.handled, [burnABI(i) for i in range(1, 4)])
+        self.assertEqual(self.checkpoint.load(), 3)
+
+    def testRefetchAfterFailure(self):
+        masternodes = FakeMasternodes(10, failures={3: 2, 8: 1})
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(self.scan(masternodes), 10)
+
+        # Nothing after a failed block is handled before it
+        self.assertEqual(self.handled, [burnABI(i) for i in range(1, 11)])
+        self.assertEqual(masternodes.fetched.count(3), 3)
+        self.assertEqual(masternodes.fetched.count(8), 2)
+        self.assertEqual(self.checkpoint.load(), 10)
+        self.assertEqual([burn[3] for burn in self.store.unsealed_burns()], list(range(1, 11)))
+
+    def testCheckpointOnlyOverCommittedBlocks(self):
+        def handler(abi, tx_hash, sequence):
+            if abi == burnABI(6):
+                raise ValueError("Handler failed")
+            self.handler(abi, tx_hash, sequence)
+
+        scanner = LamdenScanner(FakeMasternodes(10), CONTRACT_NAME, self.checkpoint, handler,
+            window=4, poll_interval=0)
+
+        with self.assertRaises(ValueError):
+            asyncio.run(scanner.scan())
+
+        # The batch that contained block 6 was rolled back together with its checkpoint
+        checkpoint = self.checkpoint.load()
+        self.assertLess(checkpoint, 6)
+        self.assertEqual(self.store.count_unsigned_burns(), checkpoint)
+
+        # Scanning again picks up right after the checkpoint
+        self.handled = []
+        self.assertEqual(self.scan(FakeMasternodes(10)), 10)
+        self.assertEqual(self.handled, [burnABI(i) for i in range(checkpoint + 1, 11)])
+        self.assertEqual(self.store.count_unsigned_burns(), 10)
+
+    def testFindBurnTransactions(self):
+        abi = burnABI(1)
+        burns = find_burn_transactions(block(
+            burnTransaction(abi, sequence=7),
+            burnTransaction(burnABI(2), contract="con_other"),
+            burnTransaction(burnABI(3), function="mint"),
+            burnTransaction(burnABI(4), status=1),
+            burnTransaction(burnABI(5), result="AssertionError('Only owner can call!')"),
+        ), CONTRACT_NAME)
+
+        self.assertEqual(burns, [(abi, f"tx{abi[:8]}", 1600000000, 7)])
+
+    def testFindBurnTransactionsWithoutState(self):
+        transaction = burnTransaction(burnABI(1))
+        del transaction["state"]
+
+        self.assertEqual(find_burn_transactions(block(transaction), CONTRACT_NAME),
+            [(burnABI(1), transaction["hash"], 1600000000, None)])
+
+    def testFindBurnTransactionsEmptyBlock(self):
+        self.assertEqual(find_burn_transactions({}, CONTRACT_NAME), [])
+        self.assertEqual(find_burn_transactions({"subblocks": None}, CONTRACT_NAME), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,217 @@
+#tests/wrapped_tokens/test_listener.py
+import asyncio
+import contextlib
+import io
+import json
+import unittest
+
+from tests.wrapped_tokens import OPERATOR_DIR  # noqa: F401
+
+from web3 import Web3
+
+from server import CLEARING_HOUSE_ADDRESS, EventListener
+from state import StateStore
+
+ETH_TOKEN = "0xF08eF1668524a98893D97F16Ad134dA8cccefb03"
+SUBSCRIPTION = "0x9cef478923ff08bf67fde6c64013158d"
+TOKENS_WRAPPED = Web3.toHex(Web3.keccak(text="TokensWrapped(address,string,uint256)"))
+
+
+def log(block_number, log_index=0, receiver="ab" * 32, amount=10 ** 18, removed=False):
+    """A TokensWrapped log the way eth_subscribe and eth_getLogs send it.
+    """
+    data = receiver.encode()
+    return {
+        "address": CLEARING_HOUSE_ADDRESS.lower(),
+        "topics": [TOKENS_WRAPPED, "0x" + f"{ETH_TOKEN[2:].lower():0>64}", "0x" + f"{amount:064x}"],
+        "data": "0x" + f"{32:064x}" + f"{len(data):064x}" + data.hex().ljust((len(data) + 31) // 32 * 64, "0"),
+        "blockHash": "0x" + f"{block_number:064x}",
+        "blockNumber": hex(block_number),
+        "transactionHash": "0x" + f"{block_number:060x}{log_index:04x}",
+        "transactionIndex": "0x0",
+        "logIndex": hex(log_index),
+        "removed": removed,
+    }
+
+
+def notification(log, subscription=SUBSCRIPTION):
+    return json.dumps({"jsonrpc": "2.0", "method": "eth_subscription",
+        "params": {"subscription": subscription, "result": log}})
+
+
+class FakeWebSocket:
+    """Stands in for a websockets connection that has subscribed and then receives the
+    given messages. It closes after the last one if drops, and when close is called.
+    """
+    def __init__(self, messages=(), reply=None, drops=True):
+        self.reply = reply or {"jsonrpc": "2.0", "id": 1, "result": SUBSCRIPTION}
+        self.messages = asyncio.Queue()
+        for message in messages:
+            self.messages.put_nowait(message)
+        if drops:
+            self.messages.put_nowait(None)
+
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(json.loads(message))
+
+    async def recv(self):
+        return json.dumps(self.reply)
+
+    async def close(self):
+        self.messages.put_nowait(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self.messages.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class FakeEthereum:
+    """Stands in for the sessions.Upstream of the Ethereum RPC, with latest as the latest
+    block and the logs eth_getLogs returns.
+    """
+    def __init__(self, latest, logs=()):
+        self.latest = latest
+        self.logs = list(logs)
+
+    async def rpc(self, method, params=()):
+        if method == "eth_blockNumber":
+            return hex(self.latest)
+        if method == "eth_getBlockByNumber":
+            return {"timestamp": hex(1600000000)}
+
+        assert method == "eth_getLogs"
+        from_block, to_block = int(params[0]["fromBlock"], 16), int(params[0]["toBlock"], 16)
+        return [log for log in self.logs if from_block <= int(log["blockNumber"], 16) <= to_block]
+
+
+class TestEventListener(unittest.TestCase):
+    def setUp(self):
+        self.store = StateStore(":memory:")
+        self.handled = []
+
+    def tearDown(self):
+        self.store.close()
+
+    def listener(self, ethereum, **kwargs):
+        return EventListener(self.store, ethereum, ws_url="wss://ethereum", handler=self.handle,
+            retry_delay=0, **kwargs)
+
+    def handle(self, event):
+        self.handled.append((event["blockNumber"], event["logIndex"]))
+
+    def listen(self, listener, messages, last_block):
+        async def listen():
+            listener.last_block = last_block
+            await listener.listen(FakeWebSocket(messages), SUBSCRIPTION)
+            # Lets the observations of the event_seen stage finish
+            await asyncio.sleep(0)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(listen())
+
+    def testSubscribe(self):
+        listener = self.listener(FakeEthereum(10))
+        ws = FakeWebSocket()
+
+        self.assertEqual(asyncio.run(listener.subscribe(ws)), SUBSCRIPTION)
+        self.assertEqual(ws.sent[0]["method"], "eth_subscribe")
+        self.assertEqual(ws.sent[0]["params"], ["logs", listener.log_filter])
+
+        with self.assertRaises(ConnectionError):
+            asyncio.run(listener.subscribe(FakeWebSocket(reply={"error": {"message": "rate limited"}})))
+
+    def testDecodeEvent(self):
+        events = []
+        listener = self.listener(FakeEthereum(10))
+        listener.handler = events.append
+
+        self.listen(listener, [notification(log(11, 2, receiver="cd" * 32, amount=5))], last_block=10)
+
+        args = events[0]["args"]
+        self.assertEqual((args["token"], args["receiver"], args["amount"]), (ETH_TOKEN, "cd" * 32, 5))
+
+    def testDropRemovedLogs(self):
+        listener = self.listener(FakeEthereum(10))
+
+        self.listen(listener, [notification(log(11, 0, removed=True)), notification(log(11, 1))], last_block=10)
+
+        self.assertEqual(self.handled, [(11, 1)])
+
+    def testIgnoreOtherSubscriptions(self):
+        listener = self.listener(FakeEthereum(10))
+
+        self.listen(listener, [notification(log(11), subscription="0x1"), "{\"jsonrpc\": \"2.0\", \"id\": 2}",
+            notification(log(12))], last_block=10)
+
+        self.assertEqual(self.handled, [(12, 0)])
+
+    def testSkipEventsOfBackfill(self):
+        listener = self.listener(FakeEthereum(10))
+
+        # The backfill handled everything up to block 10
+        self.listen(listener, [notification(log(n)) for n in (9, 10, 11)], last_block=10)
+
+        self.assertEqual(self.handled, [(11, 0)])
+
+    def testCheckpointBeforeBlock(self):
+        listener = self.listener(FakeEthereum(10))
+
+        self.listen(listener, [notification(log(12, 0)), notification(log(12, 1))], last_block=10)
+
+        # More events of block 12 may follow, so it is not complete yet
+        self.assertEqual(listener.checkpoint.load(), 11)
+        self.assertEqual(self.handled, [(12, 0), (12, 1)])
+
+    def testReconnectWithBackoff(self):
+        attempts = []
+
+        def connect(url):
+            attempts.append(asyncio.get_event_loop().time())
+
+            # Three failed attempts, one connection that drops, then one that stays open
+            if len(attempts) <= 3:
+                raise ConnectionError("Connection refused")
+            return FakeWebSocket([notification(log(20 + len(attempts) - 3))], drops=len(attempts) == 4)
+
+        ethereum = FakeEthereum(20, logs=[log(15)])
+        listener = self.listener(ethereum, connect=connect, initial_backoff=0.02, backoff_factor=2,
+            max_backoff=0.05)
+
+        async def serve():
+            task = asyncio.ensure_future(listener.serve())
+            while len(attempts) < 5 or len(self.handled) < 3:
+                await asyncio.sleep(0.01)
+
+            self.assertTrue(listener.caught_up)
+            listener.stop()
+            await task
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(asyncio.wait_for(serve(), 5))
+
+        # The delay grows up to max_backoff, and starts over once a connection was made
+        gaps = [later - earlier for earlier, later in zip(attempts, attempts[1:])]
+        for gap, backoff in zip(gaps, (0.02, 0.04, 0.05, 0.02)):
+            self.assertGreaterEqual(gap, backoff * 0.9)
+        self.assertLess(gaps[3], 0.04)
+
+        # The backfill after connecting found the event of block 15
+        self.assertEqual(self.handled, [(15, 0), (21, 0), (22, 0)])
+        self.assertFalse(listener.caught_up)
+
+
+if __name__ == "__main__":
+    unittest.main()
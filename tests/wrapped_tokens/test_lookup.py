@@ -0,0 +1,156 @@
+#tests/wrapped_tokens/test_lookup.py
+import json
+import os
+import unittest
+
+from tests.wrapped_tokens import OPERATOR_DIR
+
+from eth_account import Account
+from eth_account.messages import encode_defunct
+from web3 import Web3
+
+from lookup import ProofIndex
+from merkle import verify_proof
+from signer import sign_epoch
+from state import StateStore
+
+PRIVATE_KEY = "0x" + "4c" * 32
+ETH_TOKEN = "0xF08eF1668524a98893D97F16Ad134dA8cccefb03"
+ETH_ADDRESS = "0xEA674fdDe714fd979de3EdF0F56AA9716B898ec8"
+
+
+def burnABI(nonce, amount=10 ** 18, address=ETH_ADDRESS, token=ETH_TOKEN):
+    return (f"{token[2:]:0>64}" + f"{amount:064x}" + f"{nonce:064x}" + f"{address[2:]:0>64}").lower()
+
+
+def abiHash(abi):
+    return Web3.toHex(Web3.keccak(hexstr=abi))
+
+
+class TestLookup(unittest.TestCase):
+    def setUp(self):
+        self.store = StateStore(":memory:")
+        self.proofs = ProofIndex(self.store, cache_size=2)
+        self.roots = []
+
+        # Epoch 0 holds burns 1 to 3, epoch 1 only burn 4, burn 5 is not sealed yet
+        for nonce in range(1, 6):
+            self.store.add_burn(burnABI(nonce), f"tx{nonce}", nonce)
+
+        self.sign(0, 1, 3)
+        self.sign(1, 4, 4)
+
+    def tearDown(self):
+        self.store.close()
+
+    def sign(self, epoch, first_sequence, last_sequence):
+        abis = [burn[0] for burn in self.store.epoch_burns(first_sequence, last_sequence)]
+        signed = sign_epoch(abis, PRIVATE_KEY)
+        self.roots.append(bytes(Web3.toBytes(hexstr=signed["root"])))
+
+        self.store.add_epoch(epoch, first_sequence, last_sequence)
+        self.store.set_epoch_signature(epoch, signed["root"], signed["signature"], list(zip(abis, signed["proofs"])))
+
+    def assertWithdrawable(self, proof, nonce):
+        withdraw = proof["withdraw"]
+        self.assertEqual((withdraw["token"], withdraw["amount"], withdraw["nonce"]),
+            (ETH_TOKEN.lower(), str(10 ** 18), nonce))
+        self.assertEqual(proof["ethereum_address"], ETH_ADDRESS.lower())
+
+        # What ClearingHouse.withdraw checks: the path leads to a root that v, r and s sign
+        path = [bytes(Web3.toBytes(hexstr=h)) for h in withdraw["proof"]]
+        roots = [root for root in self.roots if verify_proof(proof["abi"], path, root)]
+        self.assertEqual(len(roots), 1)
+
+        signature = bytes.fromhex(withdraw["r"][2:] + withdraw["s"][2:]) + bytes([withdraw["v"]])
+        self.assertEqual(Account.recover_message(encode_defunct(primitive=roots[0]), signature=signature),
+            Account.from_key(PRIVATE_KEY).address)
+
+    def testByHash(self):
+        body, status = self.proofs.lookup({"hash": abiHash(burnABI(2))})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body["hash"], abiHash(burnABI(2)))
+        self.assertEqual(len(body["withdraw"]["proof"]), 2)
+        self.assertWithdrawable(body, 2)
+
+        # Hashes are not case sensitive
+        self.assertEqual(self.proofs.lookup({"hash": "0x" + abiHash(burnABI(2))[2:].upper()}), (body, 200))
+
+    def testWithdrawArgumentsMatchABI(self):
+        body, _ = self.proofs.lookup({"hash": abiHash(burnABI(2))})
+
+        # Both operators call the ClearingHouse with these ABIs
+        for path in (os.path.join(OPERATOR_DIR, "abi.json"),
+                     os.path.join(OPERATOR_DIR, "..", "..", "server", "abi", "clearinghouse.json")):
+            with open(path) as f:
+                withdraw = next(entry for entry in json.load(f) if entry.get("name") == "withdraw")
+
+            with self.subTest(abi=os.path.basename(path)):
+                self.assertEqual([arg["name"] for arg in withdraw["inputs"]], list(body["withdraw"]))
+                self.assertEqual(withdraw["inputs"][3]["type"], "bytes32[]")
+
+    def testByAddressAndNonce(self):
+        body, status = self.proofs.lookup({"ethereum_address": ETH_ADDRESS, "nonce": "3"})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body["abi"], burnABI(3))
+        self.assertWithdrawable(body, 3)
+
+    def testBurnSignedOnItsOwn(self):
+        body, status = self.proofs.lookup({"ethereum_address": ETH_ADDRESS.lower(), "nonce": "4"})
+
+        # The root of an epoch of one burn is the hash of its ABI
+        self.assertEqual(status, 200)
+        self.assertEqual(body["withdraw"]["proof"], [])
+        self.assertWithdrawable(body, 4)
+
+    def testInvalidArguments(self):
+        for args, error in [
+            ({}, "Pass hash, or ethereum_address and nonce"),
+            ({"ethereum_address": ETH_ADDRESS}, "Pass hash, or ethereum_address and nonce"),
+            ({"hash": abiHash(burnABI(1))[:-1]}, "Invalid hash"),
+            ({"hash": "0x" + "g" * 64}, "Invalid hash"),
+            ({"ethereum_address": ETH_ADDRESS[:-1], "nonce": "1"}, "Invalid Ethereum address"),
+            ({"ethereum_address": ETH_ADDRESS[2:] + "00", "nonce": "1"}, "Invalid Ethereum address"),
+            ({"ethereum_address": ETH_ADDRESS, "nonce": "-1"}, "Invalid nonce"),
+            ({"ethereum_address": ETH_ADDRESS, "nonce": "0x1"}, "Invalid nonce"),
+        ]:
+            self.assertEqual(self.proofs.lookup(args), ({"error": error}, 400), args)
+
+    def testNotSigned(self):
+        for args in [{"hash": abiHash(burnABI(5))}, {"hash": "0x" + "0" * 64},
+                {"ethereum_address": ETH_ADDRESS, "nonce": "5"}, {"ethereum_address": ETH_ADDRESS, "nonce": "6"}]:
+            self.assertEqual(self.proofs.lookup(args), ({"error": "No signed proof yet"}, 404), args)
+
+    def testCachesOnlyPostedProofs(self):
+        args = {"hash": abiHash(burnABI(1))}
+
+        # Not posted yet, so every lookup reads the store again
+        self.assertFalse(self.proofs.lookup(args)[0]["posted"])
+        self.proofs.lookup(args)
+        self.assertEqual((self.proofs.hits, self.proofs.misses), (0, 2))
+        self.assertEqual(len(self.proofs.cache), 0)
+
+        self.store.mark_epochs_posted([0])
+
+        self.assertTrue(self.proofs.lookup(args)[0]["posted"])
+        self.assertTrue(self.proofs.lookup(args)[0]["posted"])
+        self.assertEqual((self.proofs.hits, self.proofs.misses), (1, 3))
+
+    def testCacheEvictsLeastRecentlyUsed(self):
+        self.store.mark_epochs_posted([0, 1])
+
+        for nonce in (1, 2, 1, 3):
+            self.proofs.lookup({"ethereum_address": ETH_ADDRESS, "nonce": str(nonce)})
+
+        self.assertEqual(list(self.proofs.cache), [(ETH_ADDRESS.lower(), 1), (ETH_ADDRESS.lower(), 3)])
+
+        # Evicted proofs are read from the store again
+        misses = self.proofs.misses
+        self.assertEqual(self.proofs.lookup({"ethereum_address": ETH_ADDRESS, "nonce": "2"})[1], 200)
+        self.assertEqual(self.proofs.misses, misses + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+#tests/wrapped_tokens/test_masternodes.py
+import asyncio
+import unittest
+
+from tests.wrapped_tokens import OPERATOR_DIR  # noqa: F401
+from tests.wrapped_tokens.fakes import HOSTS, FakeHosts
+
+import httpx
+
+from masternodes import Masternodes
+from sessions import UpstreamError
+
+
+class TestMasternodes(unittest.TestCase):
+    def masternodes(self, fake, **kwargs):
+        return fake.upstream(upstream=Masternodes, smoothing=0.5, **kwargs)
+
+    def runAsync(self, masternodes, coroutine):
+        async def run():
+            try:
+                return await coroutine
+            finally:
+                await masternodes.close()
+
+        return asyncio.run(run())
+
+    def testRouteToFastestHost(self):
+        masternodes = self.masternodes(FakeHosts())
+
+        async def steps():
+            # Hosts without a measurement come first, so every host gets measured
+            masternodes.record("http://b", 0.3, True)
+            self.assertEqual(masternodes.host_order(), ["http://a", "http://c", "http://b"])
+
+            masternodes.record("http://a", 0.5, True)
+            masternodes.record("http://c", 0.1, True)
+            self.assertEqual(masternodes.host_order(), ["http://c", "http://b", "http://a"])
+
+            # Latencies are moving averages
+            masternodes.record("http://a", 0.05, True)
+            self.assertAlmostEqual(masternodes.stats["http://a"].latency, 0.275)
+            self.assertEqual(masternodes.host_order(), ["http://c", "http://a", "http://b"])
+
+        self.runAsync(masternodes, steps())
+
+    def testEjectAndRecover(self):
+        masternodes = self.masternodes(FakeHosts(), cooldown=0.05)
+
+        async def steps():
+            for host, latency in zip(HOSTS, (0.1, 0.2, 0.3)):
+                masternodes.record(host, latency, True)
+
+            # A single error does not eject a host
+            masternodes.record("http://a", 0.1, False)
+            self.assertEqual(masternodes.stats["http://a"].error_rate, 0.5)
+            self.assertEqual(masternodes.host_order(), HOSTS)
+
+            masternodes.record("http://a", 0.1, False)
+            self.assertEqual(masternodes.host_order(), ["http://b", "http://c", "http://a"])
+            self.assertEqual(masternodes.stats["http://a"].error_rate, 0)
+
+            # After the cooldown it gets requests again
+            await asyncio.sleep(0.06)
+            self.assertEqual(masternodes.host_order(), HOSTS)
+
+        self.runAsync(masternodes, steps())
+
+    def testRequestsRecordStats(self):
+        hosts = FakeHosts(status={"http://a": [503, 200]})
+        masternodes = self.masternodes(hosts, max_error_rate=0.4, cooldown=10)
+
+        response = self.runAsync(masternodes, masternodes.request("GET", "/latest_block_num"))
+
+        self.assertEqual(response.json(), {"host": "http://b"})
+        self.assertIsNone(masternodes.stats["http://a"].latency)
+        self.assertGreater(masternodes.stats["http://a"].down_until, 0)
+        self.assertIsNotNone(masternodes.stats["http://b"].latency)
+
+    def testFastHostIsNotHedged(self):
+        hosts = FakeHosts()
+        masternodes = self.masternodes(hosts, min_hedge_after=0.5)
+
+        data = self.runAsync(masternodes, masternodes.get_json("/latest_block_num"))
+
+        self.assertEqual(data, {"host": "http://a"})
+        self.assertEqual(hosts.requests, ["http://a"])
+
+    def testHedgeSlowHost(self):
+        hosts = FakeHosts(delays={"http://a": 0.3})
+        masternodes = self.masternodes(hosts, min_hedge_after=0.05)
+
+        data = self.runAsync(masternodes, masternodes.get_json("/tx", hash="0x1"))
+
+        self.assertEqual(data, {"host": "http://b"})
+        self.assertEqual(hosts.requests, ["http://a", "http://b"])
+
+        # The cancelled request still tells how slow the first host was
+        self.assertGreaterEqual(masternodes.stats["http://a"].latency, 0.05)
+        self.assertLess(masternodes.stats["http://a"].latency, 0.3)
+        self.assertEqual(masternodes.stats["http://a"].error_rate, 0)
+
+    def testHedgeAfterLatency(self):
+        masternodes = self.masternodes(FakeHosts(), hedge_factor=3, min_hedge_after=0.1)
+
+        async def steps():
+            self.assertEqual(masternodes.hedge_after("http://a"), 0.1)
+            masternodes.record("http://a", 0.01, True)
+            self.assertEqual(masternodes.hedge_after("http://a"), 0.1)
+            masternodes.record("http://b", 0.2, True)
+            self.assertAlmostEqual(masternodes.hedge_after("http://b"), 0.6)
+
+        self.runAsync(masternodes, steps())
+
+    def testSlowPrimaryWins(self):
+        # The hedge fails, so the first host's answer is used after all
+        hosts = FakeHosts(delays={"http://a": 0.1}, down=["http://b"])
+        masternodes = self.masternodes(hosts, hosts=HOSTS[:2], min_hedge_after=0.02, retries=0)
+
+        data = self.runAsync(masternodes, masternodes.get_json("/tx", hash="0x1"))
+        self.assertEqual(data, {"host": "http://a"})
+
+    def testBothRequestsFail(self):
+        hosts = FakeHosts(delays={"http://a": 0.1}, down=["http://a", "http://b"])
+        masternodes = self.masternodes(hosts, min_hedge_after=0.02, retries=0)
+
+        with self.assertRaises(httpx.ConnectError):
+            self.runAsync(masternodes, masternodes.hedged_request("GET", "/tx"))
+        self.assertEqual(hosts.requests, ["http://a", "http://b"])
+
+    def testBothRequestsFailWithStatus(self):
+        hosts = FakeHosts(status={host: [503] for host in HOSTS}, delays={"http://a": 0.1})
+        masternodes = self.masternodes(hosts, min_hedge_after=0.02, retries=0)
+
+        with self.assertRaises(UpstreamError):
+            self.runAsync(masternodes, masternodes.get_json("/tx", hash="0x1"))
+
+    def testPinnedIsNotHedged(self):
+        hosts = FakeHosts(delays={"http://b": 0.1})
+        masternodes = self.masternodes(hosts, min_hedge_after=0.02)
+        pinned = masternodes.pinned("http://b")
+
+        data = self.runAsync(masternodes, pinned.get_json("/nonce/vk"))
+
+        self.assertEqual(data, {"host": "http://b"})
+        self.assertEqual(hosts.requests, ["http://b"])
+
+        # What the view learns about its host is shared
+        self.assertIs(pinned.stats, masternodes.stats)
+        self.assertIsNotNone(masternodes.stats["http://b"].latency)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+#tests/wrapped_tokens/test_merkle.py
+import unittest
+
+from tests.wrapped_tokens import OPERATOR_DIR  # noqa: F401
+
+from eth_account import Account
+from web3 import Web3
+
+from merkle import merkle_root, merkle_proof, merkle_tree, verify_proof, sign_root
+
+PRIVATE_KEY = "0x" + "4c" * 32
+ETH_TOKEN = "0xF08eF1668524a98893D97F16Ad134dA8cccefb03"
+ETH_ADDRESS = "0xEA674fdDe714fd979de3EdF0F56AA9716B898ec8"
+
+
+# The functions of ClearingHouse in eth/TwoWayBridge.sol that withdraw uses, line for line.
+# bytes32 values compare like unsigned integers, and abi.encodePacked of two bytes32 as
+# well as abi.encode of addresses and uint256 are the 32 byte words one after the other.
+
+def encode(token, amount, nonce, sender):
+    return (bytes.fromhex(token[2:]).rjust(32, b"\0") + amount.to_bytes(32, "big")
+        + nonce.to_bytes(32, "big") + bytes.fromhex(sender[2:]).rjust(32, b"\0"))
+
+
+def keccak256(data):
+    return bytes(Web3.keccak(data))
+
+
+def hashEthMsg(message_hash):
+    return keccak256(b"\x19Ethereum Signed Message:\n32" + message_hash)
+
+
+def computeRoot(leaf, proof):
+    computed = leaf
+
+    for sibling in proof:
+        if int.from_bytes(computed, "big") <= int.from_bytes(sibling, "big"):
+            computed = keccak256(computed + sibling)
+        else:
+            computed = keccak256(sibling + computed)
+
+    return computed
+
+
+def burnABI(nonce, amount=10 ** 18):
+    # What router.burn returns: the same words as encode, hex encoded
+    return encode(ETH_TOKEN, amount, nonce, ETH_ADDRESS).hex()
+
+
+class TestMerkle(unittest.TestCase):
+    def testLeafIsWithdrawHash(self):
+        abi = burnABI(3, amount=12345)
+        self.assertEqual(merkle_root([abi]), keccak256(encode(ETH_TOKEN, 12345, 3, ETH_ADDRESS)))
+
+    def testProofsMatchComputeRoot(self):
+        # Powers of two, and sizes that leave an odd node on one or more levels
+        for size in list(range(1, 18)) + [31, 32, 33, 100]:
+            abis = [burnABI(i) for i in range(1, size + 1)]
+            root = merkle_root(abis)
+
+            for i, abi in enumerate(abis):
+                with self.subTest(size=size, index=i):
+                    proof = merkle_proof(abis, i)
+                    leaf = keccak256(bytes.fromhex(abi))
+
+                    self.assertEqual(computeRoot(leaf, proof), root)
+                    self.assertTrue(verify_proof(abi, proof, root))
+
+    def testEmptyPath(self):
+        # A single burn is its own root, like a burn the JS operator signs on its own
+        abi = burnABI(1)
+        leaf = keccak256(bytes.fromhex(abi))
+
+        self.assertEqual(merkle_proof([abi], 0), [])
+        self.assertEqual(merkle_root([abi]), leaf)
+        self.assertEqual(computeRoot(leaf, []), leaf)
+
+    def testOddNodeIsCarriedUp(self):
+        abis = [burnABI(i) for i in range(1, 6)]
+        leaves = [keccak256(bytes.fromhex(abi)) for abi in abis]
+
+        # The fifth leaf has no sibling on the first two levels and meets the rest at the top
+        self.assertEqual(merkle_proof(abis, 4), [computeRoot(leaves[0], merkle_proof(abis[:4], 0))])
+        self.assertEqual(len(merkle_proof(abis, 0)), 3)
+
+    def testWrongProofFails(self):
+        abis = [burnABI(i) for i in range(1, 8)]
+        root = merkle_root(abis)
+        leaf = keccak256(bytes.fromhex(abis[2]))
+
+        self.assertNotEqual(computeRoot(leaf, merkle_proof(abis, 3)), root)
+        self.assertNotEqual(computeRoot(keccak256(bytes.fromhex(burnABI(8))), merkle_proof(abis, 2)), root)
+        self.assertNotEqual(computeRoot(leaf, merkle_proof(abis, 2)[:-1]), root)
+
+    def testMerkleTree(self):
+        abis = [burnABI(i) for i in range(1, 12)]
+        leaves, root, paths = merkle_tree(abis)
+
+        self.assertEqual(leaves, [keccak256(bytes.fromhex(abi)) for abi in abis])
+        self.assertEqual(root, merkle_root(abis))
+        self.assertEqual(paths, [merkle_proof(abis, i) for i in range(len(abis))])
+
+    def testEmptyEpoch(self):
+        with self.assertRaises(AssertionError):
+            merkle_root([])
+        with self.assertRaises(AssertionError):
+            merkle_proof([burnABI(1)], 1)
+
+    def testSignedRootRecovers(self):
+        abis = [burnABI(i) for i in range(1, 4)]
+        root = merkle_root(abis)
+        signed = sign_root(root, PRIVATE_KEY)
+
+        # withdraw recovers the owner from hashEthMsg(computeRoot(leaf, proof)) and v, r, s
+        hashed = hashEthMsg(computeRoot(keccak256(bytes.fromhex(abis[1])), merkle_proof(abis, 1)))
+        recovered = Account._recover_hash(hashed, vrs=(signed.v, signed.r, signed.s))
+        self.assertEqual(recovered, Account.from_key(PRIVATE_KEY).address)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+#tests/wrapped_tokens/test_metrics.py
+import asyncio
+import contextlib
+import io
+import unittest
+
+from tests.wrapped_tokens import OPERATOR_DIR  # noqa: F401
+
+from metrics import (CHAIN_HEAD, CHAIN_LAG, QUEUE_DEPTH, STAGE_SECONDS, ChainLag, observe_stage,
+    track_queues)
+from state import StateStore, ChainCheckpoint
+
+
+def sample(metric, name, **labels):
+    """Returns the value of a sample of one metric. Collecting the whole registry would
+    also read the queue depths of stores other tests closed.
+    """
+    for family in metric.collect():
+        for s in family.samples:
+            if s.name == name and s.labels == labels:
+                return s.value
+    return None
+
+
+class TestChainLag(unittest.TestCase):
+    def setUp(self):
+        self.store = StateStore(":memory:")
+        self.head = 120
+        self.caught_up = False
+
+    def tearDown(self):
+        self.store.close()
+
+    async def latestBlock(self):
+        return self.head
+
+    def chainLag(self, chain, checkpoint):
+        store_checkpoint = ChainCheckpoint(self.store, chain)
+        store_checkpoint.save(checkpoint)
+        return ChainLag(chain, self.latestBlock, store_checkpoint, caught_up=lambda: self.caught_up)
+
+    def testLag(self):
+        asyncio.run(self.chainLag("lag", 100).update())
+
+        self.assertEqual(sample(CHAIN_HEAD, "operator_chain_head_block", chain="lag"), 120)
+        self.assertEqual(sample(CHAIN_LAG, "operator_chain_lag_blocks", chain="lag"), 20)
+
+    def testCheckpointAhead(self):
+        # The checkpoint can be ahead of a lagging node
+        asyncio.run(self.chainLag("ahead", 130).update())
+        self.assertEqual(sample(CHAIN_LAG, "operator_chain_lag_blocks", chain="ahead"), 0)
+
+    def testCaughtUp(self):
+        chain_lag = self.chainLag("caught_up", 100)
+
+        # While subscribed, the checkpoint only moves with events
+        self.caught_up = True
+        asyncio.run(chain_lag.update())
+        self.assertEqual(sample(CHAIN_LAG, "operator_chain_lag_blocks", chain="caught_up"), 0)
+
+        self.caught_up = False
+        asyncio.run(chain_lag.update())
+        self.assertEqual(sample(CHAIN_LAG, "operator_chain_lag_blocks", chain="caught_up"), 20)
+
+    def testServeSurvivesErrors(self):
+        failures = [1]
+
+        async def latestBlock():
+            if failures[0] > 0:
+                failures[0] -= 1
+                raise ConnectionError("request timed out")
+            return 150
+
+        checkpoint = ChainCheckpoint(self.store, "serve")
+        checkpoint.save(140)
+        chain_lag = ChainLag("serve", latestBlock, checkpoint, interval=0.01)
+
+        async def serve():
+            task = asyncio.ensure_future(chain_lag.serve())
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            asyncio.run(serve())
+
+        self.assertIn("Could not get the latest serve block", output.getvalue())
+        self.assertEqual(sample(CHAIN_LAG, "operator_chain_lag_blocks", chain="serve"), 10)
+
+
+class TestMetrics(unittest.TestCase):
+    def testQueueDepths(self):
+        store = StateStore(":memory:")
+        self.addCleanup(store.close)
+        track_queues(store)
+
+        store.add_pending_mint("tx1:0", "0x" + "1" * 40, "0x10", "user")
+        store.add_pending_mint("tx1:1", "0x" + "1" * 40, "0x10", "user")
+        store.fail_pending_mint("tx1:1", "AssertionError('Invalid Ethereum Token!')")
+
+        # Read when scraped
+        self.assertEqual(sample(QUEUE_DEPTH, "operator_queue_depth", queue="pending_mints"), 1)
+        self.assertEqual(sample(QUEUE_DEPTH, "operator_queue_depth", queue="failed_mints"), 1)
+        self.assertEqual(sample(QUEUE_DEPTH, "operator_queue_depth", queue="unposted_roots"), 0)
+
+    def testStageNeverNegative(self):
+        before = sample(STAGE_SECONDS, "operator_stage_seconds_sum", stage="test") or 0
+
+        observe_stage("test", -3)
+        observe_stage("test", 2)
+
+        self.assertEqual(sample(STAGE_SECONDS, "operator_stage_seconds_sum", stage="test") - before, 2)
+        self.assertEqual(sample(STAGE_SECONDS, "operator_stage_seconds_bucket", stage="test", le="0.1"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
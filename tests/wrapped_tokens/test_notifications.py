@@ -0,0 +1,106 @@
+#tests/wrapped_tokens/test_notifications.py
+import unittest
+
+from tests.wrapped_tokens import OPERATOR_DIR  # noqa: F401
+
+from web3 import Web3
+
+from notifications import ProofNotifier
+
+ETH_TOKEN = "0xF08eF1668524a98893D97F16Ad134dA8cccefb03"
+ETH_ADDRESS = "0xEA674fdDe714fd979de3EdF0F56AA9716B898ec8"
+
+
+def burnABI(nonce, address=ETH_ADDRESS):
+    return (f"{ETH_TOKEN[2:]:0>64}" + f"{10 ** 18:064x}" + f"{nonce:064x}" + f"{address[2:]:0>64}").lower()
+
+
+def signature(abi):
+    return {"abi": abi, "hash": Web3.toHex(Web3.keccak(hexstr=abi))}
+
+
+class FakeProofs:
+    """Stands in for the lookup.ProofIndex, with a proof for every burn in signed.
+    """
+    def __init__(self, signed=()):
+        self.signed = {signature(abi)["hash"]: {"abi": abi} for abi in signed}
+        self.lookups = []
+
+    def by_hash(self, abi_hash):
+        self.lookups.append(abi_hash)
+        return self.signed.get(abi_hash)
+
+
+class TestProofNotifier(unittest.TestCase):
+    def setUp(self):
+        self.abis = [burnABI(i) for i in range(1, 4)]
+        self.proofs = FakeProofs(self.abis)
+
+    def drain(self, queue):
+        proofs = []
+        while not queue.empty():
+            proofs.append(queue.get_nowait()["abi"])
+        return proofs
+
+    def testPublishByHashAndAddress(self):
+        notifier = ProofNotifier(self.proofs)
+        by_hash = notifier.subscribe([signature(self.abis[1])["hash"]])
+        by_address = notifier.subscribe([ETH_ADDRESS.lower()])
+
+        # Subscribed to both, but told once
+        both = notifier.subscribe([signature(self.abis[1])["hash"], ETH_ADDRESS.lower()])
+
+        notifier.publish([signature(abi) for abi in self.abis])
+
+        self.assertEqual(self.drain(by_hash), self.abis[1:2])
+        self.assertEqual(self.drain(by_address), self.abis)
+        self.assertEqual(self.drain(both), self.abis)
+
+    def testOnlyLookUpSubscribedBurns(self):
+        notifier = ProofNotifier(self.proofs)
+        queue = notifier.subscribe([signature(self.abis[0])["hash"]])
+
+        other = burnABI(1, address="0x" + "3" * 40)
+        notifier.publish([signature(other), signature(self.abis[0])])
+
+        self.assertEqual(self.proofs.lookups, [signature(self.abis[0])["hash"]])
+        self.assertEqual(self.drain(queue), self.abis[:1])
+
+    def testUnsignedBurnIsNotSent(self):
+        notifier = ProofNotifier(FakeProofs())
+        queue = notifier.subscribe([ETH_ADDRESS.lower()])
+
+        notifier.publish([signature(self.abis[0])])
+
+        self.assertTrue(queue.empty())
+
+    def testOverflowDropsOldest(self):
+        notifier = ProofNotifier(self.proofs, max_queue=2)
+        queue = notifier.subscribe([ETH_ADDRESS.lower()])
+
+        notifier.publish([signature(abi) for abi in self.abis])
+
+        # The client can still get the dropped one from /lookup
+        self.assertEqual(self.drain(queue), self.abis[1:])
+
+    def testUnsubscribe(self):
+        notifier = ProofNotifier(self.proofs)
+        keys = [signature(self.abis[0])["hash"], ETH_ADDRESS.lower()]
+        queue = notifier.subscribe(keys)
+        other = notifier.subscribe(keys[1:])
+
+        notifier.unsubscribe(queue, keys)
+
+        # Keys nobody listens to any more are forgotten
+        self.assertEqual(notifier.subscribers, {ETH_ADDRESS.lower(): {other}})
+
+        notifier.publish([signature(self.abis[0])])
+        self.assertTrue(queue.empty())
+        self.assertEqual(self.drain(other), self.abis[:1])
+
+        notifier.unsubscribe(other, keys[1:])
+        self.assertEqual(notifier.subscribers, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+#tests/wrapped_tokens/test_sessions.py
+import asyncio
+import unittest
+
+from tests.wrapped_tokens import OPERATOR_DIR  # noqa: F401
+from tests.wrapped_tokens.fakes import HOSTS, FakeHosts
+
+import httpx
+
+from sessions import UpstreamError
+
+
+class TestUpstream(unittest.TestCase):
+    def runAsync(self, upstream, coroutine):
+        async def run():
+            try:
+                return await coroutine
+            finally:
+                await upstream.close()
+
+        return asyncio.run(run())
+
+    def testHostRotation(self):
+        hosts = FakeHosts()
+        upstream = hosts.upstream()
+
+        async def requests():
+            return [(await upstream.get_json("/latest_block_num"))["host"] for _ in range(4)]
+
+        self.assertEqual(self.runAsync(upstream, requests()), HOSTS + HOSTS[:1])
+
+    def testRetryOnNextHost(self):
+        hosts = FakeHosts(status={"http://a": [503, 200], "http://b": [429, 200]})
+        upstream = hosts.upstream()
+
+        response = self.runAsync(upstream, upstream.request("GET", "/"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(hosts.requests, HOSTS)
+
+    def testOtherStatusIsReturned(self):
+        hosts = FakeHosts(status={"http://a": [404]})
+        upstream = hosts.upstream()
+
+        response = self.runAsync(upstream, upstream.request("GET", "/contracts/con_router/sequence"))
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(hosts.requests, ["http://a"])
+
+    def testRaiseAfterRetries(self):
+        hosts = FakeHosts(status={host: [502] for host in HOSTS})
+        upstream = hosts.upstream(retries=4)
+
+        with self.assertRaisesRegex(UpstreamError, "returned 502"):
+            self.runAsync(upstream, upstream.request("GET", "/"))
+        self.assertEqual(hosts.requests, HOSTS + HOSTS[:2])
+
+    def testRaiseTransportError(self):
+        hosts = FakeHosts(down=HOSTS)
+        upstream = hosts.upstream(retries=1)
+
+        with self.assertRaises(httpx.ConnectError):
+            self.runAsync(upstream, upstream.request("GET", "/"))
+        self.assertEqual(hosts.requests, HOSTS[:2])
+
+    def testRecoverFromTransportError(self):
+        hosts = FakeHosts(down=["http://a"])
+        upstream = hosts.upstream()
+
+        response = self.runAsync(upstream, upstream.request("GET", "/"))
+        self.assertEqual(response.json(), {"host": "http://b"})
+
+    def testPerHostLimit(self):
+        hosts = FakeHosts(delays={"http://a": 0.01})
+        upstream = hosts.upstream(hosts=HOSTS[:1], max_per_host=2)
+
+        async def requests():
+            return await asyncio.gather(*(upstream.request("GET", "/") for _ in range(6)))
+
+        self.runAsync(upstream, requests())
+
+        self.assertEqual(len(hosts.requests), 6)
+        self.assertEqual(hosts.max_running["http://a"], 2)
+
+    def testPinned(self):
+        hosts = FakeHosts(status={"http://b": [503, 200]})
+        upstream = hosts.upstream(max_per_host=1)
+        pinned = upstream.pinned("http://b/")
+
+        # Retries stay on the host, over the same connections and limits
+        async def requests():
+            return [(await pinned.get_json("/nonce/vk"))["host"] for _ in range(2)]
+
+        self.assertEqual(self.runAsync(upstream, requests()), ["http://b"] * 2)
+        self.assertEqual(hosts.requests, ["http://b"] * 3)
+        self.assertIs(pinned.client, upstream.client)
+        self.assertIs(pinned.host_limits, upstream.host_limits)
+        self.assertEqual(upstream.hosts, HOSTS)
+
+        self.assertEqual(upstream.pinned().hosts, ["http://a"])
+        with self.assertRaises(AssertionError):
+            upstream.pinned("http://d")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,232 @@
+#tests/wrapped_tokens/test_signer.py
+import asyncio
+import contextlib
+import io
+import multiprocessing
+import unittest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from tests.wrapped_tokens import OPERATOR_DIR  # noqa: F401
+from tests.wrapped_tokens.fakes import FakeRouter
+
+from eth_account import Account
+from eth_account.messages import encode_defunct
+from web3 import Web3
+
+from merkle import verify_proof
+from signer import BurnSigner, SignatureMismatch
+from state import StateStore
+
+PRIVATE_KEY = "0x" + "4c" * 32
+ETH_TOKEN = "0xF08eF1668524a98893D97F16Ad134dA8cccefb03"
+ETH_ADDRESS = "0xEA674fdDe714fd979de3EdF0F56AA9716B898ec8"
+
+
+def burnABI(nonce):
+    return (f"{ETH_TOKEN[2:]:0>64}" + f"{10 ** 18:064x}" + f"{nonce:064x}" + f"{ETH_ADDRESS[2:]:0>64}").lower()
+
+
+class TestBurnSigner(unittest.TestCase):
+    def setUp(self):
+        self.store = StateStore(":memory:")
+        self.router = FakeRouter()
+        self.signed = []
+
+        self.signer = BurnSigner(self.store, PRIVATE_KEY, self.router, batch_size=3, max_latency=60,
+            poll_interval=0.01, on_signed=self.signed.extend, pool=ThreadPoolExecutor(max_workers=1))
+
+    def tearDown(self):
+        self.signer.stop()
+        self.store.close()
+
+    def burn(self, nonce, scanned=True):
+        """Burns on the router and records the burn like the LamdenScanner, if scanned.
+        """
+        abi = burnABI(nonce)
+        sequence = self.router.burn(abi)
+        if scanned:
+            self.store.add_burn(abi, f"tx{nonce}", sequence)
+        return abi
+
+    def runAsync(self, coroutine):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return asyncio.run(coroutine)
+
+    def assertSignedProof(self, abi):
+        proof = self.store.find_proof(abi_hash=Web3.toHex(Web3.keccak(hexstr=abi)))
+        self.assertIsNotNone(proof)
+
+        root = Web3.toBytes(hexstr=self.store.unposted_epochs()[-1][3])
+        self.assertTrue(verify_proof(abi, [bytes(Web3.toBytes(hexstr=h)) for h in proof["proof"]], bytes(root)))
+        self.assertEqual(Account.recover_message(encode_defunct(primitive=root), signature=proof["signed_abi"]),
+            self.signer.address)
+
+    def testSealWhenBatchIsFull(self):
+        abis = [self.burn(i) for i in range(1, 3)]
+        self.assertFalse(self.signer.seal_due())
+
+        abis.append(self.burn(3))
+        self.assertTrue(self.signer.seal_due())
+
+    def testSealAfterMaxLatency(self):
+        self.burn(1)
+        self.signer.max_latency = 0
+        self.assertTrue(self.signer.seal_due())
+
+    def testSealAndSign(self):
+        abis = [self.burn(i) for i in range(1, 4)]
+
+        async def steps():
+            await self.signer.seal()
+            await self.signer.sync_epochs()
+            self.assertEqual(self.store.unsigned_epochs(), [(0, 1, 3)])
+            self.assertTrue(await self.signer.sign(0, 1, 3))
+
+        self.runAsync(steps())
+
+        self.assertEqual([function for function, _, _ in self.router.sent], ["seal_epoch"])
+        self.assertEqual(self.store.unsigned_epochs(), [])
+        self.assertEqual(self.store.count_unposted_epochs(), 1)
+
+        # One signature covers all burns of the epoch
+        self.assertEqual(len({self.store.find_proof(ethereum_address=ETH_ADDRESS, nonce=i)["signed_abi"]
+            for i in range(1, 4)}), 1)
+        for abi in abis:
+            self.assertSignedProof(abi)
+
+        self.assertEqual([s["abi"] for s in self.signed], abis)
+        self.assertEqual([s["hash"] for s in self.signed], [Web3.toHex(Web3.keccak(hexstr=abi)) for abi in abis])
+
+    @unittest.skipIf(multiprocessing.current_process().daemon, "Daemonic processes cannot start a pool")
+    def testSignOnProcessPool(self):
+        self.signer.pool.shutdown()
+        self.signer.pool = ProcessPoolExecutor(max_workers=1)
+
+        abi = self.burn(1)
+
+        async def steps():
+            await self.signer.seal()
+            await self.signer.sync_epochs()
+            self.assertTrue(await self.signer.sign(0, 1, 1))
+
+        self.runAsync(steps())
+        self.assertSignedProof(abi)
+
+    def testWaitForUnscannedBurns(self):
+        self.burn(1)
+        missing = self.burn(2, scanned=False)
+
+        async def steps():
+            await self.signer.seal()
+            await self.signer.sync_epochs()
+            self.assertFalse(await self.signer.sign(0, 1, 2))
+
+            self.store.add_burn(missing, "tx2", 2)
+            self.assertTrue(await self.signer.sign(0, 1, 2))
+
+        self.runAsync(steps())
+        self.assertSignedProof(missing)
+
+    def testBurnsWithoutSequence(self):
+        # Their blocks did not list the state changes of the burns
+        abis = [self.burn(i, scanned=False) for i in range(1, 4)]
+        for i, abi in enumerate(abis, 1):
+            self.store.add_burn(abi, f"tx{i}")
+        missing = self.burn(4, scanned=False)
+
+        self.assertEqual(self.store.count_unsequenced_burns(), 3)
+        self.assertTrue(self.signer.seal_due())
+
+        reads = []
+        get_variable = self.router.get_variable
+
+        async def read(variable, key=None):
+            reads.append((variable, key))
+            return await get_variable(variable, key)
+
+        self.router.get_variable = read
+
+        async def steps():
+            await self.signer.seal()
+            await self.signer.sync_epochs()
+
+            # Burn 4 is not scanned yet, the epoch waits for it
+            self.assertFalse(await self.signer.sign(0, 1, 4))
+            self.assertEqual(self.store.count_unsequenced_burns(), 0)
+            self.assertFalse(await self.signer.sign(0, 1, 4))
+
+            self.store.add_burn(missing, "tx4", 4)
+            self.assertTrue(await self.signer.sign(0, 1, 4))
+
+        self.runAsync(steps())
+
+        # The queue is read once per missing sequence number
+        self.assertEqual(sorted(key for variable, key in reads if variable == "queue"), [1, 2, 3, 4])
+        for abi in abis + [missing]:
+            self.assertSignedProof(abi)
+        self.assertEqual(self.signer.queued, {})
+
+    def testSyncEpochsSealedBeforeRestart(self):
+        for i in range(1, 6):
+            self.burn(i)
+            if i in (2, 3):
+                self.router.seal_epoch()
+
+        self.runAsync(self.signer.sync_epochs())
+
+        self.assertEqual(self.store.unsigned_epochs(), [(0, 1, 2), (1, 3, 3)])
+        self.assertEqual([burn[3] for burn in self.store.unsealed_burns()], [4, 5])
+
+    def testSealWithLostResult(self):
+        for i in range(1, 4):
+            self.burn(i)
+        self.router.lost_results["seal_epoch"] = 1
+
+        async def steps():
+            with self.assertRaises(TimeoutError):
+                await self.signer.seal()
+
+            # The epoch was sealed anyway and is found by the next sync
+            self.assertFalse(self.signer.synced)
+            await self.signer.sync_epochs()
+
+        self.runAsync(steps())
+        self.assertEqual(self.store.unsigned_epochs(), [(0, 1, 3)])
+
+    def testSignatureMismatch(self):
+        for i in range(1, 4):
+            self.burn(i)
+        self.signer.address = "0x" + "0" * 40
+
+        async def steps():
+            await self.signer.seal()
+            await self.signer.sync_epochs()
+            with self.assertRaises(SignatureMismatch):
+                await self.signer.sign(0, 1, 3)
+
+        self.runAsync(steps())
+        self.assertEqual(self.store.count_unposted_epochs(), 0)
+        self.assertEqual(self.store.count_unsigned_burns(), 3)
+
+    def testServe(self):
+        abis = [self.burn(i) for i in range(1, 8)]
+
+        async def serve():
+            task = asyncio.ensure_future(self.signer.serve())
+
+            while self.store.count_unsigned_burns() > 0:
+                await asyncio.sleep(0.01)
+
+            self.signer.stop()
+            await task
+
+        self.runAsync(serve())
+
+        # The epoch holds every burn queued when it was sealed, not just batch_size of them
+        self.assertEqual([function for function, _, _ in self.router.sent], ["seal_epoch"])
+        self.assertEqual([epoch[:3] for epoch in self.store.unposted_epochs()], [(0, 1, 7)])
+        self.assertEqual([s["abi"] for s in self.signed], abis)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+#tests/wrapped_tokens/test_stamps.py
+import math
+import unittest
+
+from tests.wrapped_tokens import OPERATOR_DIR  # noqa: F401
+
+from drivers import MemoryContractDriver, MemoryDriver
+from stamps import StampEstimator
+
+FUNCTIONS = ["mint", "mint_batch", "burn", "post_proof", "post_proofs", "seal_epoch", "post_root"]
+
+
+class TestStampEstimator(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open("lamden/router.py") as f, open("lamden/token.py") as g:
+            cls.estimator = StampEstimator("con_router", f.read(), g.read(), operator="a" * 64)
+
+    def state(self):
+        return {k: self.estimator.driver.driver.db[k] for k in self.estimator.driver.driver.keys()}
+
+    def testMemoryDriverByDefault(self):
+        self.assertIsInstance(self.estimator.driver, MemoryContractDriver)
+        self.assertIsInstance(self.estimator.driver.driver, MemoryDriver)
+
+    def testEstimate(self):
+        for function in FUNCTIONS:
+            with self.subTest(function=function):
+                used = self.estimator.dry_run(function)
+                self.assertGreater(used, 0)
+                self.assertEqual(self.estimator.estimate(function), math.ceil(used * 1.25) + 5)
+
+    def testBatchesCostMore(self):
+        for function in ["mint_batch", "post_proofs"]:
+            with self.subTest(function=function):
+                self.assertLess(self.estimator.estimate(function, 1), self.estimator.estimate(function, 20))
+
+    def testDryRunsKeepNoState(self):
+        state = self.state()
+
+        for function in FUNCTIONS:
+            self.estimator.dry_run(function, 5 if function in ("mint_batch", "post_proofs") else 1)
+
+        self.assertEqual(self.state(), state)
+        self.assertEqual(self.estimator.driver.pending_writes, {})
+
+    def testEstimatesAreCached(self):
+        self.estimator.cache.clear()
+        first = self.estimator.estimate("burn")
+        self.estimator.dry_run = None
+
+        try:
+            self.assertEqual(self.estimator.estimate("burn"), first)
+        finally:
+            del self.estimator.dry_run
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,262 @@
+#tests/wrapped_tokens/test_state.py
+import os
+import tempfile
+import unittest
+
+from tests.wrapped_tokens import OPERATOR_DIR  # noqa: F401
+
+from hexbytes import HexBytes
+from web3 import Web3
+
+from state import StateStore, ChainCheckpoint, event_id, parse_abi
+
+ETH_TOKEN = "0xF08eF1668524a98893D97F16Ad134dA8cccefb03"
+ETH_ADDRESS = "0xEA674fdDe714fd979de3EdF0F56AA9716B898ec8"
+ROOT = "0x" + "ab" * 32
+SIGNED_ROOT = "0x" + "1" * 130
+
+
+def burnABI(nonce, amount=10 ** 18, address=ETH_ADDRESS, token=ETH_TOKEN):
+    return (f"{token[2:]:0>64}" + f"{amount:064x}" + f"{nonce:064x}" + f"{address[2:]:0>64}").lower()
+
+
+def abiHash(abi):
+    return Web3.toHex(Web3.keccak(hexstr=abi))
+
+
+class TestStateStore(unittest.TestCase):
+    def setUp(self):
+        self.store = StateStore(":memory:")
+
+    def tearDown(self):
+        self.store.close()
+
+    def testBatchCommitsTogether(self):
+        with self.store.batch():
+            self.store.set_checkpoint("ethereum", 10)
+            self.store.add_pending_mint("tx1:0", ETH_TOKEN, "0x10", "user")
+
+        self.assertEqual(self.store.get_checkpoint("ethereum"), 10)
+        self.assertEqual(self.store.count_pending_mints(), 1)
+
+    def testNestedBatchRollback(self):
+        self.store.set_checkpoint("ethereum", 5)
+
+        with self.assertRaises(ValueError):
+            with self.store.batch():
+                self.store.set_checkpoint("ethereum", 10)
+
+                # Inner batches do not commit on their own
+                with self.store.batch():
+                    self.store.add_pending_mint("tx1:0", ETH_TOKEN, "0x10", "user")
+                self.store.add_burn(burnABI(1))
+
+                raise ValueError("Handler failed")
+
+        self.assertEqual(self.store.get_checkpoint("ethereum"), 5)
+        self.assertEqual(self.store.count_pending_mints(), 0)
+        self.assertFalse(self.store.is_processed("tx1:0"))
+        self.assertEqual(self.store.count_unsigned_burns(), 0)
+
+        # The store can be used normally again
+        self.assertTrue(self.store.add_pending_mint("tx1:0", ETH_TOKEN, "0x10", "user"))
+        self.assertEqual(self.store.count_pending_mints(), 1)
+
+    def testInnerBatchFailureRollsBackOuter(self):
+        with self.assertRaises(ValueError):
+            with self.store.batch():
+                self.store.set_checkpoint("lamden", 3)
+                with self.store.batch():
+                    raise ValueError("Handler failed")
+
+        self.assertIsNone(self.store.get_checkpoint("lamden"))
+        self.assertEqual(self.store.depth, 0)
+
+    def testAddPendingMintOnce(self):
+        self.assertTrue(self.store.add_pending_mint("tx1:0", ETH_TOKEN, "0x10", "user"))
+        self.assertTrue(self.store.add_pending_mint("tx1:1", ETH_TOKEN, "0x20", "user"))
+        self.assertFalse(self.store.add_pending_mint("tx1:0", ETH_TOKEN, "0x10", "user"))
+
+        mints = self.store.pending_mints()
+        self.assertEqual([mint[:4] for mint in mints],
+            [("tx1:0", ETH_TOKEN, "0x10", "user"), ("tx1:1", ETH_TOKEN, "0x20", "user")])
+
+        # Once minted, the event is still known, so a backfill over it does not mint it again
+        self.store.remove_pending_mints(["tx1:0"])
+        self.assertFalse(self.store.add_pending_mint("tx1:0", ETH_TOKEN, "0x10", "user"))
+        self.assertEqual([mint[0] for mint in self.store.pending_mints()], ["tx1:1"])
+
+    def testPendingMintsLimit(self):
+        for i in range(5):
+            self.store.add_pending_mint(f"tx{i}:0", ETH_TOKEN, "0x10", "user")
+
+        self.assertEqual([mint[0] for mint in self.store.pending_mints(2)], ["tx0:0", "tx1:0"])
+        self.assertEqual(self.store.count_pending_mints(), 5)
+
+    def testFailPendingMint(self):
+        self.store.add_pending_mint("tx1:0", ETH_TOKEN, "0x10", "user")
+        self.store.add_pending_mint("tx1:1", ETH_TOKEN, "0x20", "user")
+
+        self.store.fail_pending_mint("tx1:0", "AssertionError('Invalid Ethereum Token!')")
+
+        self.assertEqual([mint[0] for mint in self.store.pending_mints()], ["tx1:1"])
+        self.assertEqual(self.store.failed_mints(),
+            [("tx1:0", ETH_TOKEN, "0x10", "user", "AssertionError('Invalid Ethereum Token!')")])
+        self.assertEqual(self.store.count_failed_mints(), 1)
+
+        # It is still known, so a backfill over it does not queue it again
+        self.assertFalse(self.store.add_pending_mint("tx1:0", ETH_TOKEN, "0x10", "user"))
+
+    def testAddBurnOnce(self):
+        abi = burnABI(1)
+
+        self.assertTrue(self.store.add_burn(abi, "lamden_tx", 1))
+        self.assertFalse(self.store.add_burn(abi, "other_tx", 2))
+
+        self.assertEqual(self.store.count_unsigned_burns(), 1)
+        self.assertEqual([(burn[0], burn[2], burn[3]) for burn in self.store.unsealed_burns()],
+            [(abi, "lamden_tx", 1)])
+
+    def testBurnsWithoutSequence(self):
+        self.store.add_burn(burnABI(1), "tx1", 1)
+        self.store.add_burn(burnABI(2), "tx2")
+        self.store.add_epoch(0, 1, 2)
+
+        # As far as the store knows, the burn is not sealed
+        self.assertEqual(self.store.count_unsequenced_burns(), 1)
+        self.assertEqual([burn[0] for burn in self.store.unsealed_burns()], [burnABI(2)])
+        self.assertEqual(len(self.store.epoch_burns(1, 2)), 1)
+
+        # Burns that have a sequence number keep it
+        self.assertEqual(self.store.set_burn_sequences([(burnABI(2), 2), (burnABI(1), 5)]), 1)
+
+        self.assertEqual(self.store.count_unsequenced_burns(), 0)
+        self.assertEqual(self.store.count_unsealed_burns(), 0)
+        self.assertEqual([burn[3] for burn in self.store.epoch_burns(1, 2)], [1, 2])
+
+    def testParseABI(self):
+        self.assertEqual(parse_abi(burnABI(7, amount=12345)), {
+            "token": ETH_TOKEN.lower(),
+            "amount": "12345",
+            "nonce": 7,
+            "ethereum_address": ETH_ADDRESS.lower(),
+        })
+
+    def testEventId(self):
+        # The way server/eth.js builds it from a web3 event
+        tx_hash = "0x" + "ab" * 32
+        self.assertEqual(event_id({"transactionHash": HexBytes(tx_hash), "logIndex": 3}), f"{tx_hash}:3")
+
+    def testFindProofOnlyWhenSigned(self):
+        abi = burnABI(1)
+        self.store.add_burn(abi)
+
+        self.assertIsNone(self.store.find_proof(abi_hash=abiHash(abi)))
+        self.assertIsNone(self.store.find_proof(ethereum_address=ETH_ADDRESS, nonce=1))
+
+    def testFindProof(self):
+        abis = [burnABI(1), burnABI(2), burnABI(1, address="0x" + "3" * 40)]
+        for sequence, abi in enumerate(abis, 1):
+            self.store.add_burn(abi, sequence=sequence)
+        self.store.add_epoch(0, 1, 3)
+        self.store.set_epoch_signature(0, ROOT, SIGNED_ROOT,
+            [(abi, [f"0x{i:064x}"]) for i, abi in enumerate(abis)])
+
+        by_hash = self.store.find_proof(abi_hash=abiHash(abis[1]).upper().replace("0X", "0x"))
+        self.assertEqual(by_hash["abi"], abis[1])
+        self.assertEqual(by_hash["signed_abi"], SIGNED_ROOT)
+        self.assertEqual(by_hash["proof"], [f"0x{1:064x}"])
+        self.assertEqual(by_hash["nonce"], 2)
+        self.assertEqual(by_hash["posted"], 0)
+
+        # Addresses are matched case insensitively
+        by_nonce = self.store.find_proof(ethereum_address=ETH_ADDRESS, nonce=1)
+        self.assertEqual(by_nonce["abi"], abis[0])
+        self.assertEqual(self.store.find_proof(ethereum_address="0x" + "3" * 40, nonce=1)["abi"], abis[2])
+
+        self.assertIsNone(self.store.find_proof(ethereum_address=ETH_ADDRESS, nonce=3))
+        self.assertIsNone(self.store.find_proof(abi_hash="0x" + "0" * 64))
+
+    def testFindProofUsesIndexes(self):
+        queries = [
+            ("hash = ?", ("0x",), "proofs_hash"),
+            ("ethereum_address = ? AND nonce = ?", ("0x", 1), "proofs_address_nonce"),
+        ]
+
+        for where, args, index in queries:
+            with self.subTest(index=index):
+                plan = self.store.db.execute(f"EXPLAIN QUERY PLAN SELECT abi FROM proofs WHERE {where}", args).fetchall()
+                self.assertIn(index, " ".join(str(row[-1]) for row in plan))
+
+    def testEpochs(self):
+        abis = [burnABI(i) for i in range(1, 6)]
+
+        # Burn 4 was not scanned yet
+        for sequence, abi in enumerate(abis, 1):
+            if sequence != 4:
+                self.store.add_burn(abi, sequence=sequence)
+
+        self.assertEqual(self.store.next_epoch(), 0)
+        self.assertEqual(self.store.count_unsealed_burns(), 4)
+
+        self.store.add_epoch(0, 1, 2)
+        self.store.add_epoch(1, 3, 4)
+        self.assertEqual(self.store.next_epoch(), 2)
+        self.assertEqual(self.store.last_sealed_sequence(), 4)
+        self.assertEqual([burn[0] for burn in self.store.unsealed_burns()], abis[4:])
+        self.assertEqual(self.store.unsigned_epochs(), [(0, 1, 2), (1, 3, 4)])
+        self.assertEqual([burn[0] for burn in self.store.epoch_burns(3, 4)], abis[2:3])
+
+        self.store.set_epoch_signature(0, ROOT, SIGNED_ROOT, [(abis[0], ["0x01"]), (abis[1], ["0x02"])])
+        self.assertEqual(self.store.unsigned_epochs(), [(1, 3, 4)])
+        self.assertEqual(self.store.count_unsigned_burns(), 2)
+        self.assertEqual([epoch[:5] for epoch in self.store.unposted_epochs()], [(0, 1, 2, ROOT, SIGNED_ROOT)])
+
+        self.store.mark_epochs_posted([0])
+        self.assertEqual(self.store.count_unposted_epochs(), 0)
+        self.assertEqual(self.store.find_proof(abi_hash=abiHash(abis[1]))["posted"], 1)
+        self.assertEqual(self.store.find_proof(abi_hash=abiHash(abis[1]))["proof"], ["0x02"])
+
+        # Recording an epoch again changes nothing
+        self.store.add_epoch(0, 1, 5)
+        self.assertEqual(self.store.last_sealed_sequence(), 4)
+
+
+class TestChainCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.store = StateStore(":memory:")
+
+    def tearDown(self):
+        self.store.close()
+
+    def testStartBlock(self):
+        checkpoint = ChainCheckpoint(self.store, "lamden", start_block=100)
+        self.assertEqual(checkpoint.load(), 99)
+
+        checkpoint.save(150)
+        self.assertEqual(checkpoint.load(), 150)
+        self.assertEqual(ChainCheckpoint(self.store, "ethereum").load(), -1)
+
+
+class TestRestart(unittest.TestCase):
+    def testStatePersists(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "state.db")
+
+            store = StateStore(path)
+            self.assertEqual(store.db.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+            store.set_checkpoint("ethereum", 42)
+            store.add_pending_mint("tx1:0", ETH_TOKEN, "0x10", "user")
+            store.add_burn(burnABI(1))
+            store.close()
+
+            store = StateStore(path)
+            self.assertEqual(store.get_checkpoint("ethereum"), 42)
+            self.assertEqual(store.count_pending_mints(), 1)
+            self.assertFalse(store.add_pending_mint("tx1:0", ETH_TOKEN, "0x10", "user"))
+            self.assertFalse(store.add_burn(burnABI(1)))
+            store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
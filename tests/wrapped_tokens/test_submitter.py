@@ -0,0 +1,189 @@
+#tests/wrapped_tokens/test_submitter.py
+import asyncio
+import json
+import unittest
+
+from tests.wrapped_tokens import OPERATOR_DIR  # noqa: F401
+
+from lamden.crypto.wallet import Wallet
+
+from submitter import Submitter, TransactionFailed
+
+
+class FakeResponse:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class FakeMasternode:
+    """Stands in for the sessions.Upstream of a masternode. Every transaction it accepts
+    takes the next nonce and is processed right away, but its result only shows up on /tx
+    after lag polls. The next dropped transactions it accepts are lost without using their
+    nonce. Transactions whose function is in failing do not succeed.
+    """
+    def __init__(self, lag=0, dropped=0, failing=()):
+        self.nonce = 0
+        self.lag = lag
+        self.dropped = dropped
+        self.failing = failing
+
+        self.posted = []
+        self.processed = []
+        self.results = {}
+        self.polls = {}
+
+    async def get_json(self, path, **params):
+        return {"nonce": self.nonce, "processor": "processor"}
+
+    async def post_json(self, path, content):
+        await asyncio.sleep(0)
+        payload = json.loads(content)["payload"]
+
+        # Masternodes only take the next nonce of a wallet
+        if payload["nonce"] != self.nonce:
+            return {"error": "Transaction nonce is invalid."}
+
+        tx_hash = f"{len(self.posted):064x}"
+        self.posted.append(payload)
+
+        if self.dropped > 0:
+            self.dropped -= 1
+            return {"success": "Transaction queued", "hash": tx_hash}
+
+        self.nonce += 1
+        self.processed.append(payload)
+
+        status = 1 if payload["function"] in self.failing else 0
+        result = "AssertionError('Only owner can call!')" if status else "None"
+        self.results[tx_hash] = {"hash": tx_hash, "status": status, "result": result}
+        return {"success": "Transaction queued", "hash": tx_hash}
+
+    async def hedged_request(self, method, path, params=None, **kwargs):
+        tx_hash = params["hash"]
+        self.polls[tx_hash] = self.polls.get(tx_hash, 0) + 1
+
+        if tx_hash in self.results and self.polls[tx_hash] > self.lag:
+            return FakeResponse(200, self.results[tx_hash])
+        return FakeResponse(200, {"error": "Transaction not found."})
+
+
+class TestSubmitter(unittest.TestCase):
+    def submitter(self, masternode, max_resubmits=3):
+        # At most 5 polls until a result counts as missing
+        return Submitter(masternode, Wallet(), "con_router", max_resubmits=max_resubmits,
+            result_timeout=0.045, poll_interval=0.01)
+
+    def send(self, submitter, function="mint"):
+        return asyncio.run(submitter.send(function, {"event_id": "0x1:0"}, 100))
+
+    def testSend(self):
+        masternode = FakeMasternode()
+        submitter = self.submitter(masternode)
+        posted = []
+
+        async def send():
+            first = await submitter.send("mint", {}, 100, on_posted=posted.append)
+            second = await submitter.send("mint", {}, 100, on_posted=posted.append)
+            return first, second
+
+        results = asyncio.run(send())
+
+        self.assertEqual([r["hash"] for r in results], posted)
+        self.assertEqual([p["nonce"] for p in masternode.processed], [0, 1])
+        self.assertEqual(submitter.nonce, 2)
+
+    def testConcurrentSends(self):
+        masternode = FakeMasternode(lag=2)
+        submitter = self.submitter(masternode)
+
+        async def send():
+            return await asyncio.gather(*(submitter.send("mint", {"i": i}, 100) for i in range(5)))
+
+        asyncio.run(send())
+
+        self.assertEqual(sorted(p["nonce"] for p in masternode.processed), list(range(5)))
+        self.assertEqual(len(masternode.posted), 5)
+
+    def testStaleNonceIsResynced(self):
+        masternode = FakeMasternode()
+        masternode.nonce = 7
+        submitter = self.submitter(masternode)
+        submitter.nonce, submitter.processor = 3, "processor"
+
+        self.send(submitter)
+
+        self.assertEqual([p["nonce"] for p in masternode.posted], [7])
+        self.assertEqual(submitter.nonce, 8)
+
+    def testLaggingResultIsNotResent(self):
+        # The result only shows up while it is waited for the second time
+        masternode = FakeMasternode(lag=7)
+        submitter = self.submitter(masternode)
+
+        result = self.send(submitter)
+
+        self.assertEqual(result["status"], 0)
+        self.assertEqual(len(masternode.posted), 1)
+        self.assertEqual(submitter.nonce, 1)
+
+    def testMissingResultIsNotResent(self):
+        masternode = FakeMasternode(lag=1000)
+        submitter = self.submitter(masternode)
+        posted = []
+
+        with self.assertRaisesRegex(TimeoutError, "nonce 0 was used"):
+            asyncio.run(submitter.send("mint", {}, 100, on_posted=posted.append))
+
+        # Sending it again could run it twice
+        self.assertEqual(len(masternode.posted), 1)
+        self.assertEqual(len(posted), 1)
+        self.assertEqual(submitter.nonce, 1)
+
+    def testDroppedIsResent(self):
+        masternode = FakeMasternode(dropped=2)
+        submitter = self.submitter(masternode)
+
+        result = self.send(submitter)
+
+        # The nonce stayed unused, so the transaction was not processed
+        self.assertEqual(result["status"], 0)
+        self.assertEqual([p["nonce"] for p in masternode.posted], [0, 0, 0])
+        self.assertEqual(len(masternode.processed), 1)
+
+    def testDroppedTooOften(self):
+        masternode = FakeMasternode(dropped=3)
+        submitter = self.submitter(masternode, max_resubmits=2)
+
+        with self.assertRaisesRegex(TimeoutError, "dropped 3 times"):
+            self.send(submitter)
+
+        self.assertEqual(len(masternode.posted), 3)
+        self.assertEqual(masternode.processed, [])
+
+    def testDroppedThenLagging(self):
+        masternode = FakeMasternode(lag=1000, dropped=1)
+        submitter = self.submitter(masternode)
+
+        with self.assertRaises(TimeoutError):
+            self.send(submitter)
+
+        # Resent once while the nonce was unused, never after it was used
+        self.assertEqual(len(masternode.posted), 2)
+        self.assertEqual(len(masternode.processed), 1)
+
+    def testFailedTransaction(self):
+        masternode = FakeMasternode(failing=("mint",))
+        submitter = self.submitter(masternode)
+
+        with self.assertRaisesRegex(TransactionFailed, "Only owner can call!"):
+            self.send(submitter)
+
+        self.assertEqual(len(masternode.posted), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,184 @@
+#tests/wrapped_tokens/test_tracing.py
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from tests.wrapped_tokens import OPERATOR_DIR  # noqa: F401
+
+import httpx
+
+from sessions import Upstream
+from tracing import CollectorExporter, FileExporter, Tracer, export_request, make_span, trace_id
+
+EVENT_ID = "0x" + "ab" * 32 + ":3"
+
+
+class FakeExporter:
+    def __init__(self, failures=0):
+        self.requests = []
+        self.failures = failures
+
+    async def export(self, request):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("Connection refused")
+        self.requests.append(request)
+
+    def spans(self):
+        return [[span["name"] for span in request["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+            for request in self.requests]
+
+
+class TestTracer(unittest.TestCase):
+    def serve(self, tracer, steps):
+        async def serve():
+            task = asyncio.ensure_future(tracer.serve())
+            try:
+                await steps()
+            finally:
+                tracer.stop()
+                await task
+
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            asyncio.run(serve())
+        return output.getvalue()
+
+    def testNothingBufferedWithoutExporter(self):
+        tracer = Tracer()
+        tracer.add(EVENT_ID, "event_seen", 1, 2)
+        self.assertEqual(tracer.spans, [])
+
+    def testFlushOnMaxBuffer(self):
+        exporter = FakeExporter()
+        tracer = Tracer(exporter, flush_interval=10, max_buffer=3)
+
+        async def steps():
+            for stage in ("event_seen", "mint_submitted"):
+                tracer.add(EVENT_ID, stage, 1, 2)
+            await asyncio.sleep(0.02)
+            self.assertEqual(exporter.requests, [])
+
+            tracer.add(EVENT_ID, "mint_confirmed", 2, 3)
+            await asyncio.sleep(0.02)
+            self.assertEqual(exporter.spans(), [["event_seen", "mint_submitted", "mint_confirmed"]])
+
+        self.serve(tracer, steps)
+        self.assertEqual(tracer.spans, [])
+
+    def testFlushOnInterval(self):
+        exporter = FakeExporter()
+        tracer = Tracer(exporter, flush_interval=0.02, max_buffer=100)
+
+        async def steps():
+            tracer.add(EVENT_ID, "event_seen", 1, 2)
+            await asyncio.sleep(0.06)
+            self.assertEqual(exporter.spans(), [["event_seen"]])
+
+            # Nothing is exported while no spans are waiting
+            await asyncio.sleep(0.06)
+            self.assertEqual(len(exporter.requests), 1)
+
+        self.serve(tracer, steps)
+
+    def testFlushOnStop(self):
+        exporter = FakeExporter()
+        tracer = Tracer(exporter, flush_interval=10)
+
+        async def steps():
+            await asyncio.sleep(0)
+            tracer.add(EVENT_ID, "event_seen", 1, 2)
+
+        # Stopping wakes the tracer, which writes what is still waiting
+        self.serve(tracer, steps)
+        self.assertEqual(exporter.spans(), [["event_seen"]])
+
+    def testExportFailureDropsSpans(self):
+        exporter = FakeExporter(failures=1)
+        tracer = Tracer(exporter, flush_interval=10, max_buffer=1)
+
+        async def steps():
+            tracer.add(EVENT_ID, "event_seen", 1, 2)
+            await asyncio.sleep(0.02)
+            tracer.add(EVENT_ID, "mint_submitted", 2, 3)
+            await asyncio.sleep(0.02)
+
+        output = self.serve(tracer, steps)
+
+        self.assertIn("Could not export 1 spans", output)
+        self.assertEqual(exporter.spans(), [["mint_submitted"]])
+
+
+class TestOTLP(unittest.TestCase):
+    def testSpan(self):
+        span = make_span(EVENT_ID, "mint_confirmed", 1.5, 1.25, batch_size=3, function="mint_batch",
+            lost=False, tx_hash=None)
+
+        # Every stage of a transfer is in the same trace
+        self.assertEqual(span["traceId"], hashlib.sha256(EVENT_ID.encode()).hexdigest()[:32])
+        self.assertEqual(span["traceId"], trace_id(EVENT_ID))
+        self.assertEqual(len(bytes.fromhex(span["spanId"])), 8)
+        self.assertEqual(span["name"], "mint_confirmed")
+        self.assertEqual(span["kind"], 1)
+
+        # Ends no earlier than it starts, in nanoseconds as strings
+        self.assertEqual((span["startTimeUnixNano"], span["endTimeUnixNano"]), ("1500000000", "1500000000"))
+
+        self.assertEqual(span["attributes"], [
+            {"key": "transfer.key", "value": {"stringValue": EVENT_ID}},
+            {"key": "batch_size", "value": {"intValue": "3"}},
+            {"key": "function", "value": {"stringValue": "mint_batch"}},
+            {"key": "lost", "value": {"boolValue": False}},
+        ])
+
+    def testExportRequest(self):
+        spans = [make_span(EVENT_ID, "event_seen", 1, 2)]
+        request = export_request(spans)
+
+        self.assertEqual(list(request), ["resourceSpans"])
+        resource_spans = request["resourceSpans"][0]
+        self.assertEqual(resource_spans["resource"]["attributes"],
+            [{"key": "service.name", "value": {"stringValue": "wrapped-tokens-operator"}}])
+        self.assertEqual(resource_spans["scopeSpans"], [{"scope": {"name": "tracing"}, "spans": spans}])
+
+        # Serializable as OTLP/JSON
+        self.assertEqual(json.loads(json.dumps(request)), request)
+
+    def testCollectorExporter(self):
+        posted = []
+
+        def handle(request):
+            posted.append((request.method, request.url.path, json.loads(request.content)))
+            return httpx.Response(200, json={})
+
+        upstream = Upstream(["http://collector:4318"], transport=httpx.MockTransport(handle))
+        request = export_request([make_span(EVENT_ID, "event_seen", 1, 2)])
+
+        async def export():
+            try:
+                await CollectorExporter(upstream).export(request)
+            finally:
+                await upstream.close()
+
+        asyncio.run(export())
+        self.assertEqual(posted, [("POST", "/v1/traces", request)])
+
+    def testFileExporter(self):
+        requests = [export_request([make_span(EVENT_ID, stage, 1, 2)]) for stage in ("event_seen", "mint_submitted")]
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "traces.jsonl")
+            exporter = FileExporter(path)
+            for request in requests:
+                asyncio.run(exporter.export(request))
+
+            with open(path) as f:
+                self.assertEqual([json.loads(line) for line in f], requests)
+
+
+if __name__ == "__main__":
+    unittest.main()